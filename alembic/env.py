@@ -1,3 +1,4 @@
+import logging
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -16,9 +17,14 @@ if config.config_file_name is not None:
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-from db.models import Base
+from db.models import Base, database_config
+from db.migration_helpers import is_dry_run
+from exceptions import MigrationDryRun
 target_metadata = Base.metadata
 
+# the database URL comes from the environment, like the application's
+config.set_main_option("sqlalchemy.url", database_config.url.replace("%", "%%"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -62,13 +68,26 @@ def run_migrations_online() -> None:
         poolclass=pool.NullPool,
     )
 
+    # Revisions using db.migration_helpers commit step by step, so every
+    # revision gets its own transaction; a dry run keeps them all in one
+    # and rolls it back.
+    dry_run = is_dry_run()
+
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=not dry_run
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+
+                if dry_run:
+                    raise MigrationDryRun
+        except MigrationDryRun:
+            logging.getLogger("alembic.online").info("Dry run: rolled back, nothing was changed")
 
 
 if context.is_offline_mode():
@@ -0,0 +1,45 @@
+"""Added the isbn13 column.
+
+Revision ID: 5b0e9c41d7a2
+Revises: 63ea671ecfc5
+Create Date: 2026-10-19 14:03:51.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.isbn import backfill_keys
+from db.migration_helpers import OnlineMigration
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0e9c41d7a2'
+down_revision: Union[str, None] = '63ea671ecfc5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled in batches of ids, before the constraint exists; the ISBNs are
+    # normalized in Python, the same way the application writes them. Text
+    # that is not a valid ISBN, and a second way of writing an ISBN already
+    # seen, keep a NULL isbn13.
+    taken = set()
+
+    with OnlineMigration() as migration:
+        migration.add_column('books', sa.Column('isbn13', sa.BigInteger(), nullable=True))
+        migration.backfill_rows(
+            'books',
+            ('isbn',),
+            lambda rows: [{"id": book_id, "isbn13": key} for book_id, key in backfill_keys(rows, taken)]
+        )
+        migration.add_unique_constraint('books_isbn13_key', 'books', ['isbn13'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('books_isbn13_key', 'books', type_='unique')
+    op.drop_column('books', 'isbn13')
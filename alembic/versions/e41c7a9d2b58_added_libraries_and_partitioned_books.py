@@ -0,0 +1,165 @@
+"""Added libraries and partitioned the books table by library.
+
+Revision ID: e41c7a9d2b58
+Revises: 5b0e9c41d7a2
+Create Date: 2026-10-19 17:26:08.431977
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.engine import DEFAULT_LIBRARY_ID, DEFAULT_LIBRARY_NAME
+from db.migration_helpers import OnlineMigration
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41c7a9d2b58'
+down_revision: Union[str, None] = '5b0e9c41d7a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# books is partitioned by HASH (library_id): a query of one library reads
+# one partition, and a new library needs no new table.
+LIBRARY_PARTITIONS = 16
+
+BOOK_COLUMNS = (
+    'id', 'title', 'author', 'genre', 'year', 'description', 'isbn', 'isbn13', 'is_read', 'added_on', 'updated_at'
+)
+
+# Rows written by a transaction that started this long before the copy, and
+# committed after, are copied again under the lock, as by the local replica.
+OVERLAP = "60 seconds"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('libraries',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.execute(
+        sa.text("INSERT INTO libraries (id, name) VALUES (:id, :name)")
+        .bindparams(id=DEFAULT_LIBRARY_ID, name=DEFAULT_LIBRARY_NAME)
+    )
+    op.execute("SELECT setval(pg_get_serial_sequence('libraries', 'id'), (SELECT max(id) FROM libraries))")
+
+    columns = ', '.join(BOOK_COLUMNS)
+    updates = ', '.join(f'{name} = excluded.{name}' for name in BOOK_COLUMNS if name != 'id')
+
+    # A partitioned table cannot be made from books in place: the books are
+    # copied to a new one in batches while the application keeps using
+    # books, then what changed meanwhile is copied again and the tables are
+    # swapped under a lock held until the revision commits. library_id has
+    # a default, so an app of the previous version keeps adding and deleting
+    # books of the main library during the deploy.
+    with OnlineMigration() as migration:
+        migration.add_column(
+            'tombstones',
+            sa.Column('library_id', sa.Integer(), server_default=str(DEFAULT_LIBRARY_ID), nullable=False)
+        )
+
+        migration.execute('create books_partitioned', f"""
+            CREATE TABLE books_partitioned (
+                LIKE books INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                library_id integer NOT NULL DEFAULT {DEFAULT_LIBRARY_ID} REFERENCES libraries (id),
+                CONSTRAINT books_partitioned_pkey PRIMARY KEY (library_id, id),
+                CONSTRAINT books_library_id_isbn_key UNIQUE (library_id, isbn),
+                CONSTRAINT books_library_id_isbn13_key UNIQUE (library_id, isbn13)
+            ) PARTITION BY HASH (library_id)
+        """)
+
+        for remainder in range(LIBRARY_PARTITIONS):
+            migration.execute(
+                f'create partition books_p{remainder}',
+                f"CREATE TABLE books_p{remainder} PARTITION OF books_partitioned "
+                f"FOR VALUES WITH (MODULUS {LIBRARY_PARTITIONS}, REMAINDER {remainder})"
+            )
+
+        # books_partitioned is empty and unused: no need to build it
+        # concurrently (which a partitioned table does not allow anyway).
+        migration.execute(
+            'create index ix_books_library_id_updated_at',
+            "CREATE INDEX ix_books_library_id_updated_at ON books_partitioned (library_id, updated_at)"
+        )
+
+        # updated_at is the start of the writing transaction: every book
+        # written after the copy starts has one at or after the start of the
+        # oldest transaction running now, and every book deleted a tombstone
+        # after the last one now.
+        connection = op.get_bind()
+        since = connection.execute(sa.text(
+            f"SELECT least(now(), min(xact_start)) - interval '{OVERLAP}' FROM pg_stat_activity"
+        )).scalar()
+        last_tombstone_id = connection.execute(sa.text("SELECT coalesce(max(id), 0) FROM tombstones")).scalar()
+
+        migration.copy_rows(
+            'books',
+            'books_partitioned',
+            ('library_id',) + BOOK_COLUMNS,
+            f'{DEFAULT_LIBRARY_ID}, {columns}'
+        )
+
+        migration.lock('books')
+
+        migration.execute(
+            'delete the books deleted during the copy',
+            sa.text(
+                "DELETE FROM books_partitioned "
+                "WHERE id IN (SELECT book_id FROM tombstones WHERE id > :last_tombstone_id)"
+            ).bindparams(last_tombstone_id=last_tombstone_id),
+            locked=True
+        )
+        # An ISBN may have moved between two of the changed books.
+        migration.execute(
+            'release the ISBNs of the books changed during the copy',
+            sa.text(
+                "UPDATE books_partitioned SET isbn = NULL, isbn13 = NULL "
+                "WHERE id IN (SELECT id FROM books WHERE updated_at >= :since)"
+            ).bindparams(since=since),
+            locked=True
+        )
+        migration.execute(
+            'copy the books changed during the copy',
+            sa.text(
+                f"INSERT INTO books_partitioned (library_id, {columns}) "
+                f"SELECT {DEFAULT_LIBRARY_ID}, {columns} FROM books WHERE updated_at >= :since "
+                f"ON CONFLICT (library_id, id) DO UPDATE SET {updates}"
+            ).bindparams(since=since),
+            locked=True
+        )
+
+        for name, statement in (
+            ('rename books to books_unpartitioned', "ALTER TABLE books RENAME TO books_unpartitioned"),
+            ('rename books_partitioned to books', "ALTER TABLE books_partitioned RENAME TO books"),
+            ('move books_id_seq to the new books', "ALTER SEQUENCE books_id_seq OWNED BY books.id"),
+            ('drop books_unpartitioned', "DROP TABLE books_unpartitioned"),
+            ('rename the primary key', "ALTER TABLE books RENAME CONSTRAINT books_partitioned_pkey TO books_pkey"),
+        ):
+            migration.execute(name, statement, locked=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Not online: books is copied back in one statement. It fails when two
+    # libraries have a book with the same ISBN.
+    columns = ', '.join(BOOK_COLUMNS)
+
+    op.execute("CREATE TABLE books_unpartitioned (LIKE books INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute("ALTER TABLE books_unpartitioned DROP COLUMN library_id")
+    op.execute(f"INSERT INTO books_unpartitioned ({columns}) SELECT {columns} FROM books")
+    op.execute("ALTER SEQUENCE books_id_seq OWNED BY books_unpartitioned.id")
+    op.execute("DROP TABLE books")
+    op.execute("ALTER TABLE books_unpartitioned RENAME TO books")
+
+    op.create_primary_key('books_pkey', 'books', ['id'])
+    op.create_unique_constraint('books_isbn_key', 'books', ['isbn'])
+    op.create_unique_constraint('books_isbn13_key', 'books', ['isbn13'])
+    op.create_index('ix_books_updated_at', 'books', ['updated_at'], unique=False)
+
+    op.drop_column('tombstones', 'library_id')
+    op.drop_table('libraries')
@@ -0,0 +1,33 @@
+"""Added the version column.
+
+Revision ID: f7a3c1d05e96
+Revises: e41c7a9d2b58
+Create Date: 2026-10-19 19:42:17.208653
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.migration_helpers import OnlineMigration
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7a3c1d05e96'
+down_revision: Union[str, None] = 'e41c7a9d2b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant default: every book starts at version 1 without the table
+    # (or any of its partitions) being rewritten.
+    with OnlineMigration() as migration:
+        migration.add_column('books', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('books', 'version')
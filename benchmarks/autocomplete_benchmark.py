@@ -0,0 +1,105 @@
+"""
+    Per keystroke latency of the author/genre typeahead (db/prefix_index.py)
+    on a large number of distinct authors, and the cost of keeping it up to
+    date.
+
+        python -m benchmarks.autocomplete_benchmark --authors 200000 --words 2000
+
+    --words names are typed one character at a time, each keystroke asking
+    for the suggestions of what has been typed so far, right after the
+    index is built and warmed as SuggestionsViewModel does it. Then books
+    are added and deleted between keystrokes, as change events would.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from db.prefix_index import PrefixIndex
+
+
+FIRST_NAMES = ["Anna", "Boris", "Clara", "David", "Elena", "Frank", "Greta", "Hugo", "Ivan", "Julia",
+               "Karl", "Lena", "Mario", "Nina", "Oscar", "Paula", "Quinn", "Rosa", "Stefan", "Tanja"]
+
+
+def synthetic_authors(count, rng):
+    """
+        (name, number of books) with a long tail: a few prolific authors and
+        many with one book.
+    """
+    authors = {}
+
+    while len(authors) < count:
+        surname = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10))).title()
+        name = f"{rng.choice(FIRST_NAMES)} {surname}"
+        authors[name] = max(1, int(rng.paretovariate(1.2)))
+
+    return list(authors.items())
+
+
+def report(name, durations):
+    ordered = sorted(durations)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    print(f"{name:<30} median {statistics.median(ordered) * 1e6:8.1f} µs   "
+          f"p95 {p95 * 1e6:8.1f} µs   max {ordered[-1] * 1e6:8.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--authors", type=int, default=200000, help="distinct authors in the index")
+    parser.add_argument("--words", type=int, default=2000, help="names typed")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    authors = synthetic_authors(args.authors, rng)
+
+    start = time.perf_counter()
+    index = PrefixIndex.from_counts(authors)
+    built = time.perf_counter()
+    index.warm()
+    warmed = time.perf_counter()
+
+    print(f"{args.authors} authors: built in {(built - start) * 1000:.0f} ms, warmed in {(warmed - built) * 1000:.0f} ms")
+
+    typed = [rng.choice(authors)[0] for _ in range(args.words)]
+    # Half of the names are typed from the surname.
+    typed = [name if i % 2 else name.split(" ", 1)[1] for i, name in enumerate(typed)]
+
+    keystrokes = []
+    for name in typed:
+        for end in range(1, len(name) + 1):
+            start = time.perf_counter()
+            index.suggest(name[:end])
+            keystrokes.append(time.perf_counter() - start)
+
+    report("keystroke", keystrokes)
+
+    adds, removes, after_changes = [], [], []
+    for name in typed:
+        new_author = f"{rng.choice(FIRST_NAMES)} {name.split(' ')[-1]}x"
+
+        start = time.perf_counter()
+        index.add(new_author)
+        adds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.suggest(name[:3])
+        after_changes.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.remove(new_author)
+        removes.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.suggest(name[:1])
+        after_changes.append(time.perf_counter() - start)
+
+    report("add a book's author", adds)
+    report("remove a book's author", removes)
+    report("keystroke after a change", after_changes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+    Compares the SQL queries behind the book list and the Statistics window
+    with the same work done on an in-memory ColumnStore.
+
+        python -m benchmarks.column_store_benchmark --books 200000
+
+    The SQLite library is kept in the temp directory and reused by later
+    runs with the same --books.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from db.changes import ChangeEvent
+from db.column_store import ColumnStore
+from db.repo import Repo
+from ui.statistics_cache import StatisticsCache
+
+from .seed import seeded_sqlite_session_factory
+
+
+def best_of(repeat, function):
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-column-store-{args.books}.db")
+
+    print(f"Seeding {args.books} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, args.books)
+
+    with session_factory() as session:
+        repo = Repo(session)
+
+        start = time.perf_counter()
+        store = ColumnStore.load(session)
+        load_seconds = time.perf_counter() - start
+
+        everything = store.filter()
+
+        cases = [
+            ("statistics", lambda: StatisticsCache().refresh(repo), store.statistics),
+            ("filter genre", lambda: repo.filter_by_genre("Horror"), lambda: store.filter(genre="Horror")),
+            ("sort by title", lambda: repo.order_by_title(True), lambda: store.sort(everything, "title")),
+            ("sort by year", lambda: repo.order_by_year(True), lambda: store.sort(everything, "year")),
+        ]
+
+        print(f"\nColumnStore.load: {load_seconds * 1000:.1f} ms")
+        print(f"\n{'operation':<16}{'sql ms':>12}{'store ms':>12}{'speedup':>10}")
+
+        for name, with_sql, with_store in cases:
+            sql_seconds = best_of(args.repeat, with_sql)
+            session.expunge_all()
+            store_seconds = best_of(args.repeat, with_store)
+
+            print(f"{name:<16}{sql_seconds * 1000:>12.2f}{store_seconds * 1000:>12.2f}{sql_seconds / store_seconds:>9.1f}x")
+
+        ids = store.book_ids(everything[:1000])
+        start = time.perf_counter()
+        for id in ids:
+            store.apply(ChangeEvent(id, "update", {"is_read": True, "year": 2000}))
+        apply_seconds = time.perf_counter() - start
+
+        print(f"\nApplying {len(ids)} update events: {apply_seconds * 1000:.2f} ms")
+
+        sql_statistics = StatisticsCache().refresh(repo)
+        store_statistics = ColumnStore.load(session).statistics()
+        mismatches = [key for key in sql_statistics if sql_statistics[key] != store_statistics[key]]
+
+        if mismatches:
+            # most_common_genre can legitimately differ when genres tie.
+            print(f"Statistics differ from SQL for: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+    Checks that concurrent editors lose no updates: --writers threads each
+    add 1 to the year of the same --books books --edits times, every edit
+    a read followed by Repo.update_book() with the version that was read,
+    read again and retried on StaleBookError. At the end every year must
+    have grown by exactly writers * edits, and the script exits with
+    status 1 when one has not.
+
+        python -m benchmarks.concurrent_writers --writers 8 --edits 200
+        python -m benchmarks.concurrent_writers --url postgresql+psycopg2://postgres@localhost/scratch
+
+    With --last-write-wins the version is not passed, as before versions
+    existed, to show the updates that are lost then. Without --url a new
+    SQLite file is used; a PostgreSQL database must have been upgraded with
+    Alembic, and the books added are deleted at the end.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from exceptions import StaleBookError
+
+from .view_model_benchmark import report
+
+
+START_YEAR = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8, help="concurrent editors")
+    parser.add_argument("--edits", type=int, default=200, help="edits by every writer")
+    parser.add_argument("--books", type=int, default=3, help="books edited, the fewer the more conflicts")
+    parser.add_argument("--last-write-wins", action="store_true", help="update without the version read")
+    parser.add_argument("--url", help="database to use instead of a new SQLite file")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    url = args.url
+
+    if url is None:
+        path = os.path.join(tempfile.gettempdir(), "bookworm-concurrent-writers.db")
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+        url = f"sqlite:///{path}"
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = url
+
+    from sqlalchemy import select
+    from sqlalchemy.orm import sessionmaker
+
+    from db.engine import DatabaseConfig, create_engine_from_config, prepare_sqlite_schema
+    from db.models import Base, Book
+    from db.repo import Repo
+
+    config = DatabaseConfig(url=url, pool_size=args.writers)
+    engine = create_engine_from_config(config)
+
+    if config.is_sqlite:
+        with engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+
+    session_factory = sessionmaker(bind=engine)
+    run = f"{time.time():.0f}"
+
+    with session_factory() as session:
+        Repo(session).add_books([
+            {"title": f"Concurrent writers {run} #{i}", "author": "Benchmark", "genre": "Test", "year": START_YEAR}
+            for i in range(args.books)
+        ])
+        ids = list(session.scalars(select(Book.id).where(Book.title.like(f"Concurrent writers {run} #%"))))
+
+    conflicts = []
+    durations = []
+    errors = []
+    lock = threading.Lock()
+
+    def write(writer):
+        rng = random.Random(args.seed + writer)
+        writer_conflicts = 0
+        writer_durations = []
+
+        try:
+            for _ in range(args.edits):
+                id = rng.choice(ids)
+                start = time.perf_counter()
+
+                while True:
+                    with session_factory() as session:
+                        repo = Repo(session)
+                        book = repo.get_book_by_id(id)
+                        year, version = book.year, book.version
+
+                        # Ends the read: the update starts a transaction of
+                        # its own, as it does after the user's think-time.
+                        session.rollback()
+
+                        try:
+                            repo.update_book(
+                                id, None, None, None, None, year + 1, None,
+                                version=None if args.last_write_wins else version
+                            )
+                            break
+                        except StaleBookError:
+                            writer_conflicts += 1
+
+                writer_durations.append(time.perf_counter() - start)
+        except Exception as error:
+            errors.append(error)
+
+        with lock:
+            conflicts.append(writer_conflicts)
+            durations.extend(writer_durations)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(args.writers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+
+    with session_factory() as session:
+        years = dict(session.execute(select(Book.id, Book.year).where(Book.id.in_(ids))).all())
+        Repo(session).delete_books_by_ids(ids)
+
+    edits = args.writers * args.edits
+    applied = sum(year - START_YEAR for year in years.values())
+
+    print(f"{args.writers} writers, {edits} edits of {args.books} books in {elapsed:.1f} s, "
+          f"{sum(conflicts)} conflicts retried")
+    report("  edit, retries included", durations)
+    print(f"  applied {applied} of {edits} edits, {edits - applied} lost")
+
+    for error in errors:
+        print(f"  writer failed: {error!r}")
+
+    if errors or (applied != edits and not args.last_write_wins):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
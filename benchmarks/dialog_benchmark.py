@@ -0,0 +1,118 @@
+"""
+    Time to open the Details, Edit and Add dialogs, and whether memory grows
+    when they are opened and closed over and over.
+
+        python -m benchmarks.dialog_benchmark --opens 500
+
+    Every dialog is opened once to build it, then opened and hidden --opens
+    times with a different book each time. The Python allocations
+    (tracemalloc), the widgets and the Tcl commands alive after the first
+    half of the opens are compared with those after the second half; the
+    script exits with status 1 when the growth per open exceeds
+    --max-growth bytes or any widget or command is left behind.
+
+    Needs a display (on a headless machine run it under xvfb-run).
+    tests/test_dialogs.py runs the same check with fewer opens.
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from .render_benchmark import count_widgets
+
+
+def snapshot(app):
+    gc.collect()
+    app.update()
+
+    python_bytes, _ = tracemalloc.get_traced_memory()
+
+    return python_bytes, count_widgets(app), len(app.tk.call("info", "commands"))
+
+
+def open_and_hide(app, books, count: int):
+    """
+        Opens and hides each pooled dialog count times, with a different
+        book each time. Returns the number of opens.
+    """
+    for i in range(count):
+        book = books[i % len(books)]
+
+        app.dialogs.open("details", book).hide()
+        app.dialogs.open("edit", book).hide()
+        app.dialogs.open("add").hide()
+
+    return count * 3
+
+
+def retained_per_open(app, books, opens: int):
+    """
+        Opens every dialog once to build it, then opens and hides them
+        opens times. Returns the Python bytes retained per open in the
+        second half, and the widgets and Tcl commands added by it.
+    """
+    open_and_hide(app, books, 1)
+
+    tracemalloc.start()
+    half = opens // 2
+
+    try:
+        open_and_hide(app, books, half)
+        python_before, widgets_before, commands_before = snapshot(app)
+
+        opened = open_and_hide(app, books, opens - half)
+        python_after, widgets_after, commands_after = snapshot(app)
+    finally:
+        tracemalloc.stop()
+
+    return (python_after - python_before) / opened, widgets_after - widgets_before, commands_after - commands_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--opens", type=int, default=500, help="times each dialog is opened")
+    parser.add_argument("--books", type=int, default=1000, help="books in the benchmark library")
+    parser.add_argument("--max-growth", type=int, default=256, help="bytes per open allowed to be retained")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-render-{args.books}.db")
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = f"sqlite:///{path}"
+
+    from db.repo import Repo
+    from .seed import seeded_sqlite_session_factory
+    from ui.app import BookWormApp
+
+    print(f"Seeding {args.books} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, args.books)
+
+    with session_factory() as session:
+        books = Repo(session).get_books_keyset(limit=args.books)
+
+    app = BookWormApp()
+    app.withdraw()
+
+    growth, widgets, commands = retained_per_open(app, books, args.opens)
+
+    for name, timing in app.dialogs.timings().items():
+        print(f"{name}: first open {timing["first_ms"]:.1f} ms (builds the window), "
+              f"then median {timing["median_ms"]:.2f} ms, max {timing["max_ms"]:.2f} ms "
+              f"over the last {timing["opens"]} opens")
+
+    print(f"Retained per open: {growth:.1f} bytes Python, "
+          f"{widgets} widgets, {commands} Tcl commands in total")
+
+    app.unsubscribe_from_changes()
+    app.destroy()
+
+    if growth > args.max_growth or widgets > 0 or commands > 0:
+        print("Memory grows across repeated opens.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+    Duplicate detection (db/duplicates.py) on a synthetic library with
+    known duplicates.
+
+        python -m benchmarks.duplicate_benchmark --books 1000000 --duplicates 0.02
+
+    Titles are random words and authors random names; --duplicates of the
+    books get a second copy written differently (case, punctuation, a leading
+    article, "Surname, Name", a typo). The report gives the time to build
+    the index and to find every cluster, the recall and precision of the
+    clusters against the planted copies, and the latency of the inline check
+    run when one book is added.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from db.duplicates import DuplicateIndex, check_import
+
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def word(rng):
+    return "".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 9)))
+
+
+def variant_title(title, rng):
+    choice = rng.randrange(4)
+
+    if choice == 0:
+        return title.upper()
+    if choice == 1:
+        return f"The {title}!"
+    if choice == 2:
+        position = rng.randrange(len(title))
+        return title[:position] + title[position + 1:]
+
+    return title.replace(" ", " - ", 1)
+
+
+def variant_author(author, rng):
+    first, last = author.split(" ", 1)
+
+    return f"{last}, {first}" if rng.random() < 0.5 else author.lower()
+
+
+def synthetic_library(count, duplicate_share, rng):
+    """
+        (rows, planted pairs of ids that are duplicates).
+    """
+    vocabulary = [word(rng) for _ in range(20000)]
+    names = [word(rng).title() for _ in range(3000)]
+
+    rows, pairs = [], []
+    originals = int(count / (1 + duplicate_share))
+
+    for id in range(1, originals + 1):
+        title = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6))).capitalize()
+        author = f"{rng.choice(names)} {rng.choice(names)}"
+        rows.append((id, title, author))
+
+    for id in range(originals + 1, count + 1):
+        original_id, title, author = rows[rng.randrange(originals)]
+        rows.append((id, variant_title(title, rng), variant_author(author, rng)))
+        pairs.append((original_id, id))
+
+    return rows, pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=1000000, help="books in the synthetic library")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="share of books that are planted copies")
+    parser.add_argument("--checks", type=int, default=1000, help="inline checks measured")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    rows, pairs = synthetic_library(args.books, args.duplicates, rng)
+    print(f"{len(rows)} books with {len(pairs)} planted copies generated in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    index = DuplicateIndex.build(rows)
+    print(f"index built in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    clusters = index.clusters()
+    print(f"{len(clusters)} clusters found in {time.perf_counter() - start:.1f} s")
+
+    cluster_of = {id: i for i, ids in enumerate(clusters) for id in ids}
+    found = sum(1 for first, second in pairs if first in cluster_of and cluster_of[first] == cluster_of.get(second))
+    planted = {id for pair in pairs for id in pair}
+    clustered = sum(len(ids) for ids in clusters)
+    correct = sum(1 for ids in clusters for id in ids if id in planted)
+
+    print(f"recall    {found / len(pairs):.3f}  (planted pairs in one cluster)")
+    print(f"precision {correct / clustered:.3f}  (clustered books that were planted)" if clustered else "precision n/a")
+
+    durations = []
+    for _ in range(args.checks):
+        _, title, author = rows[rng.randrange(len(rows))]
+
+        start = time.perf_counter()
+        index.matches(variant_title(title, rng), author)
+        durations.append(time.perf_counter() - start)
+
+    ordered = sorted(durations)
+    print(f"inline check  median {statistics.median(ordered) * 1000:.3f} ms   "
+          f"p95 {ordered[int(len(ordered) * 0.95)] * 1000:.3f} ms")
+
+    batch = [{"title": variant_title(title, rng), "author": author} for _, title, author in rng.sample(rows, 1000)]
+
+    start = time.perf_counter()
+    in_library, _ = check_import(index, batch)
+    print(f"import check of {len(batch)} books: {len(in_library)} duplicates in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
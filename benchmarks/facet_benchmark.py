@@ -0,0 +1,93 @@
+"""
+    Facet counts (genre, decade, read status) of a search on a large
+    library: the single grouped query Repo.get_facet_counts runs, against one
+    grouped query per facet (the search predicate evaluated three times) and
+    against a hit in the FacetViewModel cache.
+
+        python -m benchmarks.facet_benchmark --books 200000 --repeat 20
+
+    Every search is measured --repeat times; the report gives the median
+    and the 95th percentile of each way.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from .view_model_benchmark import report
+
+
+SEARCHES = [
+    ("title", ""),
+    ("title", "Book 12"),
+    ("author", "Author 5"),
+    ("year", "1999"),
+    ("everything", "Synthetic 42"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=200000, help="books in the benchmark library")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of every measurement")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-facets-{args.books}.db")
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = f"sqlite:///{path}"
+
+    from sqlalchemy import select, func
+
+    from .seed import seeded_sqlite_session_factory
+    from db.models import Book
+    from db.repo import Repo
+    from ui.result_set import ResultSet
+    from ui.view_models import FacetViewModel, SearchViewModel
+
+    print(f"Seeding {args.books} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, args.books)
+
+    search_model = SearchViewModel(session_factory.kw["bind"].dialect.name)
+    facet_model = FacetViewModel(session_factory)
+
+    def per_facet_queries(session, criteria):
+        decade = Book.year // 10 * 10
+
+        return {
+            "genre": dict(session.execute(select(Book.genre, func.count()).where(*criteria).group_by(Book.genre)).all()),
+            "decade": dict(session.execute(select(decade, func.count()).where(*criteria).group_by(decade)).all()),
+            "is_read": dict(session.execute(select(Book.is_read, func.count()).where(*criteria).group_by(Book.is_read)).all()),
+        }
+
+    for option, text in SEARCHES:
+        query = search_model.search(option, text)
+        grouped, separate, cached = [], [], []
+
+        for _ in range(args.repeat):
+            with session_factory() as session:
+                start = time.perf_counter()
+                counts = Repo(session).get_facet_counts(query.criteria)
+                grouped.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                expected = per_facet_queries(session, query.criteria)
+                separate.append(time.perf_counter() - start)
+
+            assert counts == expected, (counts, expected)
+
+            result_set = ResultSet([], query.matches, query.criteria, key=query.key)
+            start = time.perf_counter()
+            facet_model.counts(result_set)
+            cached.append(time.perf_counter() - start)
+
+        matching = sum(counts["is_read"].values())
+
+        print(f"search {option}={text!r} ({matching} books)")
+        report("  one grouped query", grouped)
+        report("  one query per facet", separate)
+        report("  FacetViewModel (cached)", cached, "   (the first run queries)")
+
+
+if __name__ == "__main__":
+    main()
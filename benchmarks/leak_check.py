@@ -0,0 +1,225 @@
+"""
+    Looks for memory that the UI never gives back, by running the same
+    cycles over and over against a seeded library:
+
+        refresh  reload the list of book cards (new frames, BooleanVars and
+                 lambdas capturing Book objects every time)
+        dialogs  open and close the Details, Edit and Add windows
+        search   run searches and stream their results into the list
+
+        python -m benchmarks.leak_check --refreshes 1000 --dialogs 500 --searches 1000
+
+    Every scenario is warmed up first, so caches and lazily built windows
+    are in place, then gc and tracemalloc snapshots are taken before and
+    after its cycles. The report lists the object types whose live count
+    grew and the source lines whose allocations grew; the script exits
+    with status 1 when any scenario retains more than --max-bytes per cycle
+    or any type grows by more than --max-objects per cycle.
+
+    Needs a display. Without one it starts a virtual display when
+    pyvirtualdisplay and Xvfb are installed, otherwise run it under
+    xvfb-run.
+"""
+import argparse
+import collections
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from .render_benchmark import count_widgets
+
+
+WARMUP_CYCLES = 5
+
+SEARCHES = [
+    ("title", "Book 1"),
+    ("author", "Author 2"),
+    ("everything", "Fantasy"),
+    ("genre", "Poetry"),
+    ("year", "1999"),
+]
+
+
+def start_virtual_display():
+    """
+        Starts an Xvfb display when there is no display, if it can. Returns
+        the display to stop at the end, or None.
+    """
+    if os.environ.get("DISPLAY"):
+        return None
+
+    try:
+        from pyvirtualdisplay import Display
+    except ImportError:
+        return None
+
+    display = Display(visible=False, size=(1280, 800))
+    display.start()
+
+    return display
+
+
+def live_objects_by_type():
+    gc.collect()
+
+    return collections.Counter(type(obj).__qualname__ for obj in gc.get_objects())
+
+
+def settle(app):
+    """
+        Runs the event loop until the list has finished loading.
+    """
+    app.update()
+
+    while app.book_loader.loading:
+        app.update()
+
+    app.update_idletasks()
+
+
+class Scenario:
+    def __init__(self, name, cycles, run_cycle):
+        self.name = name
+        self.cycles = cycles
+        self.run_cycle = run_cycle
+
+    def measure(self, app):
+        """
+            Returns (bytes, objects by type, widgets, Tcl commands) retained
+            after the cycles, and the largest allocation differences.
+        """
+        for i in range(WARMUP_CYCLES):
+            self.run_cycle(i)
+
+        objects_before = live_objects_by_type()
+        widgets_before = count_widgets(app)
+        commands_before = len(app.tk.call("info", "commands"))
+        snapshot_before = tracemalloc.take_snapshot()
+
+        for i in range(self.cycles):
+            self.run_cycle(i)
+
+        objects_after = live_objects_by_type()
+        snapshot_after = tracemalloc.take_snapshot()
+
+        statistics = [
+            statistic for statistic in snapshot_after.compare_to(snapshot_before, "lineno")
+            if statistic.size_diff > 0
+        ]
+
+        objects_after.subtract(objects_before)
+
+        return (
+            sum(statistic.size_diff for statistic in statistics),
+            {name: count for name, count in objects_after.items() if count > 0},
+            count_widgets(app) - widgets_before,
+            len(app.tk.call("info", "commands")) - commands_before,
+            statistics[:10],
+        )
+
+
+def report(scenario, retained_bytes, objects, widgets, commands, statistics):
+    print(f"{scenario.name}: {scenario.cycles} cycles, retained {retained_bytes / 1024:.1f} KiB "
+          f"({retained_bytes / scenario.cycles:.0f} bytes per cycle), "
+          f"{widgets} widgets, {commands} Tcl commands")
+
+    for name, count in sorted(objects.items(), key=lambda item: -item[1])[:15]:
+        print(f"    +{count:>7} {name}")
+
+    for statistic in statistics:
+        frame = statistic.traceback[0]
+        print(f"    +{statistic.size_diff / 1024:>7.1f} KiB {frame.filename}:{frame.lineno}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=30, help="books in the library, all listed on a refresh")
+    parser.add_argument("--refreshes", type=int, default=1000, help="refresh cycles")
+    parser.add_argument("--dialogs", type=int, default=500, help="open/close cycles of every dialog")
+    parser.add_argument("--searches", type=int, default=1000, help="search cycles")
+    parser.add_argument("--max-bytes", type=int, default=512, help="bytes per cycle allowed to be retained")
+    parser.add_argument("--max-objects", type=float, default=0.1, help="objects of one type per cycle allowed to be retained")
+    args = parser.parse_args()
+
+    display = start_virtual_display()
+
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-leaks-{args.books}.db")
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = f"sqlite:///{path}"
+
+    from db.repo import Repo
+    from .seed import seeded_sqlite_session_factory
+    from ui.app import BookWormApp
+
+    print(f"Seeding {args.books} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, args.books)
+
+    with session_factory() as session:
+        books = Repo(session).get_books_keyset(limit=args.books)
+
+    app = BookWormApp()
+    app.withdraw()
+
+    def refresh(i):
+        app.prepare_books()
+        settle(app)
+
+    def open_and_close_dialogs(i):
+        book = books[i % len(books)]
+
+        app.dialogs.open("details", book).hide()
+        app.dialogs.open("edit", book).hide()
+        app.dialogs.open("add").hide()
+        app.update()
+
+    def search(i):
+        option, text = SEARCHES[i % len(SEARCHES)]
+
+        app.search_choice.set(option)
+        app.search_entry.delete(0, "end")
+        app.search_entry.insert(0, text)
+        app.search_book()
+        settle(app)
+
+    scenarios = [
+        Scenario("refresh", args.refreshes, refresh),
+        Scenario("dialogs", args.dialogs, open_and_close_dialogs),
+        Scenario("search", args.searches, search),
+    ]
+
+    tracemalloc.start()
+    leaking = []
+
+    try:
+        for scenario in scenarios:
+            if not scenario.cycles:
+                continue
+
+            retained_bytes, objects, widgets, commands, statistics = scenario.measure(app)
+            report(scenario, retained_bytes, objects, widgets, commands, statistics)
+
+            if retained_bytes / scenario.cycles > args.max_bytes \
+                    or any(count / scenario.cycles > args.max_objects for count in objects.values()) \
+                    or widgets > 0 or commands > 0:
+                leaking.append(scenario.name)
+    finally:
+        tracemalloc.stop()
+
+        app.book_loader.cancel()
+        app.prefetcher.shutdown()
+        app.unsubscribe_from_changes()
+        app.destroy()
+
+        if display is not None:
+            display.stop()
+
+    if leaking:
+        print(f"Memory grows in: {", ".join(leaking)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+    Latency of the queries of one library as the number of libraries grows.
+    Every statement of Repo is scoped to its library (and, on PostgreSQL,
+    pruned to the library's partition), so it should not depend on the
+    books of the others.
+
+        python -m benchmarks.library_benchmark --books 10000 --libraries 1,10,50 --repeat 20
+        python -m benchmarks.library_benchmark --url postgresql+psycopg2://postgres@localhost/scratch
+
+    Libraries of --books books each are added until there are as many as the
+    next step of --libraries, every one with the same ISBNs, and at every
+    step the queries of the first one are measured. Without --url a new
+    SQLite file is used; a PostgreSQL database must have been upgraded with
+    Alembic, and the libraries added are left in it. On PostgreSQL the
+    partitions each query reads are counted from its plan.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from db.isbn import isbn13_check_digit
+
+from .view_model_benchmark import report
+
+
+GENRES = ["Fantasy", "Sci-Fi", "Dystopian", "Romance", "Horror", "History", "Poetry", "Mystery"]
+
+SEED_CHUNK_SIZE = 5000
+
+
+def synthetic_isbn(i: int):
+    digits = f"978{i:09d}"
+
+    return digits + isbn13_check_digit(digits)
+
+
+def synthetic_books(count):
+    return [
+        {
+            "title": f"Book {i}",
+            "author": f"Author {i % 997}",
+            "genre": GENRES[i % len(GENRES)],
+            "year": 1900 + i % 125,
+            "description": f"Synthetic description number {i}",
+            "isbn": synthetic_isbn(i),
+            "is_read": i % 3 == 0,
+        }
+        for i in range(count)
+    ]
+
+
+def partitions_read(session, stmt):
+    """
+        The tables of books an EXPLAIN of stmt reads.
+    """
+    from sqlalchemy import text
+
+    sql = str(stmt.compile(session.get_bind(), compile_kwargs={"literal_binds": True}))
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+
+    def relations(node):
+        if "Relation Name" in node:
+            yield node["Relation Name"]
+
+        for child in node.get("Plans", []):
+            yield from relations(child)
+
+    return sorted(set(relations(plan[0]["Plan"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=10000, help="books in every library")
+    parser.add_argument("--libraries", default="1,10,50", help="numbers of libraries measured at")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of every measurement")
+    parser.add_argument("--url", help="database to use instead of a new SQLite file")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    steps = sorted(int(step) for step in args.libraries.split(","))
+    url = args.url
+
+    if url is None:
+        path = os.path.join(tempfile.gettempdir(), f"bookworm-libraries-{args.books}.db")
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+        url = f"sqlite:///{path}"
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = url
+
+    from sqlalchemy import select, func, text
+    from sqlalchemy.orm import sessionmaker
+
+    from db.engine import DatabaseConfig, create_engine_from_config, prepare_sqlite_schema
+    from db.models import Base, Book
+    from db.repo import Repo, library_criterion
+
+    config = DatabaseConfig(url=url)
+    engine = create_engine_from_config(config)
+
+    if config.is_sqlite:
+        with engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+
+    session_factory = sessionmaker(bind=engine)
+    rng = random.Random(args.seed)
+    books = synthetic_books(args.books)
+    library_ids = []
+    run = f"{time.time():.0f}"
+
+    for step in steps:
+        start = time.perf_counter()
+
+        with session_factory() as session:
+            while len(library_ids) < step:
+                library_id = Repo(session).add_library(f"Benchmark {run} #{len(library_ids) + 1}")
+                repo = Repo(session, library_id)
+
+                for first in range(0, len(books), SEED_CHUNK_SIZE):
+                    repo.add_books(books[first:first + SEED_CHUNK_SIZE])
+
+                library_ids.append(library_id)
+
+            if engine.dialect.name == "postgresql":
+                session.execute(text("ANALYZE books"))
+                session.commit()
+
+        print(f"{step} libraries, {step * args.books} books (seeded in {time.perf_counter() - start:.1f} s)")
+
+        library_id = library_ids[0]
+
+        with session_factory() as session:
+            repo = Repo(session, library_id)
+            ids = [id for id, in session.execute(select(Book.id).where(library_criterion(library_id)))]
+            isbns = [book["isbn"] for book in books]
+
+            measurements = {
+                "book by id": lambda: repo.get_book_by_id(rng.choice(ids)),
+                "first page by title": lambda: repo.get_books_keyset(order="title", limit=50),
+                "page after a book by id": lambda: repo.get_books_keyset(
+                    after=repo.get_book_by_id(rng.choice(ids)), limit=50
+                ),
+                "50 ISBNs": lambda: repo.get_books_by_isbns(rng.sample(isbns, 50)),
+                "title contains": lambda: repo.get_books_by_title_contain(f"Book {rng.randrange(1000)}"),
+                "count": repo.get_books_count,
+                "facet counts": repo.get_facet_counts,
+            }
+
+            for name, measured in measurements.items():
+                durations = []
+
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    measured()
+                    durations.append(time.perf_counter() - start)
+
+                report(f"  {name}", durations)
+
+            if engine.dialect.name == "postgresql":
+                stmt = select(func.count()).select_from(Book).where(library_criterion(library_id))
+                print(f"  partitions read by count: {', '.join(partitions_read(session, stmt))}")
+
+
+if __name__ == "__main__":
+    main()
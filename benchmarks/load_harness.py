@@ -0,0 +1,598 @@
+"""
+    Many clients using one library at the same time, straight through
+    Repo: every client is a thread that picks operations from the mix of a
+    scenario, by weight, with an exponential think time between them and
+    between reading a book and writing it back, as in the Edit window.
+
+        python -m benchmarks.load_harness mixed
+        python -m benchmarks.load_harness isbn_contention --clients 100 --seconds 60
+        python -m benchmarks.load_harness hot_books --processes 4 --url postgresql+psycopg2://postgres@localhost/scratch
+
+    A scenario is a JSON file of benchmarks/scenarios (or any path); the
+    options given on the command line override it. Its keys, with their
+    defaults in DEFAULTS:
+
+        clients         simulated clients, split over processes
+        processes       1 runs every client as a thread of this process
+        seconds         how long the clients run
+        books           books seeded in the library before the run
+        hot_books       operations on existing books pick among the first
+                        this many only (null for all of them)
+        isbn_pool       new ISBNs are drawn from this many, so the fewer
+                        the more adds and edits collide on the unique
+                        constraint
+        think_ms        mean think time of a client
+        pool_size, max_overflow
+                        connection pool of every process
+        isolation_level e.g. "SERIALIZABLE"; null for the database's own
+        mix             weight of every operation of OPERATIONS
+
+    Every run seeds a new library, in a new SQLite file without --url; a
+    PostgreSQL database must have been upgraded with Alembic, and the
+    library is left in it. The report gives the throughput and latency
+    percentiles of every operation (think time excluded), how many were
+    skipped with nothing to do (a delete before the client added a book;
+    left out of the latencies and ok/s), how many failed and why
+    (deadlocks, serialization failures, ISBN conflicts, stale versions, a
+    locked SQLite file, pool timeouts) and how long clients waited for a
+    pooled connection. --json writes the same as JSON.
+"""
+import argparse
+import collections
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+import sqlalchemy.exc
+
+from exceptions import BookDoesNotExistError, StaleBookError
+
+from .library_benchmark import synthetic_isbn
+
+
+SCENARIOS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+
+DEFAULTS = {
+    "description": "",
+    "clients": 50,
+    "processes": 1,
+    "seconds": 30,
+    "books": 20000,
+    "hot_books": None,
+    "isbn_pool": 100000,
+    "think_ms": 100,
+    "pool_size": 10,
+    "max_overflow": 20,
+    "isolation_level": None,
+    "seed": 1,
+    "mix": {"search": 40, "page": 30, "edit": 15, "toggle": 15},
+}
+
+# Seeded books get ISBNs from here on, outside every isbn_pool.
+FIRST_SEEDED_ISBN = 10 ** 8
+
+BULK_SIZE = 20
+PAGE_SIZE = 50
+
+# Pool waits longer than this are counted.
+POOL_WAIT_SECONDS = 0.001
+
+CONTENTION_OUTCOMES = (
+    "deadlock",
+    "serialization failure",
+    "isbn conflict",
+    "stale version",
+    "book deleted",
+    "database locked",
+    "pool timeout",
+)
+
+
+class Skipped(Exception):
+    """
+        Raised by an operation with nothing to do, such as a delete before
+        the client added a book: it is counted apart, out of the latencies
+        and the ok/s.
+    """
+
+
+def outcome_of(error):
+    """
+        Why an operation failed, in the words of the report.
+    """
+    if isinstance(error, StaleBookError):
+        return "stale version"
+    if isinstance(error, BookDoesNotExistError):
+        return "book deleted"
+    if isinstance(error, sqlalchemy.exc.IntegrityError):
+        return "isbn conflict"
+    if isinstance(error, sqlalchemy.exc.TimeoutError):
+        return "pool timeout"
+
+    if isinstance(error, sqlalchemy.exc.DBAPIError):
+        code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+
+        if code == "40P01":
+            return "deadlock"
+        if code == "40001":
+            return "serialization failure"
+        if "database is locked" in str(error.orig):
+            return "database locked"
+
+    return f"error: {type(error).__name__}"
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Client:
+    """
+        One simulated user. Every operation opens its own session, as the
+        app does, so no connection is held during think time; the time to
+        get a connection from the pool is recorded apart.
+    """
+    def __init__(self, number: int, scenario: dict, session_factory, make_repo, ids: list, deadline: float):
+        self.number = number
+        self.scenario = scenario
+        self.session_factory = session_factory
+        self.make_repo = make_repo
+        self.ids = ids[:scenario["hot_books"]] if scenario["hot_books"] else ids
+        self.deadline = deadline
+
+        self.rng = random.Random(scenario["seed"] * 100003 + number)
+        self.books_made = 0
+        self.added_titles = []
+        self.paused = 0.0
+
+        self.durations = collections.defaultdict(list)
+        self.outcomes = collections.defaultdict(collections.Counter)
+        self.examples = {}
+        self.pool_waits = []
+
+    def run(self):
+        names = list(self.scenario["mix"])
+        weights = [self.scenario["mix"][name] for name in names]
+
+        while time.monotonic() < self.deadline:
+            self.perform(self.rng.choices(names, weights)[0])
+            self.think()
+
+    def perform(self, name: str):
+        self.paused = 0.0
+        start = time.perf_counter()
+
+        try:
+            OPERATIONS[name](self)
+            outcome = "ok"
+        except Skipped:
+            self.outcomes[name]["skipped"] += 1
+            return
+        except Exception as error:
+            outcome = outcome_of(error)
+            self.examples.setdefault(outcome, str(error).splitlines()[0][:200])
+
+        self.durations[name].append(time.perf_counter() - start - self.paused)
+        self.outcomes[name][outcome] += 1
+
+    def think(self):
+        if self.scenario["think_ms"]:
+            time.sleep(self.rng.expovariate(1000 / self.scenario["think_ms"]))
+
+    def pause(self):
+        """
+            Think time inside an operation, left out of its latency.
+        """
+        start = time.perf_counter()
+        self.think()
+        self.paused += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def repo(self):
+        with self.session_factory() as session:
+            start = time.perf_counter()
+            session.connection()
+            self.pool_waits.append(time.perf_counter() - start)
+
+            yield self.make_repo(session)
+
+    def new_isbn(self):
+        return synthetic_isbn(self.rng.randrange(self.scenario["isbn_pool"]))
+
+    def new_book(self):
+        self.books_made += 1
+
+        return {
+            "title": f"Load client {self.number} book {self.books_made}",
+            "author": f"Author {self.rng.randrange(997)}",
+            "genre": self.rng.choice(("Fantasy", "Sci-Fi", "History", "Poetry")),
+            "year": self.rng.randrange(1900, 2025),
+            "description": None,
+            "isbn": self.new_isbn(),
+            "is_read": False,
+        }
+
+    def read_book(self):
+        with self.repo() as repo:
+            book = repo.get_book_by_id(self.rng.choice(self.ids))
+
+        if book is None:
+            raise BookDoesNotExistError
+
+        return book
+
+    def results(self):
+        return {
+            "durations": dict(self.durations),
+            "outcomes": {name: dict(outcomes) for name, outcomes in self.outcomes.items()},
+            "examples": self.examples,
+            "pool_waits": self.pool_waits,
+        }
+
+
+def search(client: Client):
+    with client.repo() as repo:
+        repo.get_books_by_title_contain(f"Book {client.rng.randrange(1000)}")
+
+
+def full_text(client: Client):
+    with client.repo() as repo:
+        repo.full_text_search(f"description {client.rng.randrange(1000)}")
+
+
+def page(client: Client):
+    order = client.rng.choice(("title", "-title", "author", "year", "-added_on"))
+
+    with client.repo() as repo:
+        repo.get_books_keyset(order=order, limit=PAGE_SIZE)
+
+
+def lookup(client: Client):
+    with client.repo() as repo:
+        repo.get_books_by_isbns([client.new_isbn() for _ in range(BULK_SIZE)])
+
+
+def stats(client: Client):
+    with client.repo() as repo:
+        repo.get_books_count()
+        repo.get_read_and_unread_count()
+        repo.get_most_common_genre()
+
+
+def facets(client: Client):
+    with client.repo() as repo:
+        repo.get_facet_counts()
+
+
+def add(client: Client):
+    book = client.new_book()
+
+    with client.repo() as repo:
+        repo.add_book(book["title"], book["author"], book["genre"], None, book["year"], book["isbn"])
+
+    client.added_titles.append(book["title"])
+
+
+def bulk_add(client: Client):
+    books = [client.new_book() for _ in range(BULK_SIZE)]
+
+    with client.repo() as repo:
+        repo.add_books(books)
+
+    client.added_titles.extend(book["title"] for book in books)
+
+
+def edit(client: Client):
+    book = client.read_book()
+    client.pause()
+
+    with client.repo() as repo:
+        repo.update_book(book.id, None, None, None, None, (book.year or 1900) % 2024 + 1, None, version=book.version)
+
+
+def edit_isbn(client: Client):
+    book = client.read_book()
+    client.pause()
+
+    with client.repo() as repo:
+        repo.update_book(book.id, None, None, None, None, None, client.new_isbn(), version=book.version)
+
+
+def toggle(client: Client):
+    book = client.read_book()
+    client.pause()
+
+    with client.repo() as repo:
+        repo.update_book_read_status(book)
+
+
+def bulk_toggle(client: Client):
+    with client.repo() as repo:
+        ids = client.rng.sample(client.ids, min(BULK_SIZE, len(client.ids)))
+        repo.update_books_read_status(ids, client.rng.random() < 0.5)
+
+
+def delete(client: Client):
+    """
+        Deletes a book the client added, if it added one.
+    """
+    if not client.added_titles:
+        raise Skipped
+
+    title = client.added_titles.pop(client.rng.randrange(len(client.added_titles)))
+
+    with client.repo() as repo:
+        repo.delete_book_by_title(title)
+
+
+OPERATIONS = {
+    "search": search,
+    "full_text": full_text,
+    "page": page,
+    "lookup": lookup,
+    "stats": stats,
+    "facets": facets,
+    "add": add,
+    "bulk_add": bulk_add,
+    "edit": edit,
+    "edit_isbn": edit_isbn,
+    "toggle": toggle,
+    "bulk_toggle": bulk_toggle,
+    "delete": delete,
+}
+
+
+def load_scenario(name: str):
+    path = name if os.path.exists(name) else os.path.join(SCENARIOS_DIRECTORY, f"{name}.json")
+
+    with open(path) as file:
+        scenario = dict(DEFAULTS, **json.load(file))
+
+    unknown = set(scenario["mix"]) - set(OPERATIONS)
+
+    if unknown:
+        raise ValueError(f"unknown operations in {path}: {', '.join(sorted(unknown))}")
+
+    scenario["name"] = os.path.splitext(os.path.basename(path))[0]
+
+    return scenario
+
+
+def run_clients(scenario: dict, url: str, library_id: int, ids: list, numbers: list):
+    """
+        Runs the clients of numbers as threads of this process, with a
+        connection pool of their own, and returns what they recorded.
+    """
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = url
+
+    from sqlalchemy.orm import sessionmaker
+
+    from db.engine import DatabaseConfig, create_engine_from_config
+    from db.repo import Repo
+
+    config = DatabaseConfig(url=url, pool_size=scenario["pool_size"], max_overflow=scenario["max_overflow"])
+    engine = create_engine_from_config(config)
+
+    bind = engine
+    if scenario["isolation_level"]:
+        bind = engine.execution_options(isolation_level=scenario["isolation_level"])
+
+    session_factory = sessionmaker(bind=bind)
+    deadline = time.monotonic() + scenario["seconds"]
+    clients = [
+        Client(number, scenario, session_factory, lambda session: Repo(session, library_id), ids, deadline)
+        for number in numbers
+    ]
+    threads = [threading.Thread(target=client.run) for client in clients]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    engine.dispose()
+
+    return [client.results() for client in clients]
+
+
+def seed_library(scenario: dict, url: str):
+    """
+        Adds a library of scenario["books"] books and returns its id and
+        the ids of its books.
+    """
+    os.environ["BOOKWORM_DATABASE_URL"] = url
+
+    from sqlalchemy import select
+    from sqlalchemy.orm import sessionmaker
+
+    from db.engine import DatabaseConfig, create_engine_from_config, prepare_sqlite_schema
+    from db.models import Base, Book
+    from db.repo import Repo, library_criterion
+
+    from .seed import synthetic_books, SEED_CHUNK_SIZE
+
+    config = DatabaseConfig(url=url)
+    engine = create_engine_from_config(config)
+
+    if config.is_sqlite:
+        with engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+
+    books = [
+        dict(book, isbn=synthetic_isbn(FIRST_SEEDED_ISBN + i))
+        for i, book in enumerate(synthetic_books(scenario["books"]))
+    ]
+
+    with sessionmaker(bind=engine)() as session:
+        library_id = Repo(session).add_library(f"Load harness {scenario['name']} {time.time():.0f}")
+        repo = Repo(session, library_id)
+
+        for first in range(0, len(books), SEED_CHUNK_SIZE):
+            repo.add_books(books[first:first + SEED_CHUNK_SIZE])
+
+        ids = list(session.scalars(select(Book.id).where(library_criterion(library_id)).order_by(Book.id)))
+
+    engine.dispose()
+
+    return library_id, ids
+
+
+def summarize(scenario: dict, results: list, seconds: float):
+    durations = collections.defaultdict(list)
+    outcomes = collections.defaultdict(collections.Counter)
+    examples = {}
+    pool_waits = []
+
+    for result in results:
+        for name, values in result["durations"].items():
+            durations[name].extend(values)
+
+        for name, counts in result["outcomes"].items():
+            outcomes[name].update(counts)
+
+        for outcome, example in result["examples"].items():
+            examples.setdefault(outcome, example)
+
+        pool_waits.extend(result["pool_waits"])
+
+    failures = collections.Counter()
+
+    for counts in outcomes.values():
+        failures.update({outcome: count for outcome, count in counts.items() if outcome not in ("ok", "skipped")})
+
+    return {
+        "scenario": scenario,
+        "seconds": seconds,
+        "operations": {
+            name: {
+                "count": len(durations[name]),
+                "skipped": outcomes[name]["skipped"],
+                "ok_per_second": outcomes[name]["ok"] / seconds,
+                "median_ms": percentile(durations[name], 0.5) * 1000,
+                "p95_ms": percentile(durations[name], 0.95) * 1000,
+                "p99_ms": percentile(durations[name], 0.99) * 1000,
+                "failures": {
+                    outcome: count for outcome, count in outcomes[name].items() if outcome not in ("ok", "skipped")
+                },
+            }
+            for name in sorted(outcomes)
+        },
+        "total_ok_per_second": sum(counts["ok"] for counts in outcomes.values()) / seconds,
+        "failures": dict(failures),
+        "examples": examples,
+        "pool_waits": {
+            "median_ms": percentile(pool_waits, 0.5) * 1000,
+            "p95_ms": percentile(pool_waits, 0.95) * 1000,
+            "max_ms": max(pool_waits, default=0.0) * 1000,
+            "over_1_ms": sum(1 for wait in pool_waits if wait > POOL_WAIT_SECONDS),
+        },
+    }
+
+
+def print_summary(summary: dict):
+    scenario = summary["scenario"]
+
+    print(f"{scenario['name']}: {scenario['clients']} clients in {scenario['processes']} process(es), "
+          f"{summary['seconds']:.0f} s, {scenario['books']} books")
+
+    if scenario["description"]:
+        print(f"  {scenario['description']}")
+
+    print(f"  {'operation':<12} {'count':>7} {'skipped':>8} {'ok/s':>8} {'median ms':>10} {'p95 ms':>8} {'p99 ms':>8}  "
+          f"failures")
+
+    for name, operation in summary["operations"].items():
+        failures = ", ".join(f"{count} {outcome}" for outcome, count in sorted(operation["failures"].items()))
+        print(f"  {name:<12} {operation['count']:>7} {operation['skipped']:>8} {operation['ok_per_second']:>8.1f} "
+              f"{operation['median_ms']:>10.2f} {operation['p95_ms']:>8.2f} {operation['p99_ms']:>8.2f}  {failures}")
+
+    failures = summary["failures"]
+
+    print(f"  total {summary['total_ok_per_second']:.1f} ok/s")
+    print("  contention: " + ", ".join(f"{failures.get(outcome, 0)} {outcome}" for outcome in CONTENTION_OUTCOMES))
+
+    pool_waits = summary["pool_waits"]
+
+    print(f"  pool waits: median {pool_waits['median_ms']:.2f} ms, p95 {pool_waits['p95_ms']:.2f} ms, "
+          f"max {pool_waits['max_ms']:.2f} ms, {pool_waits['over_1_ms']} over 1 ms "
+          f"(pool {scenario['pool_size']} + {scenario['max_overflow']} per process)")
+
+    for outcome, example in summary["examples"].items():
+        if outcome not in CONTENTION_OUTCOMES:
+            print(f"  {outcome}: {example}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", help="name of a file of benchmarks/scenarios, or a path")
+    parser.add_argument("--clients", type=int)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seconds", type=float)
+    parser.add_argument("--books", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--url", help="database to use instead of a new SQLite file")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        scenario = load_scenario(args.scenario)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    for name in ("clients", "processes", "seconds", "books", "seed"):
+        if getattr(args, name) is not None:
+            scenario[name] = getattr(args, name)
+
+    url = args.url
+
+    if url is None:
+        path = os.path.join(tempfile.gettempdir(), f"bookworm-load-{scenario['name']}.db")
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+        url = f"sqlite:///{path}"
+
+    library_id, ids = seed_library(scenario, url)
+
+    numbers = list(range(scenario["clients"]))
+    groups = [numbers[process::scenario["processes"]] for process in range(scenario["processes"])]
+
+    if scenario["processes"] == 1:
+        results = run_clients(scenario, url, library_id, ids, numbers)
+    else:
+        # spawn: every process imports db.models, and builds its engine,
+        # afresh.
+        with multiprocessing.get_context("spawn").Pool(scenario["processes"]) as pool:
+            results = [
+                result
+                for process_results in pool.starmap(
+                    run_clients, [(scenario, url, library_id, ids, group) for group in groups]
+                )
+                for result in process_results
+            ]
+
+    summary = summarize(scenario, results, scenario["seconds"])
+
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
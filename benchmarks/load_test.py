@@ -0,0 +1,191 @@
+"""
+    Load test for the HTTP API server.
+
+    Either point it at a running server:
+
+        python -m benchmarks.load_test --url http://127.0.0.1:8080
+
+    or let it seed a temporary SQLite database and start `python -m server`
+    on it:
+
+        python -m benchmarks.load_test --sqlite --books 20000
+
+    Reports requests per second and latency percentiles per endpoint.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.engine import DatabaseConfig, create_async_engine_from_config, prepare_sqlite_schema
+from db.models import Base
+from db.async_repo import AsyncRepo
+
+from .seed import synthetic_books
+
+
+WORKLOAD = [
+    # (weight, name, method, path builder)
+    (40, "list", "GET", lambda: f"/books?page={random.randint(1, 20)}&order={random.choice(['title', '-year', 'author'])}"),
+    (25, "search", "GET", lambda: f"/books/search?field=title&value=Book {random.randint(1, 999)}"),
+    (15, "stats", "GET", lambda: "/stats"),
+    (10, "detail", "GET", lambda: f"/books/{random.randint(1, 1000)}"),
+    (10, "toggle", "PATCH", lambda: "/books/bulk/read-status"),
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+
+    return ordered[index]
+
+
+async def seed_sqlite(database_url, count):
+    engine = create_async_engine_from_config(DatabaseConfig(url=database_url))
+
+    async with engine.begin() as connection:
+        await connection.run_sync(prepare_sqlite_schema, Base.metadata)
+
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    books = synthetic_books(count)
+
+    async with session_factory() as session:
+        repo = AsyncRepo(session)
+
+        for start in range(0, len(books), 5000):
+            await repo.add_books(books[start:start + 5000])
+
+    await engine.dispose()
+
+
+async def wait_until_ready(url, timeout=15):
+    deadline = time.monotonic() + timeout
+
+    async with aiohttp.ClientSession() as client:
+        while time.monotonic() < deadline:
+            try:
+                async with client.get(f"{url}/books?per_page=1") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+
+            await asyncio.sleep(0.2)
+
+    raise RuntimeError(f"Server at {url} did not start in {timeout}s")
+
+
+async def worker(client, url, deadline, latencies, errors):
+    weights = [entry[0] for entry in WORKLOAD]
+    etags = {}
+
+    while time.monotonic() < deadline:
+        _, name, method, build_path = random.choices(WORKLOAD, weights)[0]
+        path = build_path()
+        headers = {"If-None-Match": etags[path]} if path in etags else {}
+        payload = {"ids": [random.randint(1, 1000)], "is_read": random.random() < 0.5} if method == "PATCH" else None
+
+        started = time.perf_counter()
+
+        try:
+            async with client.request(method, url + path, json=payload, headers=headers) as response:
+                await response.read()
+
+                if response.status >= 400:
+                    errors[name] = errors.get(name, 0) + 1
+                elif "ETag" in response.headers:
+                    etags[path] = response.headers["ETag"]
+        except aiohttp.ClientError:
+            errors[name] = errors.get(name, 0) + 1
+            continue
+
+        latencies.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+
+async def run_load(url, concurrency, duration):
+    latencies = {}
+    errors = {}
+    deadline = time.monotonic() + duration
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, url, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def report(latencies, errors, elapsed):
+    all_latencies = [value for values in latencies.values() for value in values]
+
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+
+    for name, values in sorted(latencies.items()) + [("total", all_latencies)]:
+        error_count = sum(errors.values()) if name == "total" else errors.get(name, 0)
+        print(
+            f"{name:<10}{len(values):>10}{error_count:>8}"
+            f"{percentile(values, 0.50):>10.2f}{percentile(values, 0.95):>10.2f}"
+            f"{percentile(values, 0.99):>10.2f}{statistics.fmean(values) if values else 0:>10.2f}"
+        )
+
+    print(f"\n{len(all_latencies) / elapsed:.1f} requests/s over {elapsed:.1f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server")
+    parser.add_argument("--sqlite", action="store_true", help="seed a temporary SQLite database and start a server")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if not args.url and not args.sqlite:
+        sys.exit("Pass --url of a running server or --sqlite")
+
+    server = None
+    url = args.url
+
+    if args.sqlite:
+        directory = tempfile.mkdtemp(prefix="bookworm-load-")
+        database_url = f"sqlite:///{os.path.join(directory, 'load.db')}"
+        asyncio.run(seed_sqlite(database_url, args.books))
+
+        server = subprocess.Popen([
+            sys.executable, "-m", "server",
+            "--database-url", database_url,
+            "--port", str(args.port),
+        ])
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        asyncio.run(wait_until_ready(url))
+        report(*asyncio.run(run_load(url, args.concurrency, args.duration)))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+    Time and memory needed to list books as cards (a frame with a label, a
+    checkbox and three buttons per book) and as rows of the table view.
+
+        python -m benchmarks.render_benchmark --cards 1000 --rows 10000
+
+    Needs a display (on a headless machine run it under xvfb-run). Memory is
+    the growth of the resident set size, which includes Tk's own
+    allocations, next to the Python allocations seen by tracemalloc.
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+def resident_set_size():
+    """
+        Bytes of RAM used by the process, or None where /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def count_widgets(widget):
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+def measure(app, render):
+    """
+        Renders once and returns (seconds, resident bytes, Python bytes,
+        widgets, Tcl commands) added by it.
+    """
+    gc.collect()
+    app.update()
+
+    widgets_before = count_widgets(app)
+    commands_before = len(app.tk.call("info", "commands"))
+    rss_before = resident_set_size()
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    render()
+    app.update_idletasks()
+    seconds = time.perf_counter() - start
+
+    python_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resident_set_size()
+
+    return (
+        seconds,
+        rss_after - rss_before if rss_before is not None else None,
+        python_bytes,
+        count_widgets(app) - widgets_before,
+        len(app.tk.call("info", "commands")) - commands_before,
+    )
+
+
+def report(name, count, seconds, rss, python_bytes, widgets, commands):
+    rss_per_row = f"{rss / count / 1024:.1f} KiB" if rss is not None else "n/a"
+
+    print(f"{name}: {count} books in {seconds * 1000:.0f} ms ({seconds / count * 1e6:.0f} µs per book)")
+    print(f"    per book: {rss_per_row} resident, {python_bytes / count / 1024:.1f} KiB Python, "
+          f"{widgets / count:.1f} widgets, {commands / count:.1f} Tcl commands")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=1000, help="books rendered as cards")
+    parser.add_argument("--rows", type=int, default=10000, help="books rendered as table rows")
+    args = parser.parse_args()
+
+    count = max(args.cards, args.rows)
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-render-{count}.db")
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = f"sqlite:///{path}"
+
+    from db.repo import Repo
+    from .seed import seeded_sqlite_session_factory
+    from ui.app import BookWormApp
+    from ui.result_set import ResultSet
+    from ui.view_models import match_every_book
+
+    print(f"Seeding {count} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, count)
+
+    with session_factory() as session:
+        books = Repo(session).get_books_keyset(limit=count)
+
+    app = BookWormApp()
+    app.withdraw()
+
+    def render_cards():
+        app.add_books_to_scrollable_frame(ResultSet(books[:args.cards], match_every_book))
+
+    def render_rows():
+        app.book_table.show_books(books[:args.rows])
+
+    app.add_books_to_scrollable_frame(ResultSet([], match_every_book))
+    report("Cards", args.cards, *measure(app, render_cards))
+    app.add_books_to_scrollable_frame(ResultSet([], match_every_book))
+
+    report("Table", args.rows, *measure(app, render_rows))
+
+    start = time.perf_counter()
+    app.book_table.reorder(list(reversed(books[:args.rows])))
+    app.update_idletasks()
+    print(f"Table reorder: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    app.unsubscribe_from_changes()
+    app.destroy()
+
+
+if __name__ == "__main__":
+    main()
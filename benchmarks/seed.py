@@ -0,0 +1,57 @@
+"""
+    Synthetic libraries for the benchmarks.
+"""
+from sqlalchemy import delete
+from sqlalchemy.orm import sessionmaker
+
+from db.engine import DatabaseConfig, create_engine_from_config, prepare_sqlite_schema
+from db.models import Base, Book, Tombstone
+from db.repo import Repo
+
+
+GENRES = ["Fantasy", "Sci-Fi", "Dystopian", "Romance", "Horror", "History", "Poetry", "Mystery"]
+
+SEED_CHUNK_SIZE = 5000
+
+
+def synthetic_books(count):
+    return [
+        {
+            "title": f"Book {i}",
+            "author": f"Author {i % 997}",
+            "genre": GENRES[i % len(GENRES)],
+            "year": 1900 + i % 125,
+            "description": f"Synthetic description number {i}",
+            "is_read": i % 3 == 0,
+        }
+        for i in range(count)
+    ]
+
+
+def seeded_sqlite_session_factory(path, count):
+    """
+        Creates (or reuses, when it already holds count books) a SQLite
+        library at path and returns a sessionmaker bound to it.
+    """
+    engine = create_engine_from_config(DatabaseConfig(url=f"sqlite:///{path}"))
+
+    with engine.begin() as connection:
+        prepare_sqlite_schema(connection, Base.metadata)
+
+    session_factory = sessionmaker(bind=engine)
+
+    with session_factory() as session:
+        repo = Repo(session)
+
+        if repo.get_books_count() == count:
+            return session_factory
+
+        session.execute(delete(Book))
+        session.execute(delete(Tombstone))
+        session.commit()
+
+        books = synthetic_books(count)
+        for start in range(0, count, SEED_CHUNK_SIZE):
+            repo.add_books(books[start:start + SEED_CHUNK_SIZE])
+
+    return session_factory
@@ -0,0 +1,126 @@
+"""
+    "Similar books" lookups (db/similarity.py) on a large synthetic library.
+
+        python -m benchmarks.similarity_benchmark --books 500000 --lookups 1000
+
+    Books get random titles, authors, genres and descriptions drawn from a
+    vocabulary with a long tail. The report gives the build time and memory
+    of the index, the latency of a lookup (first one of a book and cached),
+    of adding a book, and how often the top neighbours match a brute-force
+    ranking of every book (the share of the brute-force neighbours'
+    similarity the lookup finds, ties being common).
+"""
+import argparse
+import random
+import resource
+import statistics
+import time
+
+import numpy as np
+
+from db.similarity import SimilarityIndex
+
+
+GENRES = ["Fantasy", "Science Fiction", "Mystery", "Romance", "History", "Biography", "Horror", "Poetry",
+          "Thriller", "Philosophy", "Travel", "Cooking", "Science", "Children", "Drama", "Humor"]
+
+
+def word(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+
+
+def synthetic_books(count, rng):
+    vocabulary = [word(rng) for _ in range(50000)]
+    names = [word(rng).title() for _ in range(5000)]
+
+    def words(number):
+        # Zipf-like: low indexes are far more common.
+        return " ".join(vocabulary[min(int(rng.paretovariate(0.8)) - 1, len(vocabulary) - 1)] for _ in range(number))
+
+    for id in range(1, count + 1):
+        yield (
+            id,
+            words(rng.randint(2, 6)).capitalize(),
+            f"{rng.choice(names)} {rng.choice(names)}",
+            rng.choice(GENRES),
+            words(rng.randint(10, 60)) if rng.random() < 0.8 else None,
+        )
+
+
+def report(name, durations):
+    ordered = sorted(durations)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    print(f"{name:<24} median {statistics.median(ordered) * 1000:7.2f} ms   "
+          f"p95 {p95 * 1000:7.2f} ms   max {ordered[-1] * 1000:7.2f} ms")
+
+
+def brute_force(index, id):
+    """
+        The similarities of the neighbours of id from every row of the
+        index, without postings.
+    """
+    features, weights = index.vector_of(id)
+    dense = dict(zip(features.tolist(), weights.tolist()))
+
+    row_of_entry = np.repeat(np.arange(len(index.ids)), np.diff(index.row_starts))
+    products = np.array([dense.get(feature, 0.0) for feature in index.row_features.tolist()]) * index.row_weights
+    scores = np.bincount(row_of_entry, products, minlength=len(index.ids))
+    scores[index.row_by_id[id]] = 0
+
+    return np.sort(scores)[::-1][:index.neighbours]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=500000, help="books in the synthetic library")
+    parser.add_argument("--lookups", type=int, default=1000, help="lookups measured")
+    parser.add_argument("--checks", type=int, default=10, help="lookups compared to a brute-force ranking")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    books = list(synthetic_books(args.books, rng))
+
+    start = time.perf_counter()
+    index = SimilarityIndex.build(books)
+    print(f"{args.books} books indexed in {time.perf_counter() - start:.1f} s, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    ids = [rng.randrange(1, args.books + 1) for _ in range(args.lookups)]
+
+    first, cached = [], []
+    for id in ids:
+        start = time.perf_counter()
+        index.similar(id)
+        first.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.similar(id)
+        cached.append(time.perf_counter() - start)
+
+    report("lookup", first)
+    report("cached lookup", cached)
+
+    found_share = []
+    for id in rng.sample(range(1, args.books + 1), args.checks):
+        expected = brute_force(index, id)
+        found = [similarity for _, similarity in index.similar(id)]
+
+        found_share.append(sum(found) / max(float(expected.sum()), 1e-12))
+
+    print(f"similarity found vs brute force  {statistics.mean(found_share):.3f}")
+
+    adds = []
+    for id in range(args.books + 1, args.books + 101):
+        _, title, author, genre, description = rng.choice(books)
+
+        start = time.perf_counter()
+        index.add(id, title, author, genre, description)
+        adds.append(time.perf_counter() - start)
+
+    report(f"add ({len(index.cache)} cached)", adds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+    End-to-end latency of the book list without a display: from what the
+    user typed to the text of every row, through the view models the main
+    window binds to its widgets.
+
+        python -m benchmarks.view_model_benchmark --books 20000 --repeat 20
+
+    Each search is run --repeat times; the report gives the median and the
+    95th percentile of the whole pipeline (query, load, row formatting) and
+    of the database part alone, then the same for re-sorting, loading the
+    next page and building the statistics.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+
+SEARCHES = [
+    ("title", ""),
+    ("title", "Book 12"),
+    ("author", "Author 5"),
+    ("genre", "Poetry"),
+    ("year", "1999"),
+    ("everything", "Synthetic 42"),
+]
+
+
+def percentiles(durations):
+    ordered = sorted(durations)
+
+    return statistics.median(ordered) * 1000, ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000
+
+
+def report(name, durations, extra=""):
+    median, p95 = percentiles(durations)
+
+    print(f"{name:<34} median {median:8.2f} ms   p95 {p95:8.2f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20000, help="books in the benchmark library")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of every measurement")
+    parser.add_argument("--limit", type=int, default=2000, help="books loaded per page")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), f"bookworm-view-models-{args.books}.db")
+
+    # db.models builds its engine from the environment when it is imported.
+    os.environ["BOOKWORM_DATABASE_URL"] = f"sqlite:///{path}"
+
+    from .seed import seeded_sqlite_session_factory
+    from ui.view_models import BookListViewModel, SearchViewModel, StatisticsViewModel, card_text, table_row_values
+
+    print(f"Seeding {args.books} books into {path}...")
+    session_factory = seeded_sqlite_session_factory(path, args.books)
+
+    search_model = SearchViewModel(session_factory.kw["bind"].dialect.name)
+    book_list_model = BookListViewModel(session_factory)
+    statistics_model = StatisticsViewModel(session_factory)
+
+    for option, text in SEARCHES:
+        pipeline, loading = [], []
+
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+
+            query = search_model.search(option, text)
+            result_set = book_list_model.load(query, "title", args.limit)
+            loaded = time.perf_counter()
+
+            rows = [card_text(book) for book in result_set.books]
+            end = time.perf_counter()
+
+            pipeline.append(end - start)
+            loading.append(loaded - start)
+
+        report(f"search {option}={text!r}", pipeline, f"   ({len(rows)} rows, load median {percentiles(loading)[0]:.2f} ms)")
+
+    # Only a complete result set is sorted in memory.
+    book_list_model.load(search_model.every_book(), "title", args.books)
+
+    sorting = []
+    for i in range(args.repeat):
+        order = ("-author", "year", "-added_on", "title")[i % 4]
+
+        start = time.perf_counter()
+        book_list_model.sort(order)
+        [table_row_values(book) for book in book_list_model.result_set.books]
+        sorting.append(time.perf_counter() - start)
+
+    report("sort and format rows", sorting, f"   ({len(book_list_model.result_set)} rows)")
+
+    pages = []
+    for _ in range(args.repeat):
+        book_list_model.load(search_model.every_book(), "title", args.limit)
+
+        start = time.perf_counter()
+        added = book_list_model.load_more()
+        [card_text(book) for book in added]
+        pages.append(time.perf_counter() - start)
+
+    report("load the next page", pages, f"   ({len(added)} books)")
+
+    summaries = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        statistics_model.summary()
+        summaries.append(time.perf_counter() - start)
+
+    report("statistics", summaries, "   (first run queries, the rest are cached)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from .repo import Repo
+from .sketches import HyperLogLog, SpaceSaving
+
+
+# Rows the approximate statistics are estimated from.
+SAMPLE_SIZE = 10000
+
+# Half width of a two-sided 95% confidence interval, in standard errors.
+Z_95 = 1.96
+
+PROBE_CHUNK_SIZE = 500
+
+
+def share_margin(hits: int, sampled: int):
+    """
+        Half width of the 95% interval of the share hits / sampled. When
+        none or all of the sample has the property the normal approximation
+        says 0; the rule of three (3 / sampled) is used instead.
+    """
+    if hits in (0, sampled):
+        return 3 / sampled
+
+    share = hits / sampled
+
+    return Z_95 * math.sqrt(share * (1 - share) / sampled)
+
+# The sketches only ever grow (deletes and old values of updated books are
+# not taken out), so they are built again after this many changes relative
+# to the books they counted.
+SKETCH_REBUILD_FRACTION = 0.05
+
+SKETCH_CHUNK_SIZE = 5000
+
+
+class Estimate:
+    """
+        A figure of the approximate statistics: its value, the half width
+        of its 95% confidence interval (0 when exact, None when unknown) and
+        a note on how it was obtained.
+    """
+    def __init__(self, value, margin=None, note: str=None):
+        self.value = value
+        self.margin = margin
+        self.note = note
+
+    def __repr__(self):
+        return f"Estimate({self.value!r}, margin={self.margin!r}, note={self.note!r})"
+
+
+class LibrarySketches:
+    """
+        Distinct counts (HyperLogLog) and most frequent values (SpaceSaving)
+        of the authors and genres, built in one streaming pass and then kept
+        up to date by change events.
+    """
+    def __init__(self, precision: int=12, capacity: int=100):
+        self.distinct_authors = HyperLogLog(precision)
+        self.distinct_genres = HyperLogLog(precision)
+        self.top_authors = SpaceSaving(capacity)
+        self.top_genres = SpaceSaving(capacity)
+
+        self.books_counted = 0
+        self.changes_since_build = 0
+
+    @classmethod
+    def build(cls, session, chunk_size: int=SKETCH_CHUNK_SIZE):
+        sketches = cls()
+
+        for author, genre in Repo(session).stream_column_values(("author", "genre"), chunk_size):
+            sketches.add(author, genre)
+            sketches.books_counted += 1
+
+        return sketches
+
+    def add(self, author: str=None, genre: str=None):
+        if author is not None:
+            self.distinct_authors.add(author)
+            self.top_authors.add(author)
+
+        if genre is not None:
+            self.distinct_genres.add(genre)
+            self.top_genres.add(genre)
+
+    def apply(self, change):
+        if change.op in ("insert", "update"):
+            self.add(change.columns.get("author"), change.columns.get("genre"))
+
+        self.changes_since_build += 1
+
+    @property
+    def stale(self):
+        return self.changes_since_build > SKETCH_REBUILD_FRACTION * max(self.books_counted, 1)
+
+
+def sample_library(repo, sample_size: int=SAMPLE_SIZE, rng=random):
+    """
+        Returns (rows, estimated number of books, margin of that estimate).
+
+        Postgres samples with TABLESAMPLE SYSTEM, sized from the planner's
+        row count. Elsewhere (or before Postgres has a row count) sample_size
+        random ids between the smallest and the largest are looked up
+        through the primary key; the share of ids that exist estimates the
+        number of books. A library with fewer ids than sample_size is read
+        whole and every figure is exact.
+    """
+    planner_count = repo.get_planner_books_count()
+
+    if planner_count:
+        fraction = min(1.0, sample_size / planner_count)
+        rows = repo.sample_books(fraction * 100)
+
+        if fraction == 1.0:
+            return rows, len(rows), 0
+
+        # Every page is in or out independently, so the count of sampled
+        # rows is close to Poisson.
+        return rows, len(rows) / fraction, Z_95 * math.sqrt(max(len(rows), 1)) / fraction
+
+    low, high = repo.get_id_range()
+
+    if low is None:
+        return [], 0, 0
+
+    span = high - low + 1
+
+    if span <= sample_size:
+        ids = list(range(low, high + 1))
+    else:
+        ids = rng.sample(range(low, high + 1), sample_size)
+
+    rows = []
+    for start in range(0, len(ids), PROBE_CHUNK_SIZE):
+        rows.extend(repo.get_sample_rows_by_ids(ids[start:start + PROBE_CHUNK_SIZE]))
+
+    if span <= sample_size:
+        return rows, len(rows), 0
+
+    return rows, span * len(rows) / len(ids), span * share_margin(len(rows), len(ids))
+
+
+def finite_population_correction(sampled: int, total: float):
+    if total <= 1:
+        return 0.0
+
+    return math.sqrt(max(total - sampled, 0) / (total - 1))
+
+
+def proportion_estimate(hits: int, sampled: int, total: float, total_margin: float):
+    """
+        Estimate of how many books share a property hits of the sampled
+        ones have; the margin combines that of the share and that of the
+        number of books.
+    """
+    if not sampled:
+        return Estimate(0, 0)
+
+    share = hits / sampled
+    margin = share_margin(hits, sampled) * finite_population_correction(sampled, total)
+
+    return Estimate(total * share, math.hypot(total * margin, share * total_margin))
+
+
+def approximate_statistics(repo, sketches: LibrarySketches=None, sample_size: int=SAMPLE_SIZE, rng=random):
+    """
+        The figures of the Statistics window as Estimates, from a sample of
+        the books and, when given, the sketches of authors and genres. The
+        sketch based figures are None without them.
+    """
+    rows, total, total_margin = sample_library(repo, sample_size, rng)
+    sampled = len(rows)
+    whole_library = sampled >= total
+
+    month_ago = datetime.now() - timedelta(days=30)
+    dated = [row for row in rows if row.year is not None]
+    years = [row.year for row in dated]
+
+    statistics = {
+        "total_books_count": Estimate(total, total_margin),
+        "read_count": proportion_estimate(sum(1 for row in rows if row.is_read), sampled, total, total_margin),
+        "unread_count": proportion_estimate(sum(1 for row in rows if not row.is_read), sampled, total, total_margin),
+        "books_added_in_the_past_month": proportion_estimate(
+            sum(1 for row in rows if row.added_on is not None and row.added_on >= month_ago),
+            sampled,
+            total,
+            total_margin
+        ),
+        "average_publication_year": Estimate(None),
+        "oldest_book": Estimate(None),
+        "newest_book": Estimate(None),
+        "most_common_genre": None,
+        "most_common_author": None,
+        "distinct_authors": None,
+        "distinct_genres": None,
+    }
+
+    if years:
+        mean = sum(years) / len(years)
+        deviation = math.sqrt(sum((year - mean) ** 2 for year in years) / max(len(years) - 1, 1))
+        correction = finite_population_correction(len(years), total * len(years) / sampled)
+
+        statistics["average_publication_year"] = Estimate(mean, Z_95 * deviation / math.sqrt(len(years)) * correction)
+
+        note = None if whole_library else f"among {sampled:,} sampled books"
+        statistics["oldest_book"] = Estimate(min(dated, key=lambda row: row.year).title, None, note)
+        statistics["newest_book"] = Estimate(max(dated, key=lambda row: row.year).title, None, note)
+
+    if sketches is not None:
+        for name, top in (("most_common_genre", sketches.top_genres), ("most_common_author", sketches.top_authors)):
+            ranked = top.top(1)
+
+            if ranked:
+                value, count, error = ranked[0]
+                statistics[name] = Estimate(value, None, f"{count - error:,} to {count:,} books")
+
+        for name, sketch in (("distinct_authors", sketches.distinct_authors), ("distinct_genres", sketches.distinct_genres)):
+            count = sketch.count()
+            statistics[name] = Estimate(count, Z_95 * sketch.standard_error * count)
+
+    return statistics
@@ -0,0 +1,388 @@
+import asyncio
+
+from sqlalchemy import insert, text
+
+from .changes import queue_changes
+from .models import Book, Tombstone, database_config
+from .repo import library_criterion, libraries_statement, add_library_statement, add_book_statement, \
+    add_books_statement, add_books_rows, value_counts_statement, genres_statement, books_statement, \
+    book_by_title_statement, contain_criterion, books_page_statement, books_keyset_statement, \
+    search_page_statement, stream_books_statement, deferred_values_statement, deferred_values_from_rows, title_rows_by_author_statement, \
+    isbn_criterion, isbn_keys, books_by_isbn_keys_statement, books_by_isbns_from_books, facet_counts_statement, \
+    facet_counts_from_rows, full_text_search_statement, year_edge_statement, books_count_statement, \
+    read_and_unread_count_statements, added_in_the_past_month_statement, most_common_genre_statement, \
+    average_publication_year_statement, planned_rows, PLANNER_STATISTICS_QUERY, PLANNER_ROWS_QUERY, \
+    id_range_statement, sample_books_statement, sample_rows_statement, column_values_statement, \
+    ordered_books_statement, update_values, update_book_statement, update_read_status_statement, \
+    delete_books_statement, tombstone_rows, row_changes
+
+from exceptions import BookDoesNotExistError, StaleBookError
+
+
+class AsyncRepo:
+    """
+        Asyncio counterpart of Repo.
+
+        Every method mirrors the one with the same name in Repo, scoped to
+        a library the same way, and executes the same statement from
+        db.repo, but is awaited on an AsyncSession. A single AsyncSession can only run one
+        statement at a time, so queries that should run side by side go
+        through gather_statistics/load_startup_data, which open one session
+        per query from an async_sessionmaker.
+    """
+    def __init__(self, session, library_id: int=None):
+        self.session = session
+        self.library_id = database_config.library_id if library_id is None else library_id
+        self.scope = library_criterion(self.library_id)
+
+    async def get_libraries(self):
+        return (await self.session.execute(libraries_statement())).scalars().all()
+
+    async def add_library(self, name: str):
+        library_id = await self.session.scalar(add_library_statement(name))
+        await self.session.commit()
+
+        return library_id
+
+    async def add_book(
+        self,
+        title: str,
+        author: str,
+        genre: str,
+        description: str=None,
+        year: int=None,
+        isbn: str=None,
+    ):
+        stmt = add_book_statement(self.library_id, title, author, genre, description, year, isbn)
+
+        rows = (await self.session.execute(stmt)).all()
+
+        queue_changes(self.session, row_changes("insert", rows))
+        await self.session.commit()
+
+    async def get_value_counts(self, name: str):
+        return (await self.session.execute(value_counts_statement(self.scope, name))).all()
+
+    async def get_all_genres(self):
+        result = await self.session.execute(genres_statement(self.scope))
+
+        return result.scalars().all()
+
+    async def filter_by_genre(self, genre):
+        result = await self.session.execute(books_statement(self.scope, Book.genre == genre))
+
+        return result.scalars().all()
+
+    async def get_all_books(self):
+        result = await self.session.execute(books_statement(self.scope))
+
+        return result.scalars().all()
+
+    async def get_book_by_id(self, id: int):
+        result = await self.session.execute(books_statement(self.scope, Book.id == id))
+
+        return result.scalars().first()
+
+    async def get_books_page(self, offset: int, limit: int, order: str=None):
+        result = await self.session.execute(books_page_statement(self.scope, offset, limit, order))
+
+        return result.scalars().all()
+
+    async def get_books_keyset(self, criteria=(), order: str=None, after: Book=None, limit: int=500, deferred=()):
+        result = await self.session.execute(books_keyset_statement(self.scope, criteria, order, after, limit, deferred))
+
+        return result.scalars().all()
+
+    async def search_books_page(self, option: str, value, after_id: int=None, limit: int=500):
+        bind = self.session.get_bind()
+        stmt = search_page_statement(self.scope, bind.dialect.name, option, value, after_id, limit)
+
+        return (await self.session.execute(stmt, bind_arguments={"bind": bind})).scalars().all()
+
+    async def stream_books(self, order: str=None, chunk_size: int=500, criteria=(), limit: int=None, deferred=()):
+        stmt = stream_books_statement(self.scope, order, chunk_size, criteria, limit, deferred)
+
+        result = await self.session.stream_scalars(stmt)
+
+        async for book in result:
+            yield book
+
+    async def get_deferred_values(self, ids: list):
+        return deferred_values_from_rows(await self.session.execute(deferred_values_statement(self.scope, ids)))
+
+    async def get_book_by_title(self, title: str):
+        result = await self.session.execute(book_by_title_statement(self.scope, title))
+
+        return result.scalars().first()
+
+    async def get_books_by_title_contain(self, title: str):
+        result = await self.session.execute(books_statement(self.scope, contain_criterion("title", title)))
+
+        return result.scalars().all()
+
+    async def get_books_by_author_contain(self, author: str):
+        result = await self.session.execute(books_statement(self.scope, contain_criterion("author", author)))
+
+        return result.scalars().all()
+
+    async def get_title_rows_by_author_contain(self, author: str):
+        return (await self.session.execute(title_rows_by_author_statement(self.scope, author))).all()
+
+    async def get_books_by_ids(self, ids: list):
+        return (await self.session.execute(books_statement(self.scope, Book.id.in_(ids)))).scalars().all()
+
+    async def get_books_by_year(self, year: int):
+        result = await self.session.execute(books_statement(self.scope, Book.year == year))
+
+        return result.scalars().all()
+
+    async def get_books_by_genre_contain(self, genre: str):
+        result = await self.session.execute(books_statement(self.scope, contain_criterion("genre", genre)))
+
+        return result.scalars().all()
+
+    async def get_books_by_description_contain(self, description: str):
+        result = await self.session.execute(books_statement(self.scope, contain_criterion("description", description)))
+
+        return result.scalars().all()
+
+    async def get_books_by_isbn_contain(self, isbn: str):
+        result = await self.session.execute(books_statement(self.scope, isbn_criterion(isbn)))
+
+        return result.scalars().all()
+
+    async def get_books_by_isbns(self, isbns: list):
+        keys = isbn_keys(isbns)
+        wanted = {key for key in keys.values() if key is not None}
+
+        books = []
+        if wanted:
+            books = (await self.session.execute(books_by_isbn_keys_statement(self.scope, wanted))).scalars()
+
+        return books_by_isbns_from_books(keys, books)
+
+    async def get_facet_counts(self, criteria=()):
+        return facet_counts_from_rows(await self.session.execute(facet_counts_statement(criteria, (self.scope,))))
+
+    async def full_text_search(self, text_to_search: str):
+        # Built for the dialect of bind: a RoutingSession could send another
+        # execute to a replica of another dialect.
+        bind = self.session.get_bind()
+        stmt = full_text_search_statement(bind.dialect.name, text_to_search).where(self.scope)
+        result = await self.session.execute(stmt, bind_arguments={"bind": bind})
+
+        return result.scalars().all()
+
+    async def oldest_book(self):
+        result = await self.session.execute(year_edge_statement(self.scope, newest=False))
+
+        return result.scalars().first()
+
+    async def newest_book(self):
+        result = await self.session.execute(year_edge_statement(self.scope, newest=True))
+
+        return result.scalars().first()
+
+    async def get_books_count(self):
+        return await self.session.scalar(books_count_statement(self.scope))
+
+    async def get_read_and_unread_count(self):
+        read_count_stmt, unread_count_stmt = read_and_unread_count_statements(self.scope)
+
+        read_count = await self.session.scalar(read_count_stmt)
+        unread_count = await self.session.scalar(unread_count_stmt)
+
+        return read_count, unread_count
+
+    async def get_books_count_added_in_the_past_month(self):
+        return await self.session.scalar(added_in_the_past_month_statement(self.scope))
+
+    async def get_most_common_genre(self):
+        result = await self.session.execute(most_common_genre_statement(self.scope))
+
+        return result.scalars().first()
+
+    async def get_average_publication_year(self):
+        return await self.session.scalar(average_publication_year_statement(self.scope))
+
+    async def get_planner_books_count(self):
+        bind = self.session.get_bind()
+
+        if bind.dialect.name != "postgresql":
+            return None
+
+        analyzed = await self.session.scalar(text(PLANNER_STATISTICS_QUERY), bind_arguments={"bind": bind})
+
+        if not analyzed:
+            return None
+
+        plan = await self.session.scalar(
+            text(PLANNER_ROWS_QUERY), {"library_id": self.library_id}, bind_arguments={"bind": bind}
+        )
+
+        return planned_rows(plan)
+
+    async def get_id_range(self):
+        result = await self.session.execute(id_range_statement(self.scope))
+
+        return tuple(result.one())
+
+    async def sample_books(self, percent: float):
+        result = await self.session.execute(sample_books_statement(self.library_id, percent))
+
+        return result.all()
+
+    async def get_sample_rows_by_ids(self, ids: list):
+        result = await self.session.execute(sample_rows_statement(self.scope, ids))
+
+        return result.all()
+
+    async def stream_column_values(self, names, chunk_size: int=5000):
+        result = await self.session.stream(column_values_statement(self.scope, names, chunk_size))
+
+        async for row in result:
+            yield row
+
+    async def order_by_year(self, ascending):
+        return (await self.session.execute(ordered_books_statement(self.scope, "year", ascending))).scalars().all()
+
+    async def order_by_title(self, ascending):
+        return (await self.session.execute(ordered_books_statement(self.scope, "title", ascending))).scalars().all()
+
+    async def order_by_author(self, ascending):
+        return (await self.session.execute(ordered_books_statement(self.scope, "author", ascending))).scalars().all()
+
+    async def order_by_added_on(self, ascending):
+        return (await self.session.execute(ordered_books_statement(self.scope, "added_on", ascending))).scalars().all()
+
+    async def update_book(self, id, new_title, new_author, new_genre, new_description, new_year, new_isbn,
+                          new_is_read: bool=None, version: int=None):
+        values = update_values(new_title, new_author, new_genre, new_description, new_year, new_isbn, new_is_read)
+
+        return await self._update_book(id, values, version)
+
+    async def update_book_read_status(self, book):
+        """
+            Flips the read status of book, unless someone changed the book
+            since it was read (see update_book()). Returns the new version.
+        """
+        return await self._update_book(book.id, {"is_read": not book.is_read}, book.version)
+
+    async def _update_book(self, id, values: dict, version: int=None):
+        rows = (await self.session.execute(update_book_statement(self.scope, id, values, version))).all()
+
+        if not rows:
+            await self.session.rollback()
+            book = await self.get_book_by_id(id)
+
+            if book is None:
+                raise BookDoesNotExistError
+
+            raise StaleBookError(book)
+
+        queue_changes(self.session, row_changes("update", rows))
+        await self.session.commit()
+
+        return rows[0].version
+
+    async def delete_book_by_title(self, title: str):
+        await self._delete_books(Book.title == title)
+
+
+    async def add_books(self, books: list):
+        if not books:
+            return
+
+        inserted = (await self.session.execute(add_books_statement(), add_books_rows(self.library_id, books))).all()
+
+        queue_changes(self.session, row_changes("insert", inserted))
+        await self.session.commit()
+
+    async def update_books_read_status(self, ids: list, is_read: bool):
+        rows = (await self.session.execute(update_read_status_statement(self.scope, ids, is_read))).all()
+
+        queue_changes(self.session, row_changes("update", rows))
+        await self.session.commit()
+
+        return len(rows)
+
+    async def delete_book_by_id(self, id: int):
+        return len(await self._delete_books(Book.id == id))
+
+    async def delete_books_by_ids(self, ids: list):
+        return len(await self._delete_books(Book.id.in_(ids)))
+
+    async def _delete_books(self, *criteria):
+        """
+            Deletes the matching books and leaves a tombstone for each of
+            them in the same transaction, so replicas can replay the delete.
+            The deleted rows go out in the change events, so listeners can
+            adjust counts without asking the database.
+        """
+        rows = (await self.session.execute(delete_books_statement(self.scope, *criteria))).all()
+        deleted_ids = [row.id for row in rows]
+
+        if deleted_ids:
+            await self.session.execute(insert(Tombstone), tombstone_rows(self.library_id, deleted_ids))
+
+        queue_changes(self.session, row_changes("delete", rows))
+        await self.session.commit()
+
+        return deleted_ids
+
+
+
+async def _run(session_factory, method_name, *args, library_id: int=None):
+    async with session_factory() as session:
+        repo = AsyncRepo(session, library_id)
+
+        return await getattr(repo, method_name)(*args)
+
+
+async def gather_statistics(session_factory, library_id: int=None):
+    """
+        Runs the queries behind the Statistics window of a library
+        concurrently, each one on its own session (and therefore its own
+        connection).
+    """
+    (
+        total_books_count,
+        (read_count, unread_count),
+        most_common_genre,
+        oldest_book,
+        newest_book,
+        average_publication_year,
+        books_added_in_the_past_month,
+    ) = await asyncio.gather(
+        _run(session_factory, "get_books_count", library_id=library_id),
+        _run(session_factory, "get_read_and_unread_count", library_id=library_id),
+        _run(session_factory, "get_most_common_genre", library_id=library_id),
+        _run(session_factory, "oldest_book", library_id=library_id),
+        _run(session_factory, "newest_book", library_id=library_id),
+        _run(session_factory, "get_average_publication_year", library_id=library_id),
+        _run(session_factory, "get_books_count_added_in_the_past_month", library_id=library_id),
+    )
+
+    return {
+        "total_books_count": total_books_count,
+        "read_count": read_count,
+        "unread_count": unread_count,
+        "most_common_genre": most_common_genre,
+        "oldest_book": oldest_book,
+        "newest_book": newest_book,
+        "average_publication_year": average_publication_year,
+        "books_added_in_the_past_month": books_added_in_the_past_month,
+    }
+
+
+async def load_startup_data(session_factory, library_id: int=None):
+    """
+        Loads the genres for the genre combo box and the initial book list
+        at the same time.
+    """
+    genres, books = await asyncio.gather(
+        _run(session_factory, "get_all_genres", library_id=library_id),
+        _run(session_factory, "get_all_books", library_id=library_id),
+    )
+
+    return genres, books
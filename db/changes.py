@@ -0,0 +1,249 @@
+import datetime
+import json
+import select as select_module
+import threading
+
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+
+
+CHANNEL = "book_changes"
+
+# Postgres refuses NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_SIZE = 7500
+
+DATETIME_COLUMNS = ("added_on", "updated_at")
+
+
+class ChangeEvent:
+    """
+        One changed book: its id, the operation ("insert", "update" or
+        "delete"), its library and the values of the columns that changed
+        (every column for inserts and deletes). refetch is set when the
+        values did not fit in a notification and the row has to be read
+        again by id.
+    """
+    def __init__(self, id: int, op: str, columns: dict=None, refetch: bool=False, library_id: int=None):
+        self.id = id
+        self.op = op
+        self.columns = columns or {}
+        self.refetch = refetch
+        self.library_id = library_id
+
+    @classmethod
+    def from_row(cls, op: str, row, column_names=None):
+        values = dict(row._mapping)
+        names = column_names if column_names is not None else values.keys()
+        columns = {name: values[name] for name in names if name not in ("id", "library_id") and name in values}
+
+        return cls(values["id"], op, columns, library_id=values.get("library_id"))
+
+    def to_dict(self):
+        columns = {
+            name: value.isoformat() if isinstance(value, datetime.datetime) else value
+            for name, value in self.columns.items()
+        }
+        data = {"id": self.id, "op": self.op, "columns": columns, "library_id": self.library_id}
+
+        if self.refetch:
+            data["refetch"] = True
+
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        columns = dict(data.get("columns", {}))
+
+        for name in DATETIME_COLUMNS:
+            if columns.get(name):
+                columns[name] = datetime.datetime.fromisoformat(columns[name])
+
+        return cls(data["id"], data["op"], columns, data.get("refetch", False), data.get("library_id"))
+
+    def __repr__(self):
+        return f"ChangeEvent(id={self.id}, op={self.op!r}, columns={sorted(self.columns)})"
+
+
+class ChangeBus:
+    """
+        In-process publish/subscribe of ChangeEvents. Callbacks run on the
+        publishing thread, so UI code should hand events over to its own
+        thread (e.g. through a queue.Queue).
+    """
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for change in events:
+            for callback in subscribers:
+                callback(change)
+
+
+change_bus = ChangeBus()
+
+
+def queue_changes(session, events):
+    """
+        Remembers the events of a write until its transaction commits.
+    """
+    session.info.setdefault(CHANNEL, []).extend(events)
+
+
+def payloads(events):
+    """
+        Packs events into JSON arrays that fit in one notification each.
+    """
+    batch = []
+    size = 2
+
+    for change in events:
+        encoded = json.dumps(change.to_dict())
+
+        if len(encoded) > MAX_PAYLOAD_SIZE:
+            encoded = json.dumps(ChangeEvent(change.id, change.op, {}, True, change.library_id).to_dict())
+
+        if batch and size + len(encoded) + 1 > MAX_PAYLOAD_SIZE:
+            yield "[" + ",".join(batch) + "]"
+            batch, size = [], 2
+
+        batch.append(encoded)
+        size += len(encoded) + 1
+
+    if batch:
+        yield "[" + ",".join(batch) + "]"
+
+
+def channel_of(library_id: int):
+    """
+        The channel of the changes of one library: an app only hears about
+        the books of its own.
+    """
+    return f"{CHANNEL}_{library_id}"
+
+
+def _is_postgres(session):
+    return session.get_bind().dialect.name == "postgresql"
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session):
+    # NOTIFY is transactional: listeners only hear it if the write commits.
+    events = session.info.get(CHANNEL)
+
+    if events and _is_postgres(session):
+        by_library = {}
+        for change in events:
+            by_library.setdefault(change.library_id, []).append(change)
+
+        for library_id, library_events in by_library.items():
+            for payload in payloads(library_events):
+                session.execute(select(func.pg_notify(channel_of(library_id), payload)))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    events = session.info.pop(CHANNEL, None)
+
+    # On Postgres the events come back through PostgresChangeListener.
+    if events and not _is_postgres(session):
+        change_bus.publish(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(CHANNEL, None)
+
+
+class PostgresChangeListener:
+    """
+        LISTENs on the channel of one library on its own connection and
+        publishes what it hears to the in-process ChangeBus. Reconnects with
+        a growing delay if the connection drops.
+    """
+    def __init__(self, engine, library_id: int, bus: ChangeBus=change_bus, poll_seconds: float=1.0):
+        self.engine = engine
+        self.library_id = library_id
+        self.bus = bus
+        self.poll_seconds = poll_seconds
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="book-changes-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = 1
+
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                delay = 1
+            except Exception:
+                self._stop.wait(delay)
+                delay = min(delay * 2, 30)
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"LISTEN {channel_of(self.library_id)}")
+
+            while not self._stop.is_set():
+                ready, _, _ = select_module.select([dbapi_connection], [], [], self.poll_seconds)
+
+                if not ready:
+                    continue
+
+                dbapi_connection.poll()
+
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    self.bus.publish([ChangeEvent.from_dict(data) for data in json.loads(notification.payload)])
+        finally:
+            connection.invalidate()
+
+
+def start_change_listener(engine, library_id: int):
+    """
+        Starts the Postgres listener of the changes of a library when the
+        engine talks to Postgres. For SQLite, Repo writes reach the ChangeBus
+        directly after commit.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+
+    listener = PostgresChangeListener(engine, library_id)
+    listener.start()
+
+    return listener
@@ -0,0 +1,321 @@
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from .models import Book
+from .repo import library_criterion
+
+
+LOAD_CHUNK_SIZE = 10000
+
+NOT_A_TIME = np.datetime64("NaT", "s")
+
+
+class DictionaryColumn:
+    """
+        Dictionary-encoded strings: every distinct value (None included) is
+        stored once in values and the rows hold int32 codes into it.
+    """
+    def __init__(self):
+        self.values = []
+        self.code_by_value = {}
+        self.codes = np.empty(0, dtype=np.int32)
+
+    def encode(self, value):
+        code = self.code_by_value.get(value)
+
+        if code is None:
+            code = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self.code_by_value[value] = code
+
+        return code
+
+    def code_of(self, value):
+        return self.code_by_value.get(value, -1)
+
+    def sort_ranks(self):
+        """
+            Rank of every dictionary entry in alphabetical order (None first),
+            so rows can be sorted with an integer argsort.
+        """
+        order = sorted(range(len(self.values)), key=lambda code: (self.values[code] is not None, self.values[code] or ""))
+        ranks = np.empty(len(self.values), dtype=np.int32)
+        ranks[order] = np.arange(len(self.values), dtype=np.int32)
+
+        return ranks
+
+
+class ColumnStore:
+    """
+        In-memory, column-oriented copy of the books, for interactive sorting,
+        filtering and statistics on large libraries without a round trip.
+
+        year is a float64 array (NaN for no year), added_on a datetime64
+        array, genre, author and title are dictionary encoded, and is_read is
+        a packed bit array. Deleted rows are only flagged dead until
+        compact() drops them. apply() keeps the store current from the
+        ChangeEvents of db/changes.py.
+    """
+    def __init__(self, capacity: int=1024):
+        self.size = 0
+        self.position_by_id = {}
+
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.year = np.full(capacity, np.nan, dtype=np.float64)
+        self.added_on = np.full(capacity, NOT_A_TIME, dtype="datetime64[s]")
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.is_read_bits = np.zeros((capacity + 7) // 8, dtype=np.uint8)
+
+        self.genre = DictionaryColumn()
+        self.author = DictionaryColumn()
+        self.title = DictionaryColumn()
+        for column in (self.genre, self.author, self.title):
+            column.codes = np.zeros(capacity, dtype=np.int32)
+
+        self._ranks = {}
+
+    @classmethod
+    def load(cls, session, library_id: int=None):
+        """
+            Builds the store from one streamed scan of the books of a
+            library, the configured one by default.
+        """
+        stmt = (select(Book.id, Book.title, Book.author, Book.genre, Book.year, Book.is_read, Book.added_on)
+                .where(library_criterion(library_id))
+                .execution_options(yield_per=LOAD_CHUNK_SIZE))
+
+        store = cls()
+
+        for rows in session.execute(stmt).partitions():
+            store.append_rows(rows)
+
+        return store
+
+    def _ensure_capacity(self, needed: int):
+        capacity = len(self.ids)
+
+        if needed <= capacity:
+            return
+
+        new_capacity = max(needed, capacity * 2)
+
+        def grow(array, fill):
+            grown = np.full(new_capacity, fill, dtype=array.dtype)
+            grown[:capacity] = array
+
+            return grown
+
+        self.ids = grow(self.ids, 0)
+        self.year = grow(self.year, np.nan)
+        self.added_on = grow(self.added_on, NOT_A_TIME)
+        self.alive = grow(self.alive, False)
+
+        bits = np.zeros((new_capacity + 7) // 8, dtype=np.uint8)
+        bits[:len(self.is_read_bits)] = self.is_read_bits
+        self.is_read_bits = bits
+
+        for column in (self.genre, self.author, self.title):
+            column.codes = grow(column.codes, 0)
+
+    def append_rows(self, rows):
+        """
+            rows are (id, title, author, genre, year, is_read, added_on)
+            tuples, in the order of load().
+        """
+        rows = list(rows)
+        if not rows:
+            return
+
+        start = self.size
+        end = start + len(rows)
+
+        self._ensure_capacity(end)
+
+        ids, titles, authors, genres, years, is_read, added_on = zip(*rows)
+
+        self.ids[start:end] = ids
+        self.year[start:end] = [np.nan if year is None else year for year in years]
+        self.added_on[start:end] = [NOT_A_TIME if value is None else np.datetime64(value, "s") for value in added_on]
+        self.alive[start:end] = True
+
+        self.title.codes[start:end] = [self.title.encode(value) for value in titles]
+        self.author.codes[start:end] = [self.author.encode(value) for value in authors]
+        self.genre.codes[start:end] = [self.genre.encode(value) for value in genres]
+
+        self.size = end
+
+        # Only the bytes holding the new rows are unpacked and packed again.
+        first_byte, last_byte = start >> 3, (end + 7) >> 3
+        window = np.unpackbits(self.is_read_bits[first_byte:last_byte]).astype(bool)
+        window[start - first_byte * 8:end - first_byte * 8] = is_read
+        self.is_read_bits[first_byte:last_byte] = np.packbits(window)
+
+        for offset, id in enumerate(ids):
+            self.position_by_id[id] = start + offset
+
+    def _set_is_read(self, position: int, value: bool):
+        mask = np.uint8(1 << (7 - (position & 7)))
+
+        if value:
+            self.is_read_bits[position >> 3] |= mask
+        else:
+            self.is_read_bits[position >> 3] &= ~mask
+
+    def is_read(self):
+        return np.unpackbits(self.is_read_bits, count=self.size).astype(bool)
+
+    def apply(self, change):
+        """
+            Applies one ChangeEvent. Returns False when the event does not
+            carry enough to do so (refetch) and the store should be reloaded.
+        """
+        if change.refetch:
+            return False
+
+        position = self.position_by_id.get(change.id)
+
+        if change.op == "delete":
+            if position is not None:
+                self.alive[position] = False
+                del self.position_by_id[change.id]
+        elif change.op == "insert":
+            if position is None:
+                columns = change.columns
+                self.append_rows([(
+                    change.id,
+                    columns.get("title"),
+                    columns.get("author"),
+                    columns.get("genre"),
+                    columns.get("year"),
+                    bool(columns.get("is_read")),
+                    columns.get("added_on"),
+                )])
+        elif position is not None:
+            columns = change.columns
+
+            if "title" in columns:
+                self.title.codes[position] = self.title.encode(columns["title"])
+            if "author" in columns:
+                self.author.codes[position] = self.author.encode(columns["author"])
+            if "genre" in columns:
+                self.genre.codes[position] = self.genre.encode(columns["genre"])
+            if "year" in columns:
+                self.year[position] = np.nan if columns["year"] is None else columns["year"]
+            if "is_read" in columns:
+                self._set_is_read(position, bool(columns["is_read"]))
+
+        return True
+
+    def compact(self):
+        """
+            Drops the rows of deleted books and unused dictionary entries.
+        """
+        keep = np.flatnonzero(self.alive[:self.size])
+        rows = list(zip(
+            self.ids[keep].tolist(),
+            [self.title.values[code] for code in self.title.codes[keep]],
+            [self.author.values[code] for code in self.author.codes[keep]],
+            [self.genre.values[code] for code in self.genre.codes[keep]],
+            [None if np.isnan(year) else int(year) for year in self.year[keep]],
+            self.is_read()[keep].tolist(),
+            [None if np.isnat(value) else value.astype(datetime) for value in self.added_on[keep]],
+        ))
+
+        compacted = ColumnStore(capacity=max(len(rows), 1024))
+        compacted.append_rows(rows)
+
+        self.__dict__.update(compacted.__dict__)
+
+    @property
+    def dead_rows(self):
+        return self.size - len(self.position_by_id)
+
+    def filter(self, genre=None, author=None, is_read=None, year_from=None, year_to=None, added_since=None):
+        """
+            Positions of the live rows matching every given condition.
+        """
+        mask = self.alive[:self.size].copy()
+
+        if genre is not None:
+            mask &= self.genre.codes[:self.size] == self.genre.code_of(genre)
+        if author is not None:
+            mask &= self.author.codes[:self.size] == self.author.code_of(author)
+        if is_read is not None:
+            mask &= self.is_read() == is_read
+        if year_from is not None:
+            mask &= self.year[:self.size] >= year_from
+        if year_to is not None:
+            mask &= self.year[:self.size] <= year_to
+        if added_since is not None:
+            mask &= self.added_on[:self.size] >= np.datetime64(added_since, "s")
+
+        return np.flatnonzero(mask)
+
+    def _dictionary_ranks(self, key, column):
+        # Ranks only change when a new distinct value has been added.
+        ranks = self._ranks.get(key)
+
+        if ranks is None or len(ranks) != len(column.values):
+            ranks = self._ranks[key] = column.sort_ranks()
+
+        return ranks
+
+    def sort(self, positions, key: str, ascending: bool=True):
+        """
+            Reorders positions by title, author, year or added_on. Books
+            without a year or date go last, ties keep id order.
+        """
+        if key in ("title", "author"):
+            column = getattr(self, key)
+            values = self._dictionary_ranks(key, column)[column.codes[positions]].astype(np.float64)
+        elif key == "year":
+            values = self.year[positions]
+        elif key == "added_on":
+            values = self.added_on[positions].astype(np.float64)
+            values[np.isnat(self.added_on[positions])] = np.nan
+        else:
+            raise ValueError(f"Unknown sort key {key!r}")
+
+        if not ascending:
+            values = -values
+
+        missing = np.isnan(values)
+        order = np.lexsort((self.ids[positions], np.where(missing, 0, values), missing))
+
+        return positions[order]
+
+    def book_ids(self, positions):
+        return self.ids[positions].tolist()
+
+    def statistics(self):
+        """
+            The figures of the Statistics window, computed on the arrays.
+        """
+        live = np.flatnonzero(self.alive[:self.size])
+        read = self.is_read()[live]
+        years = self.year[live]
+        has_year = ~np.isnan(years)
+
+        genre_counts = np.bincount(self.genre.codes[live], minlength=len(self.genre.values))
+        month_ago = np.datetime64(datetime.now() - timedelta(days=30), "s")
+
+        if has_year.any():
+            oldest_book = self.title.values[self.title.codes[live[np.nanargmin(years)]]]
+            newest_book = self.title.values[self.title.codes[live[np.nanargmax(years)]]]
+            average_publication_year = float(years[has_year].mean())
+        else:
+            oldest_book = newest_book = average_publication_year = None
+
+        return {
+            "total_books_count": int(len(live)),
+            "read_count": int(read.sum()),
+            "unread_count": int(len(live) - read.sum()),
+            "most_common_genre": self.genre.values[int(genre_counts.argmax())] if len(live) else None,
+            "oldest_book": oldest_book,
+            "newest_book": newest_book,
+            "average_publication_year": average_publication_year,
+            "books_added_in_the_past_month": int((self.added_on[live] >= month_ago).sum()),
+        }
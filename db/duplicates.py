@@ -0,0 +1,385 @@
+"""
+    Duplicate books without comparing every book to every other one.
+
+    Titles and authors are normalized (case, accents, punctuation, articles,
+    order of the author's names). Books with the same normalized title and
+    author are duplicates. Near duplicates ("Harry Potter & the
+    Philosopher's Stone" / "Harry Potter and the Philosophers Stone") are
+    found with MinHash signatures of the title trigrams, split into LSH
+    bands: two titles land in the same bucket of some band with a
+    probability that grows steeply with their trigram similarity, so only
+    the books sharing a bucket are compared, and those whose authors also
+    match are joined into clusters by union-find.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+from .repo import Repo
+
+
+NUM_PERMUTATIONS = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+
+# Trigram Jaccard similarity from which two titles are the same title, and
+# share of (longer than one letter) author names two authors must have in
+# common.
+TITLE_SIMILARITY = 0.7
+AUTHOR_SIMILARITY = 0.5
+
+# The books of a bucket bigger than this (titles sharing only very common
+# trigrams) are sorted by title and compared to their neighbour only.
+MAX_PAIRWISE_BUCKET = 16
+
+# Titles whose signatures are computed in one NumPy pass.
+SIGNATURE_CHUNK_SIZE = 2000
+
+STOP_WORDS = {"the", "a", "an"}
+
+_NOT_A_WORD = re.compile(r"[\W_]+")
+
+_random = np.random.default_rng(20250501)
+_MULTIPLIERS = _random.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_INCREMENTS = _random.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)
+_BAND_MULTIPLIERS = _random.integers(1, 2 ** 63, ROWS_PER_BAND, dtype=np.uint64) | np.uint64(1)
+
+
+def _words(text: str):
+    text = text or ""
+
+    if not text.isascii():
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = "".join(character for character in decomposed if not unicodedata.combining(character))
+
+    return _NOT_A_WORD.sub(" ", text.casefold().replace("&", " and ")).split()
+
+
+def normalize_title(title: str):
+    return " ".join(word for word in _words(title) if word not in STOP_WORDS)
+
+
+def normalize_author(author: str):
+    """
+        The sorted names of the author, so "Orwell, George" is "George
+        Orwell".
+    """
+    return tuple(sorted(_words(author)))
+
+
+def title_trigrams(title: str):
+    padded = f"  {title} "
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def title_similarity(first: str, second: str):
+    if first == second:
+        return 1.0
+
+    first_trigrams, second_trigrams = title_trigrams(first), title_trigrams(second)
+
+    return len(first_trigrams & second_trigrams) / len(first_trigrams | second_trigrams)
+
+
+def authors_match(first: tuple, second: tuple):
+    if first == second:
+        return True
+
+    first_names = {name for name in first if len(name) > 1}
+    second_names = {name for name in second if len(name) > 1}
+
+    if not first_names or not second_names:
+        return False
+
+    return len(first_names & second_names) / len(first_names | second_names) >= AUTHOR_SIMILARITY
+
+
+def title_signatures(titles):
+    """
+        MinHash signatures (len(titles) x NUM_PERMUTATIONS uint32) of the
+        trigrams of normalized titles. The trigrams of a whole chunk are
+        packed into integers from the code points of the joined titles and
+        hashed with every permutation at once; a minimum per title and
+        permutation is taken with reduceat.
+    """
+    signatures = np.empty((len(titles), NUM_PERMUTATIONS), dtype=np.uint32)
+
+    for start in range(0, len(titles), SIGNATURE_CHUNK_SIZE):
+        chunk = titles[start:start + SIGNATURE_CHUNK_SIZE]
+
+        joined = "\x00".join(f"  {title} " for title in chunk)
+        codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+        separators = codes == 0
+        valid = ~(separators[:-2] | separators[1:-1] | separators[2:])
+        title_of_trigram = np.cumsum(separators)[:-2][valid]
+
+        trigrams = ((codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:])[valid]
+
+        # Multiply-shift hashing; the products wrap around modulo 2**64.
+        hashed = (trigrams[:, None] * _MULTIPLIERS[None, :] + _INCREMENTS[None, :]) >> np.uint64(32)
+
+        # Every padded title has at least one trigram.
+        starts = np.flatnonzero(np.r_[True, title_of_trigram[1:] != title_of_trigram[:-1]])
+        signatures[start:start + len(chunk)] = np.minimum.reduceat(hashed, starts, axis=0)
+
+    return signatures
+
+
+def band_hashes(signatures):
+    """
+        One uint64 per LSH band of every signature.
+    """
+    banded = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+
+    return (banded * _BAND_MULTIPLIERS[None, None, :]).sum(axis=2, dtype=np.uint64)
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int):
+        parent = self.parent
+
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
+
+    def union(self, first: int, second: int):
+        first, second = self.find(first), self.find(second)
+
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+class DuplicateIndex:
+    """
+        The normalized titles and authors of the library with their LSH
+        band hashes (plus a hash of the exact key as one more band), sorted
+        per band so a lookup is a binary search.
+
+        Books added afterwards go to a small in-memory delta; deleted books
+        are only marked. compact() folds both into the sorted tables, and
+        clusters() does so before the batch report.
+    """
+    def __init__(self):
+        self.ids = []
+        self.titles = []
+        self.authors = []
+        self.deleted = set()
+        self.row_by_id = {}
+
+        self.hashes = np.empty((0, BANDS + 1), dtype=np.uint64)
+        self.sorted_hashes = []
+        self.sorted_rows = []
+
+        self.delta_hashes = []
+        self.delta_buckets = [{} for _ in range(BANDS + 1)]
+
+    @classmethod
+    def build(cls, rows):
+        """
+            From (id, title, author) rows, e.g. those of
+            Repo.stream_column_values(("id", "title", "author")).
+        """
+        index = cls()
+
+        for id, title, author in rows:
+            index.row_by_id[id] = len(index.ids)
+            index.ids.append(id)
+            index.titles.append(normalize_title(title))
+            index.authors.append(normalize_author(author))
+
+        index.compact()
+
+        return index
+
+    @classmethod
+    def from_session(cls, session, chunk_size: int=5000):
+        return cls.build(Repo(session).stream_column_values(("id", "title", "author"), chunk_size))
+
+    def __len__(self):
+        return len(self.ids) - len(self.deleted)
+
+    def key_hashes(self, rows):
+        signatures = title_signatures([self.titles[row] for row in rows])
+        exact = np.fromiter(
+            (hash((self.titles[row], self.authors[row])) for row in rows),
+            dtype=np.int64,
+            count=len(rows)
+        ).view(np.uint64)
+
+        return np.column_stack((band_hashes(signatures), exact))
+
+    def compact(self):
+        """
+            Hashes the rows build() appended, merges those of add() and sorts
+            every band again.
+        """
+        parts = [self.hashes] + self.delta_hashes
+        hashed_rows = len(self.hashes) + len(self.delta_hashes)
+
+        if hashed_rows < len(self.ids):
+            parts.append(self.key_hashes(list(range(hashed_rows, len(self.ids)))))
+
+        self.hashes = np.concatenate(parts)
+        self.sorted_rows = [np.argsort(self.hashes[:, band], kind="stable") for band in range(BANDS + 1)]
+        self.sorted_hashes = [self.hashes[rows, band] for band, rows in enumerate(self.sorted_rows)]
+
+        self.delta_hashes = []
+        self.delta_buckets = [{} for _ in range(BANDS + 1)]
+
+    def add(self, id: int, title: str, author: str):
+        """
+            Indexes a new book (or the new version of a changed one).
+        """
+        if id in self.row_by_id:
+            self.deleted.add(self.row_by_id[id])
+
+        row = len(self.ids)
+        self.row_by_id[id] = row
+        self.ids.append(id)
+        self.titles.append(normalize_title(title))
+        self.authors.append(normalize_author(author))
+
+        hashes = self.key_hashes([row])
+        self.delta_hashes.append(hashes)
+
+        for band, value in enumerate(hashes[0].tolist()):
+            self.delta_buckets[band].setdefault(value, []).append(row)
+
+    def remove(self, id: int):
+        row = self.row_by_id.pop(id, None)
+
+        if row is not None:
+            self.deleted.add(row)
+
+    def similar(self, first: int, second: int):
+        return authors_match(self.authors[first], self.authors[second]) \
+            and title_similarity(self.titles[first], self.titles[second]) >= TITLE_SIMILARITY
+
+    def candidate_rows(self, hashes):
+        rows = set()
+
+        for band, value in enumerate(hashes):
+            sorted_hashes = self.sorted_hashes[band]
+            start = np.searchsorted(sorted_hashes, value, side="left")
+            end = np.searchsorted(sorted_hashes, value, side="right")
+
+            rows.update(self.sorted_rows[band][start:end].tolist())
+            rows.update(self.delta_buckets[band].get(int(value), ()))
+
+        return rows - self.deleted
+
+    def matches(self, title: str, author: str, exclude_id: int=None):
+        """
+            [(id, title similarity), ...] of the indexed books that are
+            (near) duplicates of a book, most similar first.
+        """
+        normalized_title, normalized_author = normalize_title(title), normalize_author(author)
+
+        signature = title_signatures([normalized_title])
+        exact = np.array([hash((normalized_title, normalized_author))], dtype=np.int64).view(np.uint64)
+        hashes = np.concatenate((band_hashes(signature)[0], exact))
+
+        found = []
+        for row in self.candidate_rows(hashes):
+            if self.ids[row] == exclude_id or not authors_match(normalized_author, self.authors[row]):
+                continue
+
+            similarity = title_similarity(normalized_title, self.titles[row])
+
+            if similarity >= TITLE_SIMILARITY:
+                found.append((self.ids[row], similarity))
+
+        found.sort(key=lambda pair: (-pair[1], pair[0]))
+
+        return found
+
+    def clusters(self):
+        """
+            The ids of every group of two or more duplicate books, biggest
+            group first.
+        """
+        self.compact()
+
+        union_find = UnionFind(len(self.ids))
+
+        for band in range(BANDS + 1):
+            exact = band == BANDS
+            sorted_hashes, sorted_rows = self.sorted_hashes[band], self.sorted_rows[band]
+
+            if len(sorted_hashes) < 2:
+                continue
+
+            boundaries = np.flatnonzero(sorted_hashes[1:] != sorted_hashes[:-1]) + 1
+            starts = np.r_[0, boundaries]
+            ends = np.r_[boundaries, len(sorted_hashes)]
+
+            for start, end in zip(starts[ends - starts > 1].tolist(), ends[ends - starts > 1].tolist()):
+                bucket = [row for row in sorted_rows[start:end].tolist() if row not in self.deleted]
+
+                if len(bucket) < 2:
+                    continue
+
+                if exact:
+                    # Same hash of the key; the keys themselves are compared
+                    # in case of a collision.
+                    first = bucket[0]
+                    for row in bucket[1:]:
+                        if (self.titles[row], self.authors[row]) == (self.titles[first], self.authors[first]):
+                            union_find.union(first, row)
+                elif len(bucket) <= MAX_PAIRWISE_BUCKET:
+                    for i, first in enumerate(bucket):
+                        for second in bucket[i + 1:]:
+                            if union_find.find(first) != union_find.find(second) and self.similar(first, second):
+                                union_find.union(first, second)
+                else:
+                    bucket.sort(key=self.titles.__getitem__)
+
+                    for first, second in zip(bucket, bucket[1:]):
+                        if union_find.find(first) != union_find.find(second) and self.similar(first, second):
+                            union_find.union(first, second)
+
+        groups = {}
+        for row in range(len(self.ids)):
+            if row not in self.deleted:
+                groups.setdefault(union_find.find(row), []).append(row)
+
+        clusters = [sorted(self.ids[row] for row in rows) for rows in groups.values() if len(rows) > 1]
+        clusters.sort(key=lambda ids: (-len(ids), ids[0]))
+
+        return clusters
+
+
+def check_import(index: DuplicateIndex, books):
+    """
+        For books about to be imported (dicts with title and author), the
+        list of (position in books, [ids of duplicates in the library]) and
+        (position, [positions of earlier duplicates in the same import]).
+        The books are not added to index.
+    """
+    in_library = []
+    in_import = []
+
+    batch = DuplicateIndex.build(
+        (position, book.get("title"), book.get("author")) for position, book in enumerate(books)
+    )
+
+    for position, book in enumerate(books):
+        found = [id for id, _ in index.matches(book.get("title"), book.get("author"))]
+
+        if found:
+            in_library.append((position, found))
+
+        earlier = [other for other, _ in batch.matches(book.get("title"), book.get("author"), position) if other < position]
+
+        if earlier:
+            in_import.append((position, sorted(earlier)))
+
+    return in_library, in_import
@@ -0,0 +1,338 @@
+import copy
+import os
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .isbn import backfill_keys
+
+
+DEFAULT_DATABASE_URL = "postgresql+psycopg2://postgres@localhost/book_worm_db"
+
+# The library every install starts with, and the one books written before
+# there were libraries belong to.
+DEFAULT_LIBRARY_ID = 1
+DEFAULT_LIBRARY_NAME = "Main library"
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _env_bool(value: str):
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class DatabaseConfig:
+    """
+        Connection settings for the BookWorm database.
+
+        Read from the environment by from_env():
+
+        BOOKWORM_DATABASE_URL           SQLAlchemy URL (postgresql+psycopg2://... or sqlite:///...)
+        BOOKWORM_POOL_SIZE              connections kept in the pool
+        BOOKWORM_MAX_OVERFLOW           extra connections allowed above the pool size
+        BOOKWORM_POOL_PRE_PING          test connections before handing them out
+        BOOKWORM_POOL_RECYCLE           seconds after which a connection is replaced
+        BOOKWORM_STATEMENT_TIMEOUT_MS   Postgres statement_timeout / SQLite busy_timeout
+        BOOKWORM_SQLITE_MMAP_SIZE       bytes of the SQLite file mapped into memory
+        BOOKWORM_REPLICA_URLS           comma separated URLs of read replicas
+        BOOKWORM_READ_YOUR_WRITES_SECONDS
+                                        how long reads stay on the primary after a write
+        BOOKWORM_LOCAL_REPLICA_PATH     SQLite file holding a local copy of the books
+        BOOKWORM_LOCAL_REPLICA_INTERVAL seconds between two syncs of the local copy
+        BOOKWORM_COLUMN_STORE           keep an in-memory ColumnStore of the books in the app
+        BOOKWORM_APPROXIMATE_STATISTICS open the Statistics window with estimated figures
+        BOOKWORM_LIBRARY_ID             id of the library the app works on
+    """
+    def __init__(
+        self,
+        url: str=DEFAULT_DATABASE_URL,
+        pool_size: int=5,
+        max_overflow: int=10,
+        pool_pre_ping: bool=True,
+        pool_recycle: int=1800,
+        statement_timeout_ms: int=None,
+        sqlite_mmap_size: int=256 * 1024 * 1024,
+        replica_urls: list=None,
+        read_your_writes_seconds: float=5.0,
+        local_replica_path: str=None,
+        local_replica_interval_seconds: float=2.0,
+        column_store: bool=False,
+        approximate_statistics: bool=False,
+        library_id: int=DEFAULT_LIBRARY_ID,
+    ):
+        self.url = url
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self.statement_timeout_ms = statement_timeout_ms
+        self.sqlite_mmap_size = sqlite_mmap_size
+        self.replica_urls = replica_urls or []
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.local_replica_path = local_replica_path
+        self.local_replica_interval_seconds = local_replica_interval_seconds
+        self.column_store = column_store
+        self.approximate_statistics = approximate_statistics
+        self.library_id = library_id
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        config = cls(url=environ.get("BOOKWORM_DATABASE_URL", DEFAULT_DATABASE_URL))
+
+        if "BOOKWORM_POOL_SIZE" in environ:
+            config.pool_size = int(environ["BOOKWORM_POOL_SIZE"])
+        if "BOOKWORM_MAX_OVERFLOW" in environ:
+            config.max_overflow = int(environ["BOOKWORM_MAX_OVERFLOW"])
+        if "BOOKWORM_POOL_PRE_PING" in environ:
+            config.pool_pre_ping = _env_bool(environ["BOOKWORM_POOL_PRE_PING"])
+        if "BOOKWORM_POOL_RECYCLE" in environ:
+            config.pool_recycle = int(environ["BOOKWORM_POOL_RECYCLE"])
+        if "BOOKWORM_STATEMENT_TIMEOUT_MS" in environ:
+            config.statement_timeout_ms = int(environ["BOOKWORM_STATEMENT_TIMEOUT_MS"])
+        if "BOOKWORM_SQLITE_MMAP_SIZE" in environ:
+            config.sqlite_mmap_size = int(environ["BOOKWORM_SQLITE_MMAP_SIZE"])
+        if "BOOKWORM_REPLICA_URLS" in environ:
+            config.replica_urls = [url.strip() for url in environ["BOOKWORM_REPLICA_URLS"].split(",") if url.strip()]
+        if "BOOKWORM_READ_YOUR_WRITES_SECONDS" in environ:
+            config.read_your_writes_seconds = float(environ["BOOKWORM_READ_YOUR_WRITES_SECONDS"])
+        if "BOOKWORM_LOCAL_REPLICA_PATH" in environ:
+            config.local_replica_path = environ["BOOKWORM_LOCAL_REPLICA_PATH"]
+        if "BOOKWORM_LOCAL_REPLICA_INTERVAL" in environ:
+            config.local_replica_interval_seconds = float(environ["BOOKWORM_LOCAL_REPLICA_INTERVAL"])
+        if "BOOKWORM_COLUMN_STORE" in environ:
+            config.column_store = _env_bool(environ["BOOKWORM_COLUMN_STORE"])
+        if "BOOKWORM_APPROXIMATE_STATISTICS" in environ:
+            config.approximate_statistics = _env_bool(environ["BOOKWORM_APPROXIMATE_STATISTICS"])
+        if "BOOKWORM_LIBRARY_ID" in environ:
+            config.library_id = int(environ["BOOKWORM_LIBRARY_ID"])
+
+        return config
+
+    def with_url(self, url: str):
+        """
+            Same settings for another database, e.g. a replica.
+        """
+        config = copy.copy(self)
+        config.url = url
+        config.replica_urls = []
+
+        return config
+
+    @property
+    def is_sqlite(self):
+        return make_url(self.url).get_backend_name() == "sqlite"
+
+    @property
+    def is_memory_sqlite(self):
+        return self.is_sqlite and make_url(self.url).database in (None, "", ":memory:")
+
+    @property
+    def async_url(self):
+        url = make_url(self.url)
+
+        return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+    def pool_options(self):
+        if self.is_memory_sqlite:
+            return {}
+
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_pre_ping": self.pool_pre_ping,
+            "pool_recycle": self.pool_recycle,
+        }
+
+
+def _install_sqlite_pragmas(engine, config: DatabaseConfig):
+    """
+        WAL lets readers run next to the writer, synchronous=NORMAL is safe
+        under WAL and skips an fsync per commit, and mmap_size serves reads
+        straight from the page cache.
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        if not config.is_memory_sqlite:
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(config.sqlite_mmap_size)}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+
+        if config.statement_timeout_ms:
+            cursor.execute(f"PRAGMA busy_timeout={int(config.statement_timeout_ms)}")
+
+        cursor.close()
+
+
+def create_engine_from_config(config: DatabaseConfig=None):
+    config = config or DatabaseConfig.from_env()
+
+    if config.is_sqlite:
+        engine = create_engine(config.url, **config.pool_options())
+        _install_sqlite_pragmas(engine, config)
+
+        return engine
+
+    connect_args = {}
+    if config.statement_timeout_ms:
+        connect_args["options"] = f"-c statement_timeout={int(config.statement_timeout_ms)}"
+
+    return create_engine(config.url, connect_args=connect_args, **config.pool_options())
+
+
+def create_async_engine_from_config(config: DatabaseConfig=None):
+    config = config or DatabaseConfig.from_env()
+
+    if config.is_sqlite:
+        engine = create_async_engine(config.async_url, **config.pool_options())
+        _install_sqlite_pragmas(engine.sync_engine, config)
+
+        return engine
+
+    connect_args = {}
+    if config.statement_timeout_ms:
+        connect_args["server_settings"] = {"statement_timeout": str(int(config.statement_timeout_ms))}
+
+    return create_async_engine(config.async_url, connect_args=connect_args, **config.pool_options())
+
+
+def _add_isbn13_column(connection):
+    """
+        Files created before books.isbn13 existed get the column, filled
+        from the ISBNs already there, and its unique index.
+    """
+    columns = {row[1] for row in connection.execute(text("PRAGMA table_info(books)"))}
+
+    if "isbn13" in columns:
+        return
+
+    connection.execute(text("ALTER TABLE books ADD COLUMN isbn13 INTEGER"))
+
+    rows = connection.execute(text("SELECT id, isbn FROM books WHERE isbn IS NOT NULL ORDER BY id")).all()
+    keys = [{"id": book_id, "key": key} for book_id, key in backfill_keys(rows, set())]
+
+    if keys:
+        connection.execute(text("UPDATE books SET isbn13 = :key WHERE id = :id"), keys)
+
+    connection.execute(text("CREATE UNIQUE INDEX ix_books_isbn13 ON books (isbn13)"))
+
+
+def _add_library_id_column(connection, metadata):
+    """
+        Files created before there were libraries have every book in the
+        default library. Their ISBNs were unique in the whole table, a
+        constraint of the CREATE TABLE that SQLite cannot drop: the table is
+        created again and the books copied over. The FTS5 index and its
+        triggers are dropped with it and created again afterwards.
+    """
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(books)"))]
+
+    if "library_id" in columns:
+        return
+
+    for trigger in ("books_fts_insert", "books_fts_delete", "books_fts_update"):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+
+    connection.execute(text("DROP TABLE IF EXISTS books_fts"))
+    connection.execute(text("ALTER TABLE books RENAME TO books_before_libraries"))
+
+    metadata.tables["books"].create(connection)
+
+    names = ", ".join(columns)
+    connection.execute(text(
+        f"INSERT INTO books (library_id, {names}) SELECT {DEFAULT_LIBRARY_ID}, {names} FROM books_before_libraries"
+    ))
+    connection.execute(text("DROP TABLE books_before_libraries"))
+
+    tombstone_columns = {row[1] for row in connection.execute(text("PRAGMA table_info(tombstones)"))}
+
+    if "library_id" not in tombstone_columns:
+        connection.execute(text(
+            f"ALTER TABLE tombstones ADD COLUMN library_id INTEGER NOT NULL DEFAULT {DEFAULT_LIBRARY_ID}"
+        ))
+
+
+def _add_version_column(connection):
+    """
+        Files created before books.version existed start every book at
+        version 1.
+    """
+    columns = {row[1] for row in connection.execute(text("PRAGMA table_info(books)"))}
+
+    if "version" in columns:
+        return
+
+    connection.execute(text("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def prepare_sqlite_schema(connection, metadata):
+    """
+        SQLite installs are not managed by Alembic: create the tables and the
+        FTS5 index (kept in sync with books by triggers) on first use, and
+        add the columns of later versions to existing files.
+    """
+    metadata.create_all(connection)
+    connection.execute(
+        text("INSERT OR IGNORE INTO libraries (id, name) VALUES (:id, :name)"),
+        {"id": DEFAULT_LIBRARY_ID, "name": DEFAULT_LIBRARY_NAME}
+    )
+
+    _add_isbn13_column(connection)
+    _add_library_id_column(connection, metadata)
+    _add_version_column(connection)
+
+    # Every SQLite index ends with the rowid: this one stands in for the
+    # (library_id, id) primary key of PostgreSQL, for the pages of a
+    # library in id order.
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_books_library_id ON books (library_id)"))
+
+    fts_exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+    ).first()
+
+    if fts_exists:
+        return
+
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE books_fts USING fts5("
+        "title, author, genre, description, isbn, "
+        "content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN "
+        "INSERT INTO books_fts(rowid, title, author, genre, description, isbn) "
+        "VALUES (new.id, new.title, new.author, new.genre, new.description, new.isbn); "
+        "END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title, author, genre, description, isbn) "
+        "VALUES ('delete', old.id, old.title, old.author, old.genre, old.description, old.isbn); "
+        "END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER books_fts_update AFTER UPDATE ON books BEGIN "
+        "INSERT INTO books_fts(books_fts, rowid, title, author, genre, description, isbn) "
+        "VALUES ('delete', old.id, old.title, old.author, old.genre, old.description, old.isbn); "
+        "INSERT INTO books_fts(rowid, title, author, genre, description, isbn) "
+        "VALUES (new.id, new.title, new.author, new.genre, new.description, new.isbn); "
+        "END"
+    ))
+    connection.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def fts_query(text_to_search: str):
+    """
+        Quotes every word so user input cannot inject FTS5 syntax, and makes
+        each one a prefix match.
+    """
+    words = text_to_search.split()
+
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
@@ -0,0 +1,98 @@
+"""
+    ISBN normalization: every ISBN is stored as its ISBN-13 (an ISBN-10 gets
+    the 978 prefix and a new check digit), written as 13 digits in books.isbn
+    and as an integer in books.isbn13, the unique and indexed key exact and
+    batch lookups go through.
+"""
+from exceptions import InvalidISBNError
+
+
+# Characters people and barcode scanners put between the digits.
+SEPARATORS = str.maketrans("", "", "- \t")
+
+
+def isbn10_check_digit(digits: str):
+    total = sum((10 - i) * int(digit) for i, digit in enumerate(digits[:9]))
+    check = (11 - total % 11) % 11
+
+    return "X" if check == 10 else str(check)
+
+
+def isbn13_check_digit(digits: str):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits[:12]))
+
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(text: str):
+    """
+        The 13 digits of the ISBN-13 of an ISBN-10 or ISBN-13 written with or
+        without hyphens and spaces. Raises InvalidISBNError when the text is
+        not an ISBN or its check digit is wrong.
+    """
+    compact = text.translate(SEPARATORS).upper()
+
+    if compact.startswith("ISBN"):
+        compact = compact[4:].lstrip(":")
+
+    if len(compact) == 10 and compact[:9].isdigit() and (compact[9].isdigit() or compact[9] == "X"):
+        if isbn10_check_digit(compact) != compact[9]:
+            raise InvalidISBNError(text)
+
+        compact = "978" + compact[:9]
+
+        return compact + isbn13_check_digit(compact)
+
+    if len(compact) == 13 and compact.isdigit() and compact[:3] in ("978", "979"):
+        if isbn13_check_digit(compact) != compact[12]:
+            raise InvalidISBNError(text)
+
+        return compact
+
+    raise InvalidISBNError(text)
+
+
+def isbn_key(text: str):
+    """
+        The ISBN-13 of text as an integer, the value of books.isbn13.
+    """
+    return int(normalize_isbn(text))
+
+
+def isbn_values(text: str):
+    """
+        {"isbn": ..., "isbn13": ...} to write for an ISBN as typed, both None
+        for no ISBN.
+    """
+    if text is None or not text.strip():
+        return {"isbn": None, "isbn13": None}
+
+    isbn = normalize_isbn(text)
+
+    return {"isbn": isbn, "isbn13": int(isbn)}
+
+
+def try_isbn_key(text: str):
+    """
+        isbn_key(text), or None when text is not a valid ISBN.
+    """
+    try:
+        return isbn_key(text)
+    except InvalidISBNError:
+        return None
+
+
+def backfill_keys(rows, taken: set):
+    """
+        (id, isbn13) for the (id, isbn) rows written before isbn13 existed,
+        in id order. Text that is not a valid ISBN, and a second book with
+        an ISBN already taken, get no key and keep their isbn as it was.
+    """
+    for book_id, isbn in rows:
+        key = try_isbn_key(isbn) if isbn else None
+
+        if key is None or key in taken:
+            continue
+
+        taken.add(key)
+        yield book_id, key
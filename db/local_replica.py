@@ -0,0 +1,309 @@
+import datetime
+import threading
+import time
+
+from sqlalchemy import MetaData, Table, Column, String, select, delete, update, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .engine import DatabaseConfig, DEFAULT_LIBRARY_ID, create_engine_from_config, prepare_sqlite_schema
+from .maintenance import CancelToken, tidy_sqlite
+from .models import Base, Book, Tombstone, Library
+
+
+SYNC_CHUNK_SIZE = 5000
+
+books = Book.__table__
+tombstones = Tombstone.__table__
+libraries = Library.__table__
+
+replica_metadata = MetaData()
+
+replica_state = Table(
+    "replica_state",
+    replica_metadata,
+    Column("key", String(50), primary_key=True),
+    Column("value", String(50), nullable=False),
+)
+
+
+class LocalReplica:
+    """
+        SQLite copy of the books of one library, kept current from the
+        primary.
+
+        The first sync copies every book of the library (and the list of
+        libraries, for its foreign key); a copy of another library is
+        replaced. Later syncs pull the books whose
+        updated_at is at or after the last one seen (minus overlap_seconds,
+        because now() in Postgres is the start of the writing transaction and
+        a slow transaction can commit a timestamp older than the newest one
+        already copied) and replay the tombstones written since the last one
+        seen, again with the tombstones of the last overlap_seconds: their
+        ids follow the order of the inserts, not of the commits. Upserts and
+        deletes make re-reading the overlap harmless.
+
+        Once the first sync has finished, on_ready is called; the app then
+        adds the replica's engine to the ReplicaRouter so reads are served
+        locally while writes keep going to the primary. start() keeps syncing
+        on a background thread and status() reports how far behind the copy
+        is.
+    """
+    def __init__(self, primary_engine, path: str, overlap_seconds: float=60, interval_seconds: float=2,
+                 library_id: int=DEFAULT_LIBRARY_ID):
+        self.primary = primary_engine
+        self.library_id = library_id
+        self.engine = create_engine_from_config(DatabaseConfig(url=f"sqlite:///{path}"))
+        self.overlap_seconds = overlap_seconds
+        self.interval_seconds = interval_seconds
+
+        self.last_synced_at = None
+        self.last_error = None
+        self.syncing = False
+        self.ready = False
+        self.on_ready = None
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        with self.engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+            replica_metadata.create_all(connection)
+
+    @classmethod
+    def from_config(cls, config: DatabaseConfig, primary_engine):
+        """
+            The replica configured by BOOKWORM_LOCAL_REPLICA_PATH, if any.
+        """
+        if not config.local_replica_path or config.is_sqlite:
+            return None
+
+        return cls(
+            primary_engine,
+            config.local_replica_path,
+            interval_seconds=config.local_replica_interval_seconds,
+            library_id=config.library_id,
+        )
+
+    def _read_state(self, connection):
+        return dict(connection.execute(select(replica_state.c.key, replica_state.c.value)).all())
+
+    def _write_state(self, connection, **values):
+        for key, value in values.items():
+            stmt = sqlite_insert(replica_state).values(key=key, value=str(value))
+            connection.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": stmt.excluded.value}))
+
+    def snapshot(self):
+        """
+            Replaces the local copy with every book of the library on the
+            primary.
+        """
+        with self.primary.connect() as source, self.engine.begin() as local:
+            last_tombstone_id, tombstone_watermark = source.execute(
+                select(func.max(tombstones.c.id), func.max(tombstones.c.deleted_at))
+            ).one()
+            watermark = None
+
+            local.execute(delete(books))
+
+            library_rows = [dict(row) for row in source.execute(select(libraries)).mappings()]
+            stmt = sqlite_insert(libraries)
+            local.execute(
+                stmt.on_conflict_do_update(index_elements=[libraries.c.id], set_={"name": stmt.excluded.name}),
+                library_rows
+            )
+
+            result = source.execution_options(yield_per=SYNC_CHUNK_SIZE).execute(
+                select(books).where(books.c.library_id == self.library_id)
+            )
+
+            for rows in result.mappings().partitions():
+                rows = [dict(row) for row in rows]
+                local.execute(books.insert(), rows)
+
+                newest = max(row["updated_at"] for row in rows)
+                watermark = newest if watermark is None else max(watermark, newest)
+
+            self._write_state(
+                local,
+                library_id=self.library_id,
+                watermark=watermark.isoformat() if watermark else "",
+                last_tombstone_id=last_tombstone_id or 0,
+                tombstone_watermark=tombstone_watermark.isoformat() if tombstone_watermark else "",
+            )
+
+    def pull_deltas(self):
+        """
+            Applies the deletes and the changed books since the last sync.
+        """
+        with self.engine.connect() as local:
+            state = self._read_state(local)
+
+        watermark = datetime.datetime.fromisoformat(state["watermark"]) if state.get("watermark") else None
+        last_tombstone_id = int(state.get("last_tombstone_id", 0))
+        tombstone_watermark = datetime.datetime.fromisoformat(state["tombstone_watermark"]) \
+            if state.get("tombstone_watermark") else None
+
+        with self.primary.connect() as source:
+            unseen = tombstones.c.id > last_tombstone_id
+            if tombstone_watermark is not None:
+                unseen = or_(
+                    unseen,
+                    tombstones.c.deleted_at >= tombstone_watermark - datetime.timedelta(seconds=self.overlap_seconds)
+                )
+
+            deleted = source.execute(
+                select(tombstones.c.id, tombstones.c.book_id, tombstones.c.deleted_at)
+                .where(unseen)
+                .order_by(tombstones.c.id)
+            ).all()
+
+            changed_stmt = select(books).where(books.c.library_id == self.library_id).order_by(books.c.updated_at)
+            if watermark is not None:
+                changed_stmt = changed_stmt.where(
+                    books.c.updated_at >= watermark - datetime.timedelta(seconds=self.overlap_seconds)
+                )
+
+            changed = [dict(row) for row in source.execute(changed_stmt).mappings()]
+
+        with self.engine.begin() as local:
+            if deleted:
+                # Tombstones of other libraries name books that are not
+                # here; they only move last_tombstone_id forward.
+                local.execute(delete(books).where(books.c.id.in_([row.book_id for row in deleted])))
+                last_tombstone_id = max(last_tombstone_id, deleted[-1].id)
+
+                newest = max(row.deleted_at for row in deleted)
+                tombstone_watermark = newest if tombstone_watermark is None else max(tombstone_watermark, newest)
+
+            for start in range(0, len(changed), SYNC_CHUNK_SIZE):
+                self._upsert(local, changed[start:start + SYNC_CHUNK_SIZE])
+
+            if changed:
+                watermark = max(watermark or changed[-1]["updated_at"], changed[-1]["updated_at"])
+
+            self._write_state(
+                local,
+                watermark=watermark.isoformat() if watermark else "",
+                last_tombstone_id=last_tombstone_id,
+                tombstone_watermark=tombstone_watermark.isoformat() if tombstone_watermark else "",
+            )
+
+        return len(changed), len(deleted)
+
+    @staticmethod
+    def _upsert(local, rows):
+        ids = [row["id"] for row in rows]
+        isbns = [row["isbn"] for row in rows if row["isbn"]]
+        keys = [row["isbn13"] for row in rows if row["isbn13"] is not None]
+
+        # An ISBN may have moved from a book that has not been synced yet;
+        # release it here, the other book's own delta brings its new value.
+        if isbns:
+            local.execute(
+                update(books)
+                .where(books.c.isbn.in_(isbns), books.c.id.not_in(ids))
+                .values(isbn=None)
+            )
+        if keys:
+            local.execute(
+                update(books)
+                .where(books.c.isbn13.in_(keys), books.c.id.not_in(ids))
+                .values(isbn13=None)
+            )
+
+        stmt = sqlite_insert(books)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[books.c.id],
+            set_={column.name: stmt.excluded[column.name] for column in books.columns if column.name != "id"},
+        )
+        local.execute(stmt, rows)
+
+    def _mark_ready(self):
+        if self.ready:
+            return
+
+        self.ready = True
+
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def sync(self):
+        """
+            Brings the copy up to date. A copy left from an earlier run keeps
+            serving reads while the primary is unreachable.
+        """
+        with self._lock:
+            self.syncing = True
+            has_snapshot = False
+
+            try:
+                with self.engine.connect() as local:
+                    state = self._read_state(local)
+
+                has_snapshot = "watermark" in state and \
+                    int(state.get("library_id", DEFAULT_LIBRARY_ID)) == self.library_id
+
+                if has_snapshot:
+                    self.pull_deltas()
+                else:
+                    self.snapshot()
+
+                self.last_synced_at = time.time()
+                self.last_error = None
+
+                self._mark_ready()
+            except Exception as error:
+                self.last_error = error
+
+                if has_snapshot:
+                    self._mark_ready()
+            finally:
+                self.syncing = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                self.sync()
+                self._stop.wait(self.interval_seconds)
+
+        self._thread = threading.Thread(target=run, name="local-replica-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def tidy(self, token: CancelToken):
+        """
+            tidy_sqlite() on the local copy, between two syncs.
+        """
+        with self._lock:
+            return tidy_sqlite(self.engine, token)
+
+    def lag_seconds(self):
+        if self.last_synced_at is None:
+            return None
+
+        return time.time() - self.last_synced_at
+
+    def status(self):
+        """
+            Short text for the status bar, e.g. "Local copy: synced 3s ago".
+        """
+        lag = self.lag_seconds()
+
+        if self.last_error is not None:
+            state = "offline" if lag is None else f"offline, {lag:.0f}s behind"
+        elif lag is None:
+            state = "syncing..."
+        else:
+            state = f"synced {lag:.0f}s ago"
+
+        return f"Local copy: {state}"
@@ -0,0 +1,123 @@
+"""
+    Database housekeeping run by the maintenance scheduler
+    (ui/maintenance.py): fresh planner statistics for the books table and a
+    tidy SQLite file. Every function takes a CancelToken and stops the
+    statement it is running when the token is cancelled.
+"""
+import contextlib
+import threading
+
+from sqlalchemy import text
+
+
+# A SQLite file is rewritten by VACUUM once this share of its pages is
+# free.
+FREE_PAGES_FRACTION = 0.25
+
+
+class CancelToken:
+    """
+        Cancelled by the scheduler when the user is back or the job's time
+        budget is spent, with the reason why. Jobs check cancelled between
+        steps; on_cancel registers what stops the step in progress.
+    """
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason: str="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback()
+
+    def forget(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+@contextlib.contextmanager
+def interruptible(connection, token: CancelToken):
+    """
+        Lets token interrupt the statements of connection: sqlite3's
+        interrupt() and psycopg2's cancel() may be called from another
+        thread.
+    """
+    dbapi_connection = connection.connection.dbapi_connection
+    interrupt = getattr(dbapi_connection, "interrupt", None) or getattr(dbapi_connection, "cancel", None)
+
+    if interrupt is None:
+        yield
+        return
+
+    token.on_cancel(interrupt)
+
+    try:
+        yield
+    finally:
+        token.forget(interrupt)
+
+
+def analyze_books(engine, token: CancelToken):
+    """
+        Refreshes the planner statistics of the books table, e.g. after a
+        bulk import.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection, \
+            interruptible(connection, token):
+        connection.execute(text("ANALYZE books"))
+
+        if engine.dialect.name == "sqlite":
+            connection.execute(text("PRAGMA optimize"))
+
+
+def tidy_sqlite(engine, token: CancelToken):
+    """
+        Folds the write-ahead log back into the file and rewrites it with
+        VACUUM when too much of it is free. Returns what was done.
+    """
+    done = []
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection, \
+            interruptible(connection, token):
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        done.append("checkpoint")
+
+        if token.cancelled:
+            return done
+
+        page_count = connection.execute(text("PRAGMA page_count")).scalar()
+        free_pages = connection.execute(text("PRAGMA freelist_count")).scalar()
+
+        if page_count and free_pages / page_count >= FREE_PAGES_FRACTION:
+            connection.execute(text("VACUUM"))
+            done.append(f"vacuum ({free_pages} of {page_count} pages free)")
+
+        connection.execute(text("PRAGMA optimize"))
+        done.append("optimize")
+
+    return done
@@ -0,0 +1,530 @@
+"""
+    Helpers for Alembic revisions that change the books table of a large
+    library while the application keeps using it.
+
+    On PostgreSQL every step runs outside the migration's transaction
+    (MigrationContext.autocommit_block), so a lock is held for one
+    statement instead of the whole revision:
+
+    - statements taking a table lock wait at most lock_timeout for it and
+      are retried, with a growing delay, instead of queueing every query of
+      the application behind them;
+    - backfills update BATCH_SIZE rows per statement and log their
+      progress;
+    - indexes are built with CREATE INDEX CONCURRENTLY, unique constraints
+      are added on such an index, and NOT NULL is set after validating a
+      CHECK constraint, so no step scans the table under an exclusive lock.
+
+    A step that has to see the table at rest, e.g. the swap of a copied
+    table, runs after lock(): the lock is held in the migration's own
+    transaction, with the statements of execute(..., locked=True), and
+    released when the revision commits. Such steps come last, since any
+    other step commits that transaction.
+
+    On SQLite the same steps run as plain statements in the migration's
+    transaction.
+
+        with OnlineMigration() as migration:
+            migration.add_column("books", sa.Column("rating", sa.Integer(), nullable=True))
+            migration.backfill("books", "rating = 0", "rating IS NULL")
+            migration.create_index("ix_books_rating", "books", ["rating"])
+
+    Every step is timed and the report is logged when the block ends. With
+    `alembic -x dry_run=true upgrade ...` (or BOOKWORM_MIGRATION_DRY_RUN=1)
+    nothing is changed: each step logs the rows it would go through and an
+    estimate of its duration, and env.py rolls the migration back.
+"""
+import contextlib
+import logging
+import os
+import time
+
+import sqlalchemy as sa
+from alembic import context, op
+
+
+logger = logging.getLogger("alembic.online")
+
+BATCH_SIZE = 5000
+
+LOCK_TIMEOUT = "2s"
+STATEMENT_TIMEOUT = "1min"
+RETRIES = 5
+RETRY_DELAY_SECONDS = 1.0
+
+# Seconds between two progress lines of a backfill.
+PROGRESS_INTERVAL_SECONDS = 10
+
+DRY_RUN_VARIABLE = "BOOKWORM_MIGRATION_DRY_RUN"
+
+# Rough throughput of each kind of step on a PostgreSQL server with SSDs,
+# used by the dry run to estimate durations.
+ROWS_PER_SECOND = {
+    "backfill": 50000,
+    "index": 500000,
+    "validate": 2000000,
+}
+
+# SQLSTATE of "could not obtain lock" (lock_timeout) and of a canceled
+# statement (statement_timeout).
+LOCK_NOT_AVAILABLE = "55P03"
+QUERY_CANCELED = "57014"
+
+
+def is_dry_run():
+    if os.environ.get(DRY_RUN_VARIABLE, "").lower() in ("1", "true", "yes"):
+        return True
+
+    return context.get_x_argument(as_dictionary=True).get("dry_run", "").lower() in ("1", "true", "yes")
+
+
+def error_code(error: sa.exc.DBAPIError):
+    return getattr(error.orig, "pgcode", None)
+
+
+def format_duration(seconds: float):
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+
+    return f"{seconds / 3600:.1f} h"
+
+
+class Step:
+    def __init__(self, name: str, rows: int=0, estimate: float=0.0):
+        self.name = name
+        self.rows = rows
+        self.estimate = estimate
+        self.seconds = None
+        self.retries = 0
+
+
+class OnlineMigration:
+    """
+        The steps of one revision. Used as a context manager, it logs the
+        timing report (or the dry run's estimates) at the end.
+    """
+    def __init__(self, dry_run: bool=None, batch_size: int=BATCH_SIZE, lock_timeout: str=LOCK_TIMEOUT,
+                 statement_timeout: str=STATEMENT_TIMEOUT, retries: int=RETRIES):
+        self.dry_run = is_dry_run() if dry_run is None else dry_run
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.statement_timeout = statement_timeout
+        self.retries = retries
+        self.steps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.report()
+
+    @property
+    def postgresql(self):
+        return op.get_bind().dialect.name == "postgresql"
+
+    @contextlib.contextmanager
+    def outside_transaction(self):
+        if self.postgresql:
+            with op.get_context().autocommit_block():
+                yield
+        else:
+            yield
+
+    @contextlib.contextmanager
+    def timeouts(self, lock_timeout: str=None, statement_timeout: str=None):
+        """
+            Session settings for the statements of the block (autocommit
+            ones, so SET LOCAL would not outlive them).
+        """
+        if not self.postgresql:
+            yield
+            return
+
+        connection = op.get_bind()
+        settings = {"lock_timeout": lock_timeout or "0", "statement_timeout": statement_timeout or "0"}
+
+        for name, value in settings.items():
+            connection.execute(sa.text(f"SET {name} = '{value}'"))
+
+        try:
+            yield
+        finally:
+            for name in settings:
+                connection.execute(sa.text(f"RESET {name}"))
+
+    def table_rows(self, table: str):
+        """
+            The number of rows of table: the planner's estimate on
+            PostgreSQL, so a dry run does not scan it.
+        """
+        connection = op.get_bind()
+
+        if self.postgresql:
+            estimate = connection.execute(
+                sa.text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": table}
+            ).scalar()
+
+            if estimate is not None and estimate >= 0:
+                return estimate
+
+        return connection.execute(sa.text(f"SELECT count(*) FROM {table}")).scalar()
+
+    def table_size(self, table: str):
+        if not self.postgresql:
+            return None
+
+        return op.get_bind().execute(
+            sa.text("SELECT pg_size_pretty(pg_total_relation_size(to_regclass(:table)))"),
+            {"table": table}
+        ).scalar()
+
+    def step(self, name: str, table: str=None, kind: str=None):
+        rows = self.table_rows(table) if table is not None and kind is not None else 0
+        step = Step(name, rows, rows / ROWS_PER_SECOND[kind] if kind is not None else 0.0)
+        self.steps.append(step)
+
+        if self.dry_run:
+            size = self.table_size(table) if table is not None else None
+            logger.info(
+                "Would %s: %s rows%s, about %s",
+                name,
+                f"{rows:,}",
+                f" ({size})" if size else "",
+                format_duration(step.estimate)
+            )
+
+        return step
+
+    def attempt(self, step: Step, function):
+        """
+            Calls function again when it could not get its locks within
+            lock_timeout, waiting longer every time.
+        """
+        delay = RETRY_DELAY_SECONDS
+        failures = 0
+
+        while True:
+            try:
+                return function()
+            except sa.exc.OperationalError as error:
+                failures += 1
+
+                if error_code(error) != LOCK_NOT_AVAILABLE or failures > self.retries:
+                    raise
+
+                step.retries += 1
+                logger.info("%s: lock not available, trying again in %.0f s", step.name, delay)
+                time.sleep(delay)
+                delay *= 2
+
+    def run(self, step: Step, function, lock_timeout: str=None, statement_timeout: str=None, retry: bool=True):
+        """
+            Calls function outside the migration's transaction with the
+            timeouts set, and times it. Steps of many statements pass
+            retry=False and call attempt() for each.
+        """
+        start = time.perf_counter()
+
+        with self.outside_transaction(), self.timeouts(lock_timeout, statement_timeout):
+            result = self.attempt(step, function) if retry else function()
+
+        step.seconds = time.perf_counter() - start
+
+        return result
+
+    def add_column(self, table: str, column: sa.Column):
+        """
+            Adding a nullable column, or one with a constant default, only
+            changes the catalog on PostgreSQL 11 and later: the lock is
+            short, but still has to be obtained.
+        """
+        step = self.step(f"add column {table}.{column.name}")
+
+        if not self.dry_run:
+            self.run(step, lambda: op.add_column(table, column), self.lock_timeout)
+
+    def execute(self, name: str, statement, table: str=None, kind: str=None, locked: bool=False):
+        """
+            Any other statement, with the lock timeout and retries; with
+            locked=True in the migration's transaction, under the lock of
+            lock().
+        """
+        step = self.step(name, table, kind)
+
+        if self.dry_run:
+            return
+
+        if not locked:
+            self.run(step, lambda: op.execute(statement), self.lock_timeout)
+            return
+
+        start = time.perf_counter()
+        result = op.get_bind().execute(sa.text(statement) if isinstance(statement, str) else statement)
+        step.rows = max(result.rowcount, 0)
+        step.seconds = time.perf_counter() - start
+
+    def lock(self, table: str, mode: str="ACCESS EXCLUSIVE"):
+        """
+            LOCK TABLE in the migration's transaction, until the revision
+            commits. It is asked for in a SAVEPOINT under lock_timeout, so it
+            can be asked for again without losing the transaction.
+        """
+        step = self.step(f"lock {table} in {mode.lower()} mode")
+
+        if self.dry_run or not self.postgresql:
+            return
+
+        connection = op.get_bind()
+
+        def lock():
+            with connection.begin_nested():
+                connection.execute(sa.text(f"SET LOCAL lock_timeout = '{self.lock_timeout}'"))
+                connection.execute(sa.text(f"LOCK TABLE {table} IN {mode} MODE"))
+
+        start = time.perf_counter()
+        self.attempt(step, lock)
+        step.seconds = time.perf_counter() - start
+
+    def id_range(self, table: str):
+        return op.get_bind().execute(sa.text(f"SELECT min(id), max(id) FROM {table}")).one()
+
+    def log_progress(self, step: Step, fraction: float, rows: int, start: float):
+        elapsed = time.perf_counter() - start
+
+        logger.info(
+            "%s: %.0f%% done, %s rows, %.0f rows/s",
+            step.name,
+            100 * min(fraction, 1.0),
+            f"{rows:,}",
+            rows / max(elapsed, 1e-9)
+        )
+
+    def backfill(self, table: str, assignments: str, where: str=None, batch_size: int=None):
+        """
+            UPDATE table SET assignments [WHERE where] in batches of ids, each
+            its own transaction, so the assignments must give the same
+            result when run twice. A batch cancelled by statement_timeout is
+            split in two.
+        """
+        step = self.step(f"backfill {table}: SET {assignments}", table, "backfill")
+
+        if self.dry_run:
+            return
+
+        condition = f" AND ({where})" if where else ""
+        statement = sa.text(f"UPDATE {table} SET {assignments} WHERE id >= :low AND id < :high{condition}")
+
+        self.run_id_batches(step, table, statement, batch_size)
+
+    def copy_rows(self, source: str, target: str, columns, values: str=None, batch_size: int=None):
+        """
+            INSERT INTO target (columns) SELECT values FROM source in batches
+            of ids, each its own transaction. Rows already in target are
+            skipped, so an interrupted copy can be run again. values is the
+            select list, the columns by default (e.g. "1, title, ..." to
+            fill a new column).
+        """
+        step = self.step(f"copy {source} to {target}", source, "backfill")
+
+        if self.dry_run:
+            return
+
+        names = ", ".join(columns)
+        statement = sa.text(
+            f"INSERT INTO {target} ({names}) SELECT {values or names} FROM {source} "
+            f"WHERE id >= :low AND id < :high ON CONFLICT DO NOTHING"
+        )
+
+        self.run_id_batches(step, source, statement, batch_size)
+
+    def run_id_batches(self, step: Step, table: str, statement, batch_size: int=None):
+        """
+            Runs statement for every range [low, high) of the ids of table,
+            batch_size ids at a time; a batch cancelled by statement_timeout
+            is split in two.
+        """
+        batch_size = batch_size or self.batch_size
+
+        def run_batches():
+            first, last = self.id_range(table)
+            start = last_progress = time.perf_counter()
+            low, size = first, batch_size
+
+            if first is None:
+                return
+
+            while low <= last:
+                parameters = {"low": low, "high": low + size}
+
+                try:
+                    step.rows += self.attempt(step, lambda: op.get_bind().execute(statement, parameters).rowcount)
+                except sa.exc.OperationalError as error:
+                    if error_code(error) != QUERY_CANCELED or size == 1:
+                        raise
+
+                    size = max(size // 2, 1)
+                    continue
+
+                low += size
+
+                if time.perf_counter() - last_progress >= PROGRESS_INTERVAL_SECONDS:
+                    self.log_progress(step, (low - first) / (last - first + 1), step.rows, start)
+                    last_progress = time.perf_counter()
+
+        step.rows = 0
+        self.run(step, run_batches, self.lock_timeout, self.statement_timeout, retry=False)
+
+    def backfill_rows(self, table: str, columns, compute, batch_size: int=None):
+        """
+            For values computed in Python: compute gets every batch of
+            (id, *columns) rows, in id order, and returns the parameters of
+            "UPDATE table SET name = :name, ... WHERE id = :id" as a list of
+            dicts (an empty one to skip the batch).
+        """
+        step = self.step(f"backfill {table} from {', '.join(columns)}", table, "backfill")
+
+        if self.dry_run:
+            return
+
+        batch_size = batch_size or self.batch_size
+        select = sa.text(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size")
+        total = step.rows
+
+        def run_batches():
+            connection = op.get_bind()
+            start = last_progress = time.perf_counter()
+            last_id, done = 0, 0
+
+            while True:
+                rows = connection.execute(select, {"last_id": last_id, "batch_size": batch_size}).all()
+
+                if not rows:
+                    break
+
+                last_id = rows[-1][0]
+                done += len(rows)
+                parameters = compute(rows)
+
+                if parameters:
+                    names = [name for name in parameters[0] if name != "id"]
+                    assignments = ", ".join(f"{name} = :{name}" for name in names)
+                    update = sa.text(f"UPDATE {table} SET {assignments} WHERE id = :id")
+
+                    self.attempt(step, lambda: connection.execute(update, parameters))
+
+                if time.perf_counter() - last_progress >= PROGRESS_INTERVAL_SECONDS:
+                    self.log_progress(step, done / max(total, 1), done, start)
+                    last_progress = time.perf_counter()
+
+            step.rows = done
+
+        self.run(step, run_batches, self.lock_timeout, self.statement_timeout, retry=False)
+
+    def create_index(self, name: str, table: str, columns, unique: bool=False):
+        """
+            CREATE INDEX CONCURRENTLY on PostgreSQL: writes go on while it is
+            built. A failed build leaves an invalid index behind, which is
+            dropped before the next attempt, also when an earlier run of the
+            migration crashed: IF NOT EXISTS would keep it as it is.
+        """
+        step = self.step(f"create index {name}", table, "index")
+
+        if self.dry_run:
+            return
+
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        columns = ", ".join(columns)
+
+        if not self.postgresql:
+            self.run(step, lambda: op.execute(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})"))
+            return
+
+        def build():
+            if self.index_is_valid(name) is False:
+                logger.info("Dropping the invalid index %s left by an earlier build", name)
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+            try:
+                op.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+            except sa.exc.DBAPIError:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                raise
+
+        # The build does not block writes, so it may wait and take as long
+        # as it needs.
+        self.run(step, build)
+
+    def index_is_valid(self, name: str):
+        """
+            pg_index.indisvalid of the index, None when there is none.
+        """
+        return op.get_bind().execute(
+            sa.text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": name}
+        ).scalar()
+
+    def drop_index(self, name: str):
+        step = self.step(f"drop index {name}")
+
+        if not self.dry_run:
+            concurrently = "CONCURRENTLY " if self.postgresql else ""
+            self.run(step, lambda: op.execute(f"DROP INDEX {concurrently}IF EXISTS {name}"), self.lock_timeout)
+
+    def add_unique_constraint(self, name: str, table: str, columns):
+        """
+            A unique index built concurrently, which becomes the index of the
+            constraint; SQLite gets only the unique index.
+        """
+        self.create_index(name, table, columns, unique=True)
+
+        if self.postgresql:
+            self.execute(f"add constraint {name}", f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
+
+    def set_not_null(self, table: str, column: str):
+        """
+            A CHECK constraint added NOT VALID (no scan) and validated without
+            blocking writes; SET NOT NULL then trusts it instead of scanning
+            the table under an exclusive lock.
+        """
+        if not self.postgresql:
+            step = self.step(f"set {table}.{column} not null")
+
+            def alter():
+                with op.batch_alter_table(table) as batch:
+                    batch.alter_column(column, nullable=False)
+
+            if not self.dry_run:
+                self.run(step, alter)
+
+            return
+
+        check = f"{table}_{column}_not_null"
+
+        self.execute(f"add check {check}", f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID")
+
+        step = self.step(f"validate check {check}", table, "validate")
+        if not self.dry_run:
+            self.run(step, lambda: op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}"))
+
+        self.execute(f"set {table}.{column} not null", f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+        self.execute(f"drop check {check}", f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+
+    def report(self):
+        if self.dry_run:
+            total = sum(step.estimate for step in self.steps)
+            logger.info("Dry run: %d steps, about %s in total", len(self.steps), format_duration(total))
+            return
+
+        for step in self.steps:
+            logger.info(
+                "%-60s %12s rows  %9s  %d retries",
+                step.name,
+                f"{step.rows:,}",
+                format_duration(step.seconds or 0.0),
+                step.retries
+            )
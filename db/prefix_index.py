@@ -0,0 +1,217 @@
+"""
+    In-memory typeahead over the distinct values of a column (authors,
+    genres): every value is reachable by the start of any of its words, and
+    suggestions are ranked by how many books have the value.
+"""
+import bisect
+import heapq
+
+
+SUGGESTION_LIMIT = 8
+
+# Updates only bring the new value of a column, so the old one keeps its
+# count; the index is built again after this many changes relative to the
+# values it counted.
+REBUILD_FRACTION = 0.05
+
+# Ranked suggestions kept per typed prefix; cleared when there are more.
+TOP_CACHE_SIZE = 20000
+
+# warm() ranks the longer prefixes of every prefix matching more keys.
+WARM_RANGE_SIZE = 200
+
+
+def word_keys(value: str):
+    """
+        The casefolded value and every suffix of it that starts a word, so
+        "Tolkien" finds "J. R. R. Tolkien".
+    """
+    folded = value.casefold()
+    keys = [folded]
+
+    for i, character in enumerate(folded):
+        if character == " " and folded[i + 1:].strip() and folded[i + 1] != " ":
+            keys.append(folded[i + 1:])
+
+    return keys
+
+
+class PrefixIndex:
+    """
+        A sorted array of (key, value) pairs searched with bisect, the number
+        of books of every value, and the ranked values of the prefixes typed
+        so far.
+
+        A ranking keeps twice as many values as are suggested, so a change
+        of count re-sorts it in place: a value that grew can only move up,
+        and one that shrank below the last kept value leaves it. Only when
+        fewer than limit values are left is it ranked again from the keys.
+    """
+    def __init__(self, limit: int=SUGGESTION_LIMIT):
+        self.limit = limit
+        self.depth = limit * 2
+        self.counts = {}
+        self.keys = []
+
+        # prefix -> [values ranked, whether they are all the values of the prefix]
+        self.top = {}
+        self.warmed = set()
+        self.typed_prefixes = 0
+
+        self.values_counted = 0
+        self.changes_since_build = 0
+
+    @classmethod
+    def from_counts(cls, counts, limit: int=SUGGESTION_LIMIT):
+        """
+            From (value, number of books) pairs, e.g. Repo.get_value_counts().
+        """
+        index = cls(limit)
+
+        for value, count in counts:
+            if value is None or not value.strip():
+                continue
+
+            index.counts[value] = index.counts.get(value, 0) + count
+            index.values_counted += count
+
+        index.keys = sorted((key, value) for value in index.counts for key in set(word_keys(value)))
+
+        return index
+
+    def rank(self, value: str):
+        return -self.counts[value], value.casefold(), value
+
+    def prefixes(self, value: str):
+        return {key[:end] for key in word_keys(value) for end in range(1, len(key) + 1)}
+
+    def add(self, value: str, count: int=1):
+        if value is None or not value.strip():
+            return
+
+        if value not in self.counts:
+            self.counts[value] = 0
+
+            for key in set(word_keys(value)):
+                bisect.insort(self.keys, (key, value))
+
+        self.counts[value] += count
+
+        for prefix in self.prefixes(value):
+            entry = self.top.get(prefix)
+
+            if entry is None:
+                continue
+
+            ranked, exhaustive = entry
+
+            if value in ranked:
+                ranked.sort(key=self.rank)
+            elif exhaustive or self.rank(value) < self.rank(ranked[-1]):
+                ranked.append(value)
+                ranked.sort(key=self.rank)
+
+                if len(ranked) > self.depth:
+                    del ranked[self.depth:]
+                    entry[1] = False
+
+    def remove(self, value: str, count: int=1):
+        if value not in self.counts:
+            return
+
+        self.counts[value] -= count
+        gone = self.counts[value] <= 0
+
+        for prefix in self.prefixes(value):
+            entry = self.top.get(prefix)
+
+            if entry is None or value not in entry[0]:
+                continue
+
+            ranked, exhaustive = entry
+
+            if gone:
+                ranked.remove(value)
+            else:
+                ranked.sort(key=self.rank)
+
+                # Values that were not kept may now beat it.
+                if not exhaustive and ranked[-1] == value:
+                    ranked.pop()
+
+            if not exhaustive and len(ranked) < self.limit:
+                del self.top[prefix]
+
+        if not gone:
+            return
+
+        del self.counts[value]
+
+        for key in set(word_keys(value)):
+            position = bisect.bisect_left(self.keys, (key, value))
+
+            if position < len(self.keys) and self.keys[position] == (key, value):
+                del self.keys[position]
+
+    def key_range(self, prefix: str):
+        """
+            start, end of the keys starting with prefix.
+        """
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix[:-1] + chr(ord(prefix[-1]) + 1),), start)
+
+        return start, end
+
+    def rank_prefix(self, prefix: str):
+        start, end = self.key_range(prefix)
+        values = {value for _, value in self.keys[start:end]}
+
+        return [heapq.nsmallest(self.depth, values, key=self.rank), len(values) <= self.depth]
+
+    def suggest(self, text: str, limit: int=None):
+        """
+            The most common values with a word starting with text, ignoring
+            case.
+        """
+        prefix = " ".join(text.casefold().split())
+        limit = limit or self.limit
+
+        if not prefix:
+            return []
+
+        entry = self.top.get(prefix)
+
+        if entry is None:
+            # Rankings of typed prefixes are dropped now and then; those of
+            # warm() are kept.
+            if self.typed_prefixes >= TOP_CACHE_SIZE:
+                self.top = {prefix: entry for prefix, entry in self.top.items() if prefix in self.warmed}
+                self.typed_prefixes = 0
+
+            entry = self.top[prefix] = self.rank_prefix(prefix)
+            self.typed_prefixes += 1
+
+        return entry[0][:limit]
+
+    def warm(self):
+        """
+            Ranks ahead of time every prefix matching more than
+            WARM_RANGE_SIZE keys: those are the slow ones to rank on a
+            keystroke. Starts from the first letters and goes one character
+            longer wherever a prefix is that common.
+        """
+        pending = list({key[:1] for key, _ in self.keys})
+
+        while pending:
+            prefix = pending.pop()
+            start, end = self.key_range(prefix)
+
+            self.top[prefix] = self.rank_prefix(prefix)
+            self.warmed.add(prefix)
+
+            if end - start > WARM_RANGE_SIZE:
+                pending.extend({key[:len(prefix) + 1] for key, _ in self.keys[start:end] if len(key) > len(prefix)})
+
+    @property
+    def stale(self):
+        return self.changes_since_build > REBUILD_FRACTION * max(self.values_counted, 1)
@@ -1,14 +1,533 @@
-from sqlalchemy import select, delete, update, insert, func
+import json
 
-from .models import Book
+from sqlalchemy import select, delete, update, insert, func, desc, or_, and_, text, table, column, tablesample, \
+    literal_column, cast, union_all, Integer, String
+from sqlalchemy.orm import defer
+
+from .engine import fts_query
+from .isbn import isbn_values, try_isbn_key, SEPARATORS
+from .changes import ChangeEvent, queue_changes
+from .models import Book, Tombstone, Library, database_config
+
+from exceptions import BookDoesNotExistError, StaleBookError
 
 from datetime import datetime, timedelta
 
 
+ORDER_COLUMNS = {
+    "title": Book.title,
+    "author": Book.author,
+    "year": Book.year,
+    "added_on": Book.added_on,
+}
+
+books_fts = table("books_fts", column("rowid"))
+
+BOOK_COLUMNS = ("title", "author", "genre", "description", "year", "isbn", "is_read")
+
+# Columns the book list does not show; list queries can leave them out and
+# get_deferred_values() fetches them for the books that need them.
+DEFERRED_COLUMNS = ("description",)
+
+# Columns of the sampled rows the approximate statistics are estimated from.
+SAMPLE_COLUMNS = ("title", "author", "genre", "year", "is_read", "added_on")
+
+# How the results of a search break down; see facet_counts_statement().
+FACETS = ("genre", "decade", "is_read")
+
+# Whether books, or one of its partitions, has been analyzed (reltuples is
+# -1, or 0 before PostgreSQL 14, until then), and how many books of a
+# library the planner expects.
+PLANNER_STATISTICS_QUERY = (
+    "SELECT bool_or(reltuples > 0) FROM pg_class WHERE oid = 'books'::regclass "
+    "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'books'::regclass)"
+)
+PLANNER_ROWS_QUERY = "EXPLAIN (FORMAT JSON) SELECT 1 FROM books WHERE library_id = :library_id"
+
+
+def library_criterion(library_id: int=None):
+    """
+        WHERE clause of the books of one library, the configured one
+        (BOOKWORM_LIBRARY_ID) by default. On PostgreSQL it prunes a
+        statement to the partition of the library.
+    """
+    return Book.library_id == (database_config.library_id if library_id is None else library_id)
+
+
+def full_text_search_statement(dialect_name: str, text_to_search: str):
+    """
+        On SQLite the FTS5 index is queried and ranked by bm25; elsewhere
+        every text column is matched with ILIKE.
+    """
+    if dialect_name == "sqlite":
+        return (select(Book)
+                .join(books_fts, books_fts.c.rowid == Book.id)
+                .where(text("books_fts MATCH :query").bindparams(query=fts_query(text_to_search)))
+                .order_by(text("bm25(books_fts)")))
+
+    return select(Book).where(full_text_search_criterion(dialect_name, text_to_search))
+
+
+def full_text_search_criterion(dialect_name: str, text_to_search: str):
+    if dialect_name == "sqlite":
+        return Book.id.in_(
+            select(books_fts.c.rowid)
+            .where(text("books_fts MATCH :query").bindparams(query=fts_query(text_to_search)))
+        )
+
+    pattern = f"%{text_to_search}%"
+
+    return or_(
+        Book.title.ilike(pattern),
+        Book.author.ilike(pattern),
+        Book.genre.ilike(pattern),
+        Book.description.ilike(pattern),
+        Book.isbn.ilike(pattern),
+    )
+
+
+def isbn_criterion(value: str):
+    """
+        A whole valid ISBN, however it is written, is looked up by its
+        ISBN-13 key; anything else matches the stored digits.
+    """
+    key = try_isbn_key(value)
+
+    if key is not None:
+        return Book.isbn13 == key
+
+    return Book.isbn.ilike(f"%{value.translate(SEPARATORS)}%")
+
+
+def search_criterion(dialect_name: str, option: str, value):
+    """
+        WHERE clause of a search of the app ("title", "author", "genre",
+        "year", "description", "isbn", "everything") or of the genre filter
+        ("genre_is"), so the same results can be fetched in another order.
+    """
+    if option == "everything":
+        return full_text_search_criterion(dialect_name, value)
+    if option == "year":
+        return Book.year == value
+    if option == "genre_is":
+        return Book.genre == value
+    if option == "isbn":
+        return isbn_criterion(value)
+
+    return getattr(Book, option).ilike(f"%{value}%")
+
+
+def planned_rows(plan):
+    """
+        The rows expected by an EXPLAIN (FORMAT JSON) plan, which asyncpg
+        returns as text.
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def decade_of(year: int):
+    return year // 10 * 10 if year is not None else None
+
+
+def facet_counts_statement(criteria=(), scope=()):
+    """
+        WITH matching AS (
+            SELECT genre, year / 10 * 10 AS decade, is_read FROM books WHERE {criteria}
+        )
+        SELECT 'genre', genre, NULL, NULL, count(*) FROM matching GROUP BY genre
+        UNION ALL
+        SELECT 'decade', NULL, decade, NULL, count(*) FROM matching GROUP BY decade
+        UNION ALL
+        SELECT 'is_read', NULL, NULL, is_read, count(*) FROM matching GROUP BY is_read;
+
+        Every facet of FACETS in one round trip; the rows of a facet carry
+        its value in its own column, the others are NULL. SQLite has no
+        GROUPING SETS, so the CTE stands in for them on every database: the
+        search predicate is evaluated once. Without criteria (scope, the
+        library, is not one) there is nothing to save and copying every row
+        into the CTE costs more than reading the table three times, so a
+        plain subquery is used. The
+        facet names are inlined: asyncpg cannot type an untyped parameter in
+        a UNION.
+    """
+    matching = select(
+        Book.genre,
+        (Book.year // 10 * 10).label("decade"),
+        Book.is_read,
+    ).where(*scope, *criteria)
+    matching = matching.cte("matching") if criteria else matching.subquery("matching")
+
+    count = func.count().label("books")
+
+    return union_all(
+        select(
+            literal_column("'genre'", String).label("facet"),
+            matching.c.genre,
+            cast(None, Integer).label("decade"),
+            cast(None, Book.is_read.type).label("is_read"),
+            count,
+        ).group_by(matching.c.genre),
+        select(
+            literal_column("'decade'", String),
+            cast(None, Book.genre.type),
+            matching.c.decade,
+            cast(None, Book.is_read.type),
+            count,
+        ).group_by(matching.c.decade),
+        select(
+            literal_column("'is_read'", String),
+            cast(None, Book.genre.type),
+            cast(None, Integer),
+            matching.c.is_read,
+            count,
+        ).group_by(matching.c.is_read),
+    )
+
+
+def facet_counts_from_rows(rows):
+    """
+        {facet: {value: number of books}}; None stands for no genre or no
+        year.
+    """
+    counts = {facet: {} for facet in FACETS}
+
+    for row in rows:
+        counts[row.facet][getattr(row, row.facet)] = row.books
+
+    return counts
+
+
+def facet_criterion(facet: str, value):
+    """
+        WHERE clause of a refinement: the books of one value of a facet.
+    """
+    if facet == "genre":
+        return Book.genre.is_(None) if value is None else Book.genre == value
+    if facet == "decade":
+        return Book.year.is_(None) if value is None else Book.year.between(value, value + 9)
+    if facet == "is_read":
+        return Book.is_read == value
+
+    raise ValueError(f"Unknown facet {facet!r}")
+
+
+def book_row(book: dict):
+    """
+        The column values to insert for a dict with the keys of
+        BOOK_COLUMNS, with its ISBN normalized.
+    """
+    row = {key: book.get(key) for key in BOOK_COLUMNS if key in book}
+
+    if "isbn" in row:
+        row.update(isbn_values(row["isbn"]))
+
+    return row
+
+
+def order_clause(order: str=None):
+    """
+        Turns "title" / "-title" style order keys into ORDER BY clauses.
+        The id is always appended so that pages are stable, and books
+        without a value go last in both directions on every database.
+    """
+    if not order:
+        return (Book.id.asc(),)
+
+    column = ORDER_COLUMNS[order.lstrip("-")]
+
+    if order.startswith("-"):
+        return column.desc().nulls_last(), Book.id.desc()
+
+    return column.asc().nulls_last(), Book.id.asc()
+
+
+def keyset_criterion(order: str, after: Book):
+    """
+        WHERE clause selecting the books that come after the given one in
+        order_clause(order), so the next page starts where the last one
+        ended instead of counting an OFFSET.
+    """
+    descending = bool(order) and order.startswith("-")
+    after_id = Book.id < after.id if descending else Book.id > after.id
+
+    if not order:
+        return after_id
+
+    column = ORDER_COLUMNS[order.lstrip("-")]
+    value = getattr(after, order.lstrip("-"))
+
+    if value is None:
+        return and_(column.is_(None), after_id)
+
+    return or_(
+        column < value if descending else column > value,
+        and_(column == value, after_id),
+        column.is_(None),
+    )
+
+
+# The statements of Repo and AsyncRepo. Both build every statement here and
+# differ only in how they execute it; scope is the library_criterion() of the
+# repo.
+
+
+def libraries_statement():
+    return select(Library).order_by(Library.id)
+
+
+def add_library_statement(name: str):
+    return insert(Library).values(name=name).returning(Library.id)
+
+
+def add_book_statement(library_id: int, title: str, author: str, genre: str, description: str=None,
+                       year: int=None, isbn: str=None):
+    return insert(Book).values(
+        library_id=library_id,
+        title=title,
+        author=author,
+        genre=genre,
+        description=description,
+        year=year,
+        **isbn_values(isbn),
+    ).returning(*Book.__table__.columns)
+
+
+def add_books_statement():
+    """
+        Executed with the rows of add_books_rows().
+    """
+    return insert(Book).returning(*Book.__table__.columns)
+
+
+def add_books_rows(library_id: int, books: list):
+    return [dict(book_row(book), library_id=library_id) for book in books]
+
+
+def value_counts_statement(scope, name: str):
+    column = getattr(Book, name)
+
+    return select(column, func.count()).where(scope, column.is_not(None)).group_by(column)
+
+
+def genres_statement(scope):
+    return select(Book.genre).where(scope).distinct()
+
+
+def books_statement(scope, *criteria):
+    return select(Book).where(scope, *criteria)
+
+
+def book_by_title_statement(scope, title: str):
+    return select(Book).where(scope, Book.title == title).limit(1)
+
+
+def contain_criterion(name: str, value: str):
+    return getattr(Book, name).ilike(f"%{value}%")
+
+
+def books_page_statement(scope, offset: int, limit: int, order: str=None):
+    return select(Book).where(scope).order_by(*order_clause(order)).offset(offset).limit(limit)
+
+
+def books_keyset_statement(scope, criteria=(), order: str=None, after: Book=None, limit: int=500, deferred=()):
+    stmt = select(Book).where(scope, *criteria).options(*[defer(getattr(Book, name)) for name in deferred])
+
+    if after is not None:
+        stmt = stmt.where(keyset_criterion(order, after))
+
+    return stmt.order_by(*order_clause(order)).limit(limit)
+
+
+def search_page_statement(scope, dialect_name: str, option: str, value, after_id: int=None, limit: int=500):
+    """
+        A page of a search (see search_criterion()) in id order: the limit
+        matching books after after_id, of every book when value is None.
+    """
+    criteria = () if value is None else (search_criterion(dialect_name, option, value),)
+    stmt = select(Book).where(scope, *criteria)
+
+    if after_id is not None:
+        stmt = stmt.where(Book.id > after_id)
+
+    return stmt.order_by(Book.id).limit(limit)
+
+
+def stream_books_statement(scope, order: str=None, chunk_size: int=500, criteria=(), limit: int=None, deferred=()):
+    return (select(Book)
+            .where(scope, *criteria)
+            .options(*[defer(getattr(Book, name)) for name in deferred])
+            .order_by(*order_clause(order))
+            .limit(limit)
+            .execution_options(yield_per=chunk_size))
+
+
+def deferred_values_statement(scope, ids: list):
+    return select(Book.id, *[getattr(Book, name) for name in DEFERRED_COLUMNS]).where(scope, Book.id.in_(ids))
+
+
+def deferred_values_from_rows(rows):
+    return {row.id: {name: getattr(row, name) for name in DEFERRED_COLUMNS} for row in rows}
+
+
+def title_rows_by_author_statement(scope, author: str):
+    return select(Book.id, Book.title, Book.author).where(scope, contain_criterion("author", author))
+
+
+def isbn_keys(isbns: list):
+    """
+        {isbn as given: its ISBN-13 key, or None when it is invalid}.
+    """
+    return {isbn: try_isbn_key(isbn) for isbn in isbns}
+
+
+def books_by_isbn_keys_statement(scope, keys):
+    return select(Book).where(scope, Book.isbn13.in_(keys))
+
+
+def books_by_isbns_from_books(keys: dict, books):
+    by_key = {book.isbn13: book for book in books}
+
+    return {isbn: by_key.get(key) for isbn, key in keys.items()}
+
+
+def year_edge_statement(scope, newest: bool):
+    """
+        The title of the oldest book with a year, or of the newest one.
+    """
+    return (select(Book.title)
+            .where(scope, Book.year.is_not(None))
+            .order_by(Book.year.desc() if newest else Book.year)
+            .limit(1))
+
+
+def books_count_statement(scope, *criteria):
+    return select(func.count(Book.id)).where(scope, *criteria)
+
+
+def read_and_unread_count_statements(scope):
+    return books_count_statement(scope, Book.is_read == True), books_count_statement(scope, Book.is_read == False)
+
+
+def added_in_the_past_month_statement(scope):
+    one_month_ago = datetime.now() - timedelta(days=30)
+
+    return books_count_statement(scope, Book.added_on >= one_month_ago)
+
+
+def most_common_genre_statement(scope):
+    return (select(Book.genre, func.count(Book.id).label("count_of_genre"))
+            .where(scope)
+            .group_by(Book.genre)
+            .order_by(desc("count_of_genre"))
+            .limit(1))
+
+
+def average_publication_year_statement(scope):
+    return select(func.avg(Book.year)).where(scope)
+
+
+def id_range_statement(scope):
+    return select(func.min(Book.id), func.max(Book.id)).where(scope)
+
+
+def sample_books_statement(library_id: int, percent: float):
+    sampled = tablesample(Book.__table__, func.system(percent))
+
+    return select(*[sampled.c[name] for name in SAMPLE_COLUMNS]).where(sampled.c.library_id == library_id)
+
+
+def sample_rows_statement(scope, ids: list):
+    return select(*[getattr(Book, name) for name in SAMPLE_COLUMNS]).where(scope, Book.id.in_(ids))
+
+
+def column_values_statement(scope, names, chunk_size: int=5000):
+    return (select(*[getattr(Book, name) for name in names])
+            .where(scope)
+            .execution_options(yield_per=chunk_size))
+
+
+def ordered_books_statement(scope, name: str, ascending: bool):
+    column = getattr(Book, name)
+
+    return select(Book).where(scope).order_by(column.asc() if ascending else column.desc())
+
+
+def update_values(new_title, new_author, new_genre, new_description, new_year, new_isbn, new_is_read: bool=None):
+    """
+        The columns update_book() changes: the fields that were given.
+    """
+    values = {}
+    if new_title: values["title"] = new_title
+    if new_author: values["author"] = new_author
+    if new_genre: values["genre"] = new_genre
+    if new_description: values["description"] = new_description
+    if new_year: values["year"] = new_year
+    if new_isbn: values.update(isbn_values(new_isbn))
+    if new_is_read is not None: values["is_read"] = bool(new_is_read)
+
+    return values
+
+
+def update_book_statement(scope, id, values: dict, version: int=None):
+    """
+        Bumps the version along with values, and matches nothing when a
+        version is given and the book no longer has it.
+    """
+    criteria = [Book.id == id] if version is None else [Book.id == id, Book.version == version]
+
+    return (update(Book)
+            .where(scope, *criteria)
+            .values(version=Book.version + 1, **values)
+            .returning(Book.id, Book.library_id, Book.version, Book.updated_at,
+                       *[getattr(Book, name) for name in values]))
+
+
+def update_read_status_statement(scope, ids: list, is_read: bool):
+    return (update(Book)
+            .where(scope, Book.id.in_(ids))
+            .values(is_read=is_read, version=Book.version + 1)
+            .returning(Book.id, Book.library_id, Book.is_read, Book.version, Book.updated_at))
+
+
+def delete_books_statement(scope, *criteria):
+    return delete(Book).where(scope, *criteria).returning(*Book.__table__.columns)
+
+
+def tombstone_rows(library_id: int, ids: list):
+    return [{"library_id": library_id, "book_id": id} for id in ids]
+
+
+def row_changes(op: str, rows):
+    return [ChangeEvent.from_row(op, row) for row in rows]
+
 
 class Repo:
-    def __init__(self, session):
+    """
+        The queries of one library, the configured one by default: every
+        statement is restricted to its books, which prunes it to the
+        partition of the library on PostgreSQL, and books are added to it.
+        Only get_libraries() and add_library() see every library.
+    """
+    def __init__(self, session, library_id: int=None):
         self.session = session
+        self.library_id = database_config.library_id if library_id is None else library_id
+        self.scope = library_criterion(self.library_id)
+
+    def get_libraries(self):
+        return self.session.execute(libraries_statement()).scalars().all()
+
+    def add_library(self, name: str):
+        """
+            Creates a library and returns its id. On PostgreSQL its books go
+            to one of the existing hash partitions: no table is created.
+        """
+        library_id = self.session.scalar(add_library_statement(name))
+        self.session.commit()
+
+        return library_id
 
     def add_book(
         self,
@@ -35,29 +554,33 @@ class Repo:
                 *isbn given(if needed)*
                 );
         """
-        stmt = insert(Book).values(
-            title=title,
-            author=author,
-            genre=genre,
-            description=description,
-            year=year,
-            isbn=isbn,
-        )
+        stmt = add_book_statement(self.library_id, title, author, genre, description, year, isbn)
 
-        self.session.execute(stmt)
+        rows = self.session.execute(stmt).all()
+
+        queue_changes(self.session, row_changes("insert", rows))
         self.session.commit()
 
-    def get_all_genres(self):
-        stmt = select(Book.genre).distinct(Book.genre)
+    def get_value_counts(self, name: str):
+        """
+            SELECT
+                {name}, count(*)
+            FROM
+                books
+            WHERE
+                {name} IS NOT NULL
+            GROUP BY
+                {name};
+        """
+        return self.session.execute(value_counts_statement(self.scope, name)).all()
 
-        result = self.session.execute(stmt)
+    def get_all_genres(self):
+        result = self.session.execute(genres_statement(self.scope))
 
         return result.scalars().all()
 
     def filter_by_genre(self, genre):
-        stmt = select(Book).where(Book.genre == genre)
-
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, Book.genre == genre))
 
         return result.scalars().all()
 
@@ -68,12 +591,82 @@ class Repo:
             Query:
             SELECT * FROM books;
         """
-        stmt = select(Book)
+        result = self.session.execute(books_statement(self.scope))
 
-        result = self.session.execute(stmt)
+        return result.scalars().all()
+
+    def get_book_by_id(self, id: int):
+        result = self.session.execute(books_statement(self.scope, Book.id == id))
+
+        return result.scalars().first()
+
+    def get_books_page(self, offset: int, limit: int, order: str=None):
+        """
+            SELECT
+                *
+            FROM
+                books
+            ORDER BY
+                {order}, id
+            LIMIT
+                {limit}
+            OFFSET
+                {offset};
+        """
+        result = self.session.execute(books_page_statement(self.scope, offset, limit, order))
 
         return result.scalars().all()
 
+    def get_books_keyset(self, criteria=(), order: str=None, after: Book=None, limit: int=500, deferred=()):
+        """
+            SELECT
+                *
+            FROM
+                books
+            WHERE
+                {criteria} AND ({order}, id) come after {after}
+            ORDER BY
+                {order}, id
+            LIMIT
+                {limit};
+        """
+        result = self.session.execute(books_keyset_statement(self.scope, criteria, order, after, limit, deferred))
+
+        return result.scalars().all()
+
+    def search_books_page(self, option: str, value, after_id: int=None, limit: int=500):
+        """
+            SELECT
+                *
+            FROM
+                books
+            WHERE
+                {search} AND id > {after_id}
+            ORDER BY
+                id
+            LIMIT
+                {limit};
+        """
+        # Built for the dialect of bind, as in full_text_search().
+        bind = self.session.get_bind()
+        stmt = search_page_statement(self.scope, bind.dialect.name, option, value, after_id, limit)
+
+        return self.session.execute(stmt, bind_arguments={"bind": bind}).scalars().all()
+
+    def stream_books(self, order: str=None, chunk_size: int=500, criteria=(), limit: int=None, deferred=()):
+        """
+            Yields the books through a server-side cursor, chunk_size rows
+            at a time, so a long result never has to be held at once.
+            Columns named in deferred are left out.
+        """
+        yield from self.session.scalars(stream_books_statement(self.scope, order, chunk_size, criteria, limit, deferred))
+
+    def get_deferred_values(self, ids: list):
+        """
+            {id: {column: value}} of the DEFERRED_COLUMNS of the given books.
+        """
+        return deferred_values_from_rows(self.session.execute(deferred_values_statement(self.scope, ids)))
+
     def get_book_by_title(self, title: str):
         """
             SELECT
@@ -85,69 +678,102 @@ class Repo:
             LIMIT
                 1;
         """
-        stmt = select(Book).where(Book.title == title).limit(1)
-        result = self.session.execute(stmt)
+        result = self.session.execute(book_by_title_statement(self.scope, title))
 
         return result.scalars().first()
 
     def get_books_by_title_contain(self, title: str):
-        stmt = select(Book).where(Book.title.ilike(f"%{title}%"))
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, contain_criterion("title", title)))
 
         return result.scalars().all()
 
     def get_books_by_author_contain(self, author: str):
-        stmt = select(Book).where(Book.author.ilike(f"%{author}%"))
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, contain_criterion("author", author)))
 
         return result.scalars().all()
 
+    def get_title_rows_by_author_contain(self, author: str):
+        """
+            (id, title, author) of the books whose author contains author,
+            for a duplicate check without the DuplicateIndex.
+        """
+        return self.session.execute(title_rows_by_author_statement(self.scope, author)).all()
+
+    def get_books_by_ids(self, ids: list):
+        return self.session.execute(books_statement(self.scope, Book.id.in_(ids))).scalars().all()
+
     def get_books_by_year(self, year: int):
-        stmt = select(Book).where(Book.year == year)
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, Book.year == year))
 
         return result.scalars().all()
 
     def get_books_by_genre_contain(self, genre: str):
-        stmt = select(Book).where(Book.genre.ilike(f"%{genre}%"))
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, contain_criterion("genre", genre)))
 
         return result.scalars().all()
 
     def get_books_by_description_contain(self, description: str):
-        stmt = select(Book).where(Book.description.ilike(f"%{description}%"))
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, contain_criterion("description", description)))
 
         return result.scalars().all()
 
     def get_books_by_isbn_contain(self, isbn: str):
-        stmt = select(Book).where(Book.isbn.ilike(f"%{isbn}%"))
-        result = self.session.execute(stmt)
+        result = self.session.execute(books_statement(self.scope, isbn_criterion(isbn)))
 
         return result.scalars().all()
 
+    def get_books_by_isbns(self, isbns: list):
+        """
+            SELECT
+                *
+            FROM
+                books
+            WHERE
+                isbn13 IN ({keys of isbns});
+
+            Resolves a batch of scanned or typed ISBNs in one indexed query.
+            Returns {isbn as given: book or None}; invalid ISBNs map to None.
+        """
+        keys = isbn_keys(isbns)
+        wanted = {key for key in keys.values() if key is not None}
+
+        books = []
+        if wanted:
+            books = self.session.execute(books_by_isbn_keys_statement(self.scope, wanted)).scalars()
+
+        return books_by_isbns_from_books(keys, books)
+
+    def get_facet_counts(self, criteria=()):
+        """
+            How the books matching criteria break down by genre, decade and
+            read status, in one query (see facet_counts_statement()).
+        """
+        return facet_counts_from_rows(self.session.execute(facet_counts_statement(criteria, (self.scope,))))
+
+    def full_text_search(self, text_to_search: str):
+        # Built for the dialect of bind: a RoutingSession could send another
+        # execute to a replica of another dialect.
+        bind = self.session.get_bind()
+        stmt = full_text_search_statement(bind.dialect.name, text_to_search).where(self.scope)
+        result = self.session.execute(stmt, bind_arguments={"bind": bind})
+
+        return result.scalars().all()
 
     def oldest_book(self):
-        stmt = select(Book.title).order_by(Book.year).limit(1)
-        result = self.session.execute(stmt)
+        result = self.session.execute(year_edge_statement(self.scope, newest=False))
 
         return result.scalars().first()
 
     def newest_book(self):
-        stmt = select(Book.title).order_by(Book.year.desc()).limit(1)
-        result = self.session.execute(stmt)
+        result = self.session.execute(year_edge_statement(self.scope, newest=True))
 
         return result.scalars().first()
 
     def get_books_count(self):
-        stmt = select(func.count(Book.id))
-
-        count = self.session.scalar(stmt)
-        return count
+        return self.session.scalar(books_count_statement(self.scope))
 
     def get_read_and_unread_count(self):
-        read_count_stmt = select(func.count(Book.id)).where(Book.is_read==True)
-        unread_count_stmt = select(func.count(Book.id)).where(Book.is_read == False)
+        read_count_stmt, unread_count_stmt = read_and_unread_count_statements(self.scope)
 
         read_count = self.session.scalar(read_count_stmt)
         unread_count = self.session.scalar(unread_count_stmt)
@@ -155,81 +781,157 @@ class Repo:
         return read_count, unread_count
 
     def get_books_count_added_in_the_past_month(self):
-        today = datetime.now()
-        one_month_ago = today - timedelta(days=30)
+        return self.session.scalar(added_in_the_past_month_statement(self.scope))
 
-        stmt = select(func.count(Book.id)).where(Book.added_on >= one_month_ago)
+    def get_most_common_genre(self):
+        result = self.session.execute(most_common_genre_statement(self.scope))
 
-        result = self.session.scalar(stmt)
+        return result.scalars().first()
 
-        return result
+    def get_average_publication_year(self):
+        return self.session.scalar(average_publication_year_statement(self.scope))
 
-    def get_most_common_genre(self):
-        stmt = (select(Book.genre, func.count(Book.id).label("count_of_genre"))
-                .group_by(Book.genre)
-                .order_by("count_of_genre")
-                .limit(1))
+    def get_planner_books_count(self):
+        """
+            Postgres' own estimate of the number of books of the library (the
+            rows the planner expects from its partition, from the statistics
+            of the last VACUUM or ANALYZE), or None when there is none.
+        """
+        bind = self.session.get_bind()
 
-        result = self.session.execute(stmt)
+        if bind.dialect.name != "postgresql":
+            return None
 
-        return result.scalars().first()
+        analyzed = self.session.scalar(text(PLANNER_STATISTICS_QUERY), bind_arguments={"bind": bind})
 
-    def get_average_publication_year(self):
-        stmt = select(func.avg(Book.year))
+        if not analyzed:
+            return None
 
-        avg_publication_year = self.session.scalar(stmt)
+        plan = self.session.scalar(
+            text(PLANNER_ROWS_QUERY), {"library_id": self.library_id}, bind_arguments={"bind": bind}
+        )
 
-        return avg_publication_year
+        return planned_rows(plan)
 
-    def order_by_year(self, ascending):
-        stmt = select(Book).order_by(Book.year.asc()) if ascending else select(Book).order_by(Book.year.desc())
-        result = self.session.execute(stmt)
+    def get_id_range(self):
+        return tuple(self.session.execute(id_range_statement(self.scope)).one())
 
-        return result.scalars().all()
+    def sample_books(self, percent: float):
+        """
+            SELECT
+                {SAMPLE_COLUMNS}
+            FROM
+                books TABLESAMPLE SYSTEM ({percent});
 
-    def order_by_title(self, ascending):
-        stmt = select(Book).order_by(Book.title.asc()) if ascending else select(Book).order_by(Book.title.desc())
-        result = self.session.execute(stmt)
+            Postgres only: whole pages picked at random, so the rows come
+            cheap but somewhat clustered.
+        """
+        return self.session.execute(sample_books_statement(self.library_id, percent)).all()
 
-        return result.scalars().all()
+    def get_sample_rows_by_ids(self, ids: list):
+        return self.session.execute(sample_rows_statement(self.scope, ids)).all()
 
-    def order_by_author(self, ascending):
-        stmt = select(Book).order_by(Book.author.asc()) if ascending else select(Book).order_by(Book.author.desc())
-        result = self.session.execute(stmt)
+    def stream_column_values(self, names, chunk_size: int=5000):
+        """
+            Yields rows of just the named columns of every book through a
+            server-side cursor.
+        """
+        yield from self.session.execute(column_values_statement(self.scope, names, chunk_size))
 
-        return result.scalars().all()
+    def order_by_year(self, ascending):
+        return self.session.execute(ordered_books_statement(self.scope, "year", ascending)).scalars().all()
+
+    def order_by_title(self, ascending):
+        return self.session.execute(ordered_books_statement(self.scope, "title", ascending)).scalars().all()
+
+    def order_by_author(self, ascending):
+        return self.session.execute(ordered_books_statement(self.scope, "author", ascending)).scalars().all()
 
     def order_by_added_on(self, ascending):
-        stmt = select(Book).order_by(Book.added_on.asc()) if ascending else select(Book).order_by(Book.added_on.desc())
-        result = self.session.execute(stmt)
+        return self.session.execute(ordered_books_statement(self.scope, "added_on", ascending)).scalars().all()
 
-        return result.scalars().all()
+    def update_book(self, id, new_title, new_author, new_genre, new_description, new_year, new_isbn,
+                    new_is_read: bool=None, version: int=None):
+        """
+            Changes the given fields of a book. With version, only when the
+            book still has that version: otherwise StaleBookError carries
+            its current values (BookDoesNotExistError when it was deleted).
+            Returns the new version. No lock is held between reading a book
+            and writing it, however long the user takes.
+        """
+        values = update_values(new_title, new_author, new_genre, new_description, new_year, new_isbn, new_is_read)
 
-    def update_book(self, id, new_title, new_author, new_genre, new_description, new_year, new_isbn):
-        values = {}
-        if new_title: values["title"] = new_title
-        if new_author: values["author"] = new_author
-        if new_genre: values["genre"] = new_genre
-        if new_description: values["description"] = new_description
-        if new_year: values["year"] = new_year
-        if new_isbn: values["isbn"] = new_isbn
-
-        stmt = (update(Book)
-                .where(Book.id == id)
-                .values(
-                    **values
-        ))
-        self.session.execute(stmt)
-        self.session.commit()
+        return self._update_book(id, values, version)
 
     def update_book_read_status(self, book):
-        stmt = update(Book).where(Book.id == book.id).values(is_read=True if not book.is_read else False)
-        self.session.execute(stmt)
+        """
+            Flips the read status of book, unless someone changed the book
+            since it was read (see update_book()). Returns the new version.
+        """
+        return self._update_book(book.id, {"is_read": not book.is_read}, book.version)
+
+    def _update_book(self, id, values: dict, version: int=None):
+        rows = self.session.execute(update_book_statement(self.scope, id, values, version)).all()
+
+        if not rows:
+            self.session.rollback()
+            book = self.get_book_by_id(id)
+
+            if book is None:
+                raise BookDoesNotExistError
+
+            raise StaleBookError(book)
+
+        queue_changes(self.session, row_changes("update", rows))
         self.session.commit()
 
+        return rows[0].version
+
 
     def delete_book_by_title(self, title: str):
-        stmt = delete(Book).where(Book.title == title)
+        self._delete_books(Book.title == title)
+
+    def add_books(self, books: list):
+        """
+            Inserts many records into the table books in one statement.
+            Every item is a dict with the keys of BOOK_COLUMNS.
+        """
+        if not books:
+            return
+
+        inserted = self.session.execute(add_books_statement(), add_books_rows(self.library_id, books)).all()
+
+        queue_changes(self.session, row_changes("insert", inserted))
+        self.session.commit()
+
+    def update_books_read_status(self, ids: list, is_read: bool):
+        rows = self.session.execute(update_read_status_statement(self.scope, ids, is_read)).all()
+
+        queue_changes(self.session, row_changes("update", rows))
+        self.session.commit()
+
+        return len(rows)
+
+    def delete_book_by_id(self, id: int):
+        return len(self._delete_books(Book.id == id))
+
+    def delete_books_by_ids(self, ids: list):
+        return len(self._delete_books(Book.id.in_(ids)))
+
+    def _delete_books(self, *criteria):
+        """
+            Deletes the matching books and leaves a tombstone for each of
+            them in the same transaction, so replicas can replay the delete.
+            The deleted rows go out in the change events, so listeners can
+            adjust counts without asking the database.
+        """
+        rows = self.session.execute(delete_books_statement(self.scope, *criteria)).all()
+        deleted_ids = [row.id for row in rows]
+
+        if deleted_ids:
+            self.session.execute(insert(Tombstone), tombstone_rows(self.library_id, deleted_ids))
+
+        queue_changes(self.session, row_changes("delete", rows))
+        self.session.commit()
 
-        self.session.execute(stmt)
-        self.session.commit()
\ No newline at end of file
+        return deleted_ids
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+from .engine import DatabaseConfig, create_engine_from_config, create_async_engine_from_config
+
+
+class ReplicaRouter:
+    """
+        Chooses the engine a statement runs on.
+
+        Writes always go to the primary. Reads are spread over the replicas,
+        except for read_your_writes_seconds after any write made through this
+        router: replicas may still be catching up, so those reads stay on the
+        primary and the process sees its own changes.
+    """
+    def __init__(self, primary, replicas=(), read_your_writes_seconds: float=5.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.read_your_writes_seconds = read_your_writes_seconds
+
+        self._last_write = None
+        self._lock = threading.Lock()
+
+    def add_replica(self, replica):
+        self.replicas.append(replica)
+
+    def record_write(self):
+        with self._lock:
+            self._last_write = time.monotonic()
+
+    def wrote_recently(self):
+        with self._lock:
+            last_write = self._last_write
+
+        return last_write is not None and time.monotonic() - last_write < self.read_your_writes_seconds
+
+    def reader(self):
+        if not self.replicas or self.wrote_recently():
+            return self.primary
+
+        return random.choice(self.replicas)
+
+
+class RoutingSession(Session):
+    """
+        Session that sends INSERT/UPDATE/DELETE and flushes to the primary and
+        SELECTs to a replica. Once a session has written, it stays on the
+        primary for the rest of its life.
+
+        Use it through sessionmaker(class_=RoutingSession, router=router), or
+        as the sync_session_class of an async_sessionmaker with a router built
+        from the async engines' sync_engine attributes.
+    """
+    def __init__(self, router: ReplicaRouter, **kwargs):
+        super().__init__(**kwargs)
+
+        self.router = router
+        self.has_written = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # A statement built for the dialect of one engine (see
+        # Repo.full_text_search()) is run on that engine.
+        if bind is not None:
+            return bind
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.has_written = True
+            self.router.record_write()
+
+            return self.router.primary
+
+        # Reads of a session that has written stay on the primary, without
+        # extending the read-your-writes window of every other session.
+        if self.has_written:
+            return self.router.primary
+
+        return self.router.reader()
+
+
+def create_session_factory(config: DatabaseConfig, engine=None):
+    engine = engine or create_engine_from_config(config)
+    replicas = [create_engine_from_config(config.with_url(url)) for url in config.replica_urls]
+
+    router = ReplicaRouter(engine, replicas, config.read_your_writes_seconds)
+
+    return sessionmaker(class_=RoutingSession, router=router)
+
+
+def create_async_session_factory(config: DatabaseConfig, engine=None):
+    engine = engine or create_async_engine_from_config(config)
+    replicas = [create_async_engine_from_config(config.with_url(url)) for url in config.replica_urls]
+
+    router = ReplicaRouter(
+        engine.sync_engine,
+        [replica.sync_engine for replica in replicas],
+        config.read_your_writes_seconds,
+    )
+    router.async_replicas = replicas
+
+    return async_sessionmaker(sync_session_class=RoutingSession, router=router, expire_on_commit=False)
+
+
+async def dispose_async_replicas(session_factory):
+    router = session_factory.kw.get("router")
+
+    for replica in getattr(router, "async_replicas", []):
+        await replica.dispose()
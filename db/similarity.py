@@ -0,0 +1,332 @@
+"""
+    "Similar books": books ranked by the cosine similarity of TF-IDF vectors
+    of their title and description words, author and genre.
+
+    Words are hashed into FEATURE_BITS bits instead of being kept in a
+    vocabulary. The vectors are kept in NumPy arrays twice: by book (to get
+    the vector of a book) and as postings by feature (to score every book
+    sharing a feature with it at once), so a lookup reads only the postings
+    of the features of one book, never the books table.
+"""
+import array
+import math
+
+import numpy as np
+
+from .duplicates import normalize_title, normalize_author
+from .repo import Repo
+
+
+NEIGHBOURS = 5
+
+FEATURE_BITS = 22
+_FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+FIELD_WEIGHTS = {"title": 2.0, "author": 1.5, "genre": 1.0, "description": 1.0}
+
+# A feature's postings are sorted by weight, and only those adding at least
+# MIN_CONTRIBUTION to a similarity are read, at most MAX_POSTINGS of them:
+# very common features (the genre, frequent words) weigh little in most
+# books and would make most of the work.
+MIN_CONTRIBUTION = 0.005
+MAX_POSTINGS = 50000
+
+# Books added or changed since the build are kept apart and compared one by
+# one; the index is built again when they are this many relative to it.
+REBUILD_FRACTION = 0.05
+
+# Neighbour lists kept; cleared when there are more.
+NEIGHBOUR_CACHE_SIZE = 10000
+
+
+def book_features(title: str, author: str, genre: str, description: str):
+    """
+        {hashed feature: weight} of a book, before IDF.
+    """
+    tokens = []
+
+    for word in normalize_title(title).split():
+        tokens.append(("t", word, FIELD_WEIGHTS["title"]))
+
+    for word in normalize_title(description).split():
+        tokens.append(("t", word, FIELD_WEIGHTS["description"]))
+
+    names = normalize_author(author)
+    if names:
+        tokens.append(("a", " ".join(names), FIELD_WEIGHTS["author"]))
+
+    if genre and genre.strip():
+        tokens.append(("g", " ".join(genre.casefold().split()), FIELD_WEIGHTS["genre"]))
+
+    features = {}
+    for kind, text, weight in tokens:
+        feature = hash((kind, text)) & _FEATURE_MASK
+        features[feature] = features.get(feature, 0.0) + weight
+
+    # Sublinear term frequency: a word repeated in a long description does
+    # not outweigh the title.
+    return {feature: 1.0 + math.log(weight) if weight > 1.0 else weight for feature, weight in features.items()}
+
+
+def dot(first, second):
+    """
+        Dot product of two (sorted features, weights) vectors.
+    """
+    _, first_positions, second_positions = np.intersect1d(
+        first[0], second[0], assume_unique=True, return_indices=True
+    )
+
+    return float(first[1][first_positions] @ second[1][second_positions])
+
+
+class SimilarityIndex:
+    """
+        The L2-normalized TF-IDF vectors of every book, as CSR rows
+        (row_starts, row_features, row_weights) and as postings
+        (posting_features, posting_starts, posting_rows, posting_weights).
+
+        A changed book gets a new row in a delta and its old row is marked
+        deleted. Neighbour lists are cached as they are looked up and kept
+        current in place: a new or changed book is scored against the book
+        of every cached list and inserted where it ranks, a list losing one
+        of its books is looked up again.
+    """
+    COLUMNS = ("id", "title", "author", "genre", "description")
+
+    def __init__(self, neighbours: int=NEIGHBOURS):
+        self.neighbours = neighbours
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.row_by_id = {}
+        self.deleted = np.zeros(0, dtype=bool)
+        self.books_counted = 0
+
+        self.row_starts = np.zeros(1, dtype=np.int64)
+        self.row_features = np.empty(0, dtype=np.int64)
+        self.row_weights = np.empty(0, dtype=np.float32)
+
+        self.posting_features = np.empty(0, dtype=np.int64)
+        self.idf = np.empty(0, dtype=np.float32)
+        self.posting_starts = np.zeros(1, dtype=np.int64)
+        self.posting_rows = np.empty(0, dtype=np.int64)
+        self.posting_weights = np.empty(0, dtype=np.float32)
+
+        # id -> vector of the books added or changed since the build
+        self.delta = {}
+
+        # id -> [(id, similarity), ...] most similar first
+        self.cache = {}
+
+    @classmethod
+    def build(cls, rows, neighbours: int=NEIGHBOURS):
+        """
+            From (id, title, author, genre, description) rows, e.g. those of
+            Repo.stream_column_values(SimilarityIndex.COLUMNS).
+        """
+        index = cls(neighbours)
+
+        # Typed arrays hold the tens of millions of entries of a large
+        # library in a fraction of the memory of lists.
+        ids, lengths = array.array("q"), array.array("q")
+        row_features, row_weights = array.array("q"), array.array("f")
+
+        for id, title, author, genre, description in rows:
+            features = book_features(title, author, genre, description)
+
+            ids.append(id)
+            row_features.extend(features.keys())
+            row_weights.extend(features.values())
+            lengths.append(len(features))
+
+        index.ids = np.frombuffer(ids, dtype=np.int64)
+        index.row_by_id = {id: row for row, id in enumerate(ids)}
+        index.deleted = np.zeros(len(ids), dtype=bool)
+        index.books_counted = len(ids)
+
+        index.row_starts = np.zeros(len(ids) + 1, dtype=np.int64)
+        lengths = np.frombuffer(lengths, dtype=np.int64)
+        np.cumsum(lengths, out=index.row_starts[1:])
+
+        features = np.frombuffer(row_features, dtype=np.int64)
+        weights = np.frombuffer(row_weights, dtype=np.float32).copy()
+        rows_of_entries = np.repeat(np.arange(len(ids), dtype=np.int64), lengths)
+
+        index.posting_features, document_frequencies = np.unique(features, return_counts=True)
+        index.idf = np.log((1 + len(ids)) / (1 + document_frequencies)).astype(np.float32) + 1
+
+        weights *= index.idf[np.searchsorted(index.posting_features, features)]
+
+        norms = np.sqrt(np.bincount(rows_of_entries, weights * weights, minlength=len(ids)))
+        weights /= np.maximum(norms, 1e-12)[rows_of_entries].astype(np.float32)
+
+        # Every row sorted by feature, for dot().
+        order = np.lexsort((features, rows_of_entries))
+        index.row_features = features[order]
+        index.row_weights = weights[order]
+
+        # Postings: by feature, lightest first.
+        order = np.lexsort((weights, features))
+        index.posting_rows = rows_of_entries[order]
+        index.posting_weights = weights[order]
+        index.posting_starts = np.r_[0, np.cumsum(document_frequencies)]
+
+        return index
+
+    @classmethod
+    def from_session(cls, session, chunk_size: int=5000):
+        return cls.build(Repo(session).stream_column_values(cls.COLUMNS, chunk_size))
+
+    def __len__(self):
+        return int((~self.deleted).sum()) + len(self.delta)
+
+    @property
+    def stale(self):
+        return len(self.delta) > REBUILD_FRACTION * max(self.books_counted, 1)
+
+    def vector(self, title: str, author: str, genre: str, description: str):
+        """
+            The normalized (sorted features, weights) of a book, weighted with
+            the IDF of the build.
+        """
+        features = book_features(title, author, genre, description)
+
+        keys = np.array(sorted(features), dtype=np.int64)
+        weights = np.array([features[key] for key in keys.tolist()], dtype=np.float32)
+
+        positions = np.searchsorted(self.posting_features, keys)
+        known = positions < len(self.posting_features)
+        known[known] = self.posting_features[positions[known]] == keys[known]
+
+        # Features no built book has are as rare as can be.
+        idf = np.full(len(keys), math.log(1 + self.books_counted) + 1, dtype=np.float32)
+        idf[known] = self.idf[positions[known]]
+        weights *= idf
+
+        return keys, weights / max(float(np.sqrt(weights @ weights)), 1e-12)
+
+    def vector_of(self, id: int):
+        if id in self.delta:
+            return self.delta[id]
+
+        row = self.row_by_id.get(id)
+
+        if row is None:
+            return None
+
+        start, end = self.row_starts[row], self.row_starts[row + 1]
+
+        return self.row_features[start:end], self.row_weights[start:end]
+
+    def row_scores(self, vector):
+        """
+            The similarity of vector to every built row (deleted ones
+            included), from the postings of its features.
+        """
+        features, weights = vector
+        positions = np.searchsorted(self.posting_features, features)
+
+        rows, products = [], []
+        for position, feature, weight in zip(positions.tolist(), features.tolist(), weights.tolist()):
+            if position >= len(self.posting_features) or self.posting_features[position] != feature:
+                continue
+
+            start, end = self.posting_starts[position], self.posting_starts[position + 1]
+            start += np.searchsorted(self.posting_weights[start:end], MIN_CONTRIBUTION / weight)
+            start = max(start, end - MAX_POSTINGS)
+
+            rows.append(self.posting_rows[start:end])
+            products.append(self.posting_weights[start:end] * weight)
+
+        if not rows:
+            return np.zeros(len(self.ids))
+
+        return np.bincount(np.concatenate(rows), np.concatenate(products), minlength=len(self.ids))
+
+    def score(self, vector, exclude_id: int=None):
+        """
+            [(id, similarity), ...] of the neighbours most similar to vector.
+        """
+        found = []
+
+        if len(self.ids):
+            scores = self.row_scores(vector)
+            scores[self.deleted] = 0
+
+            if exclude_id in self.row_by_id:
+                scores[self.row_by_id[exclude_id]] = 0
+
+            top = min(self.neighbours, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+
+            found = [(int(self.ids[row]), float(scores[row])) for row in best.tolist() if scores[row] > 0]
+
+        for id, other in self.delta.items():
+            if id != exclude_id:
+                similarity = dot(vector, other)
+
+                if similarity > 0:
+                    found.append((id, similarity))
+
+        found.sort(key=lambda pair: (-pair[1], pair[0]))
+
+        return found[:self.neighbours]
+
+    def similar(self, id: int):
+        """
+            [(id, similarity), ...] of the books most similar to the book of
+            id, most similar first; [] for a book not in the index.
+        """
+        if id in self.cache:
+            return self.cache[id]
+
+        vector = self.vector_of(id)
+
+        if vector is None:
+            return []
+
+        if len(self.cache) >= NEIGHBOUR_CACHE_SIZE:
+            self.cache.clear()
+
+        found = self.cache[id] = self.score(vector, id)
+
+        return found
+
+    def add(self, id: int, title: str, author: str, genre: str, description: str):
+        """
+            Indexes a new book or the new version of a changed one.
+        """
+        self.remove(id)
+
+        vector = self.delta[id] = self.vector(title, author, genre, description)
+
+        if not self.cache:
+            return
+
+        # One pass over the postings scores the book against every built
+        # book with a cached list.
+        scores = self.row_scores(vector)
+
+        for owner, found in self.cache.items():
+            if owner in self.delta:
+                similarity = dot(vector, self.delta[owner]) if owner != id else 0.0
+            else:
+                similarity = float(scores[self.row_by_id[owner]])
+
+            if similarity > 0 and (len(found) < self.neighbours or similarity > found[-1][1]):
+                found.append((id, similarity))
+                found.sort(key=lambda pair: (-pair[1], pair[0]))
+                del found[self.neighbours:]
+
+    def remove(self, id: int):
+        row = self.row_by_id.pop(id, None)
+
+        if row is not None:
+            self.deleted[row] = True
+
+        self.delta.pop(id, None)
+        self.cache.pop(id, None)
+
+        # The lists it leaves are looked up again: the next book was not
+        # kept.
+        for owner in [owner for owner, found in self.cache.items() if any(other == id for other, _ in found)]:
+            del self.cache[owner]
@@ -0,0 +1,110 @@
+import hashlib
+import heapq
+import math
+
+
+def hash64(value):
+    """
+        Stable 64-bit hash of a value's text (Python's hash() changes
+        between runs).
+    """
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+        Estimates how many distinct values were added, in 2 ** precision
+        bytes whatever their number. The relative standard error is
+        1.04 / sqrt(2 ** precision), 1.6% at the default precision.
+    """
+    def __init__(self, precision: int=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value):
+        hashed = hash64(value)
+
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+
+        # Position of the first 1 bit of what is left of the hash.
+        rank = 64 - self.precision - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Only sketches of the same precision can be merged")
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size ** 2 / sum(2.0 ** -register for register in self.registers)
+
+        zeros = self.registers.count(0)
+
+        # Few values: linear counting of the empty registers is more exact.
+        if estimate <= 2.5 * self.size and zeros:
+            estimate = self.size * math.log(self.size / zeros)
+
+        return round(estimate)
+
+
+class SpaceSaving:
+    """
+        The most frequent values of a stream, tracking capacity counters at
+        most (Metwally et al.). A value seen but not tracked takes over the
+        counter of the least frequent one, inheriting its count as error, so
+        a reported count is never below the true one and at most error above
+        it. Any value more frequent than total / capacity is guaranteed to be
+        tracked.
+    """
+    def __init__(self, capacity: int=100):
+        self.capacity = capacity
+        self.counters = {}
+        self.total = 0
+
+        # (count, value) entries; outdated ones are skipped when popped.
+        self._heap = []
+
+    def add(self, value, weight: int=1):
+        self.total += weight
+
+        if value in self.counters:
+            self.counters[value][0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [weight, 0]
+        else:
+            smallest, smallest_count = self._pop_smallest()
+
+            del self.counters[smallest]
+            self.counters[value] = [smallest_count + weight, smallest_count]
+
+        heapq.heappush(self._heap, (self.counters[value][0], value))
+
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, value) for value, (count, _) in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_smallest(self):
+        while True:
+            count, value = heapq.heappop(self._heap)
+
+            if value in self.counters and self.counters[value][0] == count:
+                return value, count
+
+    def top(self, k: int=10):
+        """
+            [(value, count, error)] of the k largest counters; the true count
+            lies between count - error and count.
+        """
+        ranked = sorted(self.counters.items(), key=lambda item: -item[1][0])
+
+        return [(value, count, error) for value, (count, error) in ranked[:k]]
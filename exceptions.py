@@ -8,3 +8,25 @@ class NegativeYearError(Exception):
 
 class BookDoesNotExistError(Exception):
     pass
+
+
+class InvalidISBNError(Exception):
+    pass
+
+
+class MigrationDryRun(Exception):
+    pass
+
+
+class LibraryDoesNotExistError(Exception):
+    pass
+
+
+class StaleBookError(Exception):
+    """
+        The book was changed by someone else since it was read: book holds
+        its current values.
+    """
+    def __init__(self, book):
+        super().__init__(book.id)
+        self.book = book
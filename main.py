@@ -1,6 +1,14 @@
+import locale
+
 from ui.app import BookWormApp
 
 
 if __name__ == "__main__":
+    # Book lists are sorted with the user's collation rules.
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
+
     book_worm_app = BookWormApp()
     book_worm_app.mainloop()
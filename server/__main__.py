@@ -0,0 +1,52 @@
+import argparse
+
+from aiohttp import web
+from db.engine import DatabaseConfig, create_async_engine_from_config, prepare_sqlite_schema
+from db.models import Base
+from db.routing import create_async_session_factory
+
+from .app import create_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="BookWorm HTTP API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--database-url",
+        help="SQLAlchemy URL, e.g. sqlite:///book_worm.db (defaults to BOOKWORM_DATABASE_URL)",
+    )
+    parser.add_argument("--pool-size", type=int)
+    parser.add_argument("--max-overflow", type=int)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    config = DatabaseConfig.from_env()
+    if args.database_url:
+        config.url = args.database_url
+    if args.pool_size is not None:
+        config.pool_size = args.pool_size
+    if args.max_overflow is not None:
+        config.max_overflow = args.max_overflow
+
+    engine = create_async_engine_from_config(config)
+    session_factory = create_async_session_factory(config, engine)
+
+    app = create_app(session_factory, engine)
+
+    if config.is_sqlite:
+        async def prepare_schema(app):
+            async with engine.begin() as connection:
+                await connection.run_sync(prepare_sqlite_schema, Base.metadata)
+
+        app.on_startup.append(prepare_schema)
+
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
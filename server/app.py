@@ -0,0 +1,488 @@
+import asyncio
+import hashlib
+import json
+
+import sqlalchemy.exc
+from aiohttp import web
+
+from db.async_repo import AsyncRepo, gather_statistics
+from db.duplicates import DuplicateIndex, check_import
+from db.routing import dispose_async_replicas
+from db.repo import BOOK_COLUMNS, ORDER_COLUMNS
+
+from exceptions import EmptyFieldError, NegativeYearError, BookDoesNotExistError, InvalidISBNError, \
+    LibraryDoesNotExistError, StaleBookError
+
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+STREAM_CHUNK_SIZE = 500
+
+SEARCH_FIELDS = ("title", "author", "genre", "year", "description", "isbn", "everything")
+
+
+def book_to_dict(book):
+    return {
+        "id": book.id,
+        "title": book.title,
+        "author": book.author,
+        "genre": book.genre,
+        "year": book.year,
+        "description": book.description,
+        "isbn": book.isbn,
+        "is_read": book.is_read,
+        "added_on": book.added_on.isoformat() if book.added_on else None,
+        "version": book.version,
+    }
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """
+        Whether an If-None-Match header lists etag or is "*". The header is
+        compared weakly, as HTTP asks for it: W/"x" matches "x".
+    """
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
+def json_response_with_etag(request, payload):
+    """
+        Serializes the payload once, derives a strong ETag from the bytes and
+        answers 304 when the client already holds that representation.
+    """
+    body = json.dumps(payload, default=str).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+    if etag_matches(request.headers.get("If-None-Match", ""), etag):
+        return web.Response(status=304, headers={"ETag": etag})
+
+    return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+
+def parse_int(request, name, default, minimum=0, maximum=None):
+    try:
+        value = int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an integer")
+
+    if value < minimum or (maximum is not None and value > maximum):
+        raise web.HTTPBadRequest(text=f"{name} is out of range")
+
+    return value
+
+
+def parse_year(value):
+    """
+        The year of a payload or a search as an int; NegativeYearError when
+        it is not a non-negative integer.
+    """
+    try:
+        year = int(value)
+    except (TypeError, ValueError):
+        raise NegativeYearError
+
+    if year < 0:
+        raise NegativeYearError
+
+    return year
+
+
+def list_field(payload, name: str, item_types, description: str):
+    """
+        payload[name], [] when it is missing; 400 when the payload is not an
+        object, or the field not a list of item_types.
+    """
+    if not isinstance(payload, dict):
+        raise web.HTTPBadRequest(text="Body must be a JSON object")
+
+    values = payload.get(name, [])
+
+    if not isinstance(values, list) or not all(
+        isinstance(value, item_types) and not isinstance(value, bool) for value in values
+    ):
+        raise web.HTTPBadRequest(text=f"{name} must be a list of {description}")
+
+    return values
+
+
+def parse_order(request):
+    order = request.query.get("order") or None
+
+    if order and order.lstrip("-") not in ORDER_COLUMNS:
+        raise web.HTTPBadRequest(text=f"Unknown order {order!r}")
+
+    return order
+
+
+def validate_book_payload(payload, partial=False):
+    """
+        Keeps only the known book columns and applies the same rules as the
+        Add/Edit windows: title, author and genre are required, year must be
+        a non-negative integer.
+    """
+    book = {key: payload[key] for key in BOOK_COLUMNS if key in payload}
+
+    if not partial and not all(book.get(key) for key in ("title", "author", "genre")):
+        raise EmptyFieldError
+
+    if book.get("year") is not None:
+        book["year"] = parse_year(book["year"])
+
+    return book
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    try:
+        return await handler(request)
+    except BookDoesNotExistError:
+        raise web.HTTPNotFound(text="Book does not exist")
+    except LibraryDoesNotExistError:
+        raise web.HTTPNotFound(text="Library does not exist")
+    except StaleBookError as error:
+        return web.json_response(
+            {"error": "Book changed since it was read", "book": book_to_dict(error.book)}, status=409
+        )
+    except EmptyFieldError:
+        raise web.HTTPBadRequest(text="title, author and genre are required")
+    except InvalidISBNError:
+        raise web.HTTPBadRequest(text="Invalid ISBN")
+    except NegativeYearError:
+        raise web.HTTPBadRequest(text="Year must be a positive integer number")
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Invalid JSON body")
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid value")
+    except sqlalchemy.exc.IntegrityError:
+        raise web.HTTPConflict(text="ISBN already used")
+
+
+class BookRoutes:
+    """
+        Every route works on the library of the ?library= parameter, the
+        configured one (BOOKWORM_LIBRARY_ID) without it.
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.library_ids = set()
+
+    async def library_of(self, request):
+        """
+            The id of the requested library, None for the configured one.
+            The ids of the libraries are read again only for an id not seen
+            yet: libraries are not deleted.
+        """
+        if "library" not in request.query:
+            return None
+
+        library_id = parse_int(request, "library", None, minimum=1)
+
+        if library_id not in self.library_ids:
+            async with self.session_factory() as session:
+                self.library_ids = {library.id for library in await AsyncRepo(session).get_libraries()}
+
+            if library_id not in self.library_ids:
+                raise LibraryDoesNotExistError
+
+        return library_id
+
+    async def list_libraries(self, request):
+        async with self.session_factory() as session:
+            libraries = await AsyncRepo(session).get_libraries()
+
+        return web.json_response({"libraries": [{"id": library.id, "name": library.name} for library in libraries]})
+
+    async def add_library(self, request):
+        payload = await request.json()
+        name = str(payload.get("name") or "").strip()
+
+        if not name:
+            raise web.HTTPBadRequest(text="name is required")
+
+        async with self.session_factory() as session:
+            try:
+                library_id = await AsyncRepo(session).add_library(name)
+            except sqlalchemy.exc.IntegrityError:
+                raise web.HTTPConflict(text="Library already exists")
+
+        self.library_ids.add(library_id)
+
+        return web.json_response({"id": library_id, "name": name}, status=201)
+
+    async def list_books(self, request):
+        library_id = await self.library_of(request)
+        page = parse_int(request, "page", 1, minimum=1)
+        per_page = parse_int(request, "per_page", DEFAULT_PER_PAGE, minimum=1, maximum=MAX_PER_PAGE)
+        order = parse_order(request)
+
+        async with self.session_factory() as session:
+            books = await AsyncRepo(session, library_id).get_books_page((page - 1) * per_page, per_page, order)
+
+        return json_response_with_etag(request, {
+            "page": page,
+            "per_page": per_page,
+            "books": [book_to_dict(book) for book in books],
+        })
+
+    async def export_books(self, request):
+        """
+            Streams every book as newline-delimited JSON straight from a
+            server-side cursor, so memory use does not grow with the table.
+        """
+        library_id = await self.library_of(request)
+        order = parse_order(request)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+
+        async with self.session_factory() as session:
+            buffer = []
+
+            async for book in AsyncRepo(session, library_id).stream_books(order, STREAM_CHUNK_SIZE):
+                buffer.append(json.dumps(book_to_dict(book)))
+
+                if len(buffer) == STREAM_CHUNK_SIZE:
+                    await response.write(("\n".join(buffer) + "\n").encode())
+                    buffer.clear()
+
+            if buffer:
+                await response.write(("\n".join(buffer) + "\n").encode())
+
+        await response.write_eof()
+        return response
+
+    async def search_books(self, request):
+        """
+            One page of the matching books (every book without a value), in
+            id order: limit books after the id given as after. next_after is
+            the after of the next page, null on the last one.
+        """
+        library_id = await self.library_of(request)
+        field = request.query.get("field", "title")
+        value = request.query.get("value", "").strip() or None
+        limit = parse_int(request, "limit", DEFAULT_PER_PAGE, minimum=1, maximum=MAX_PER_PAGE)
+        after = parse_int(request, "after", 0)
+
+        if field not in SEARCH_FIELDS:
+            raise web.HTTPBadRequest(text=f"Unknown search field {field!r}")
+
+        if field == "year" and value is not None:
+            value = parse_year(value)
+
+        async with self.session_factory() as session:
+            # One more book than asked tells whether there is a next page.
+            books = await AsyncRepo(session, library_id).search_books_page(field, value, after, limit + 1)
+
+        return json_response_with_etag(request, {
+            "books": [book_to_dict(book) for book in books[:limit]],
+            "next_after": books[limit - 1].id if len(books) > limit else None,
+        })
+
+    async def get_book(self, request):
+        library_id = await self.library_of(request)
+
+        async with self.session_factory() as session:
+            book = await AsyncRepo(session, library_id).get_book_by_id(int(request.match_info["id"]))
+
+        if book is None:
+            raise BookDoesNotExistError
+
+        return json_response_with_etag(request, book_to_dict(book))
+
+    async def lookup_books(self, request):
+        """
+            {"isbns": [...]} -> {"books": {isbn: book or null}}, keyed by the
+            ISBNs as sent, in one query whatever their number.
+        """
+        library_id = await self.library_of(request)
+        payload = await request.json()
+        isbns = [str(isbn) for isbn in list_field(payload, "isbns", (str, int), "ISBNs")]
+
+        async with self.session_factory() as session:
+            found = await AsyncRepo(session, library_id).get_books_by_isbns(isbns)
+
+        return web.json_response({
+            "books": {isbn: book_to_dict(book) if book is not None else None for isbn, book in found.items()}
+        })
+
+    async def statistics(self, request):
+        library_id = await self.library_of(request)
+
+        return json_response_with_etag(request, await gather_statistics(self.session_factory, library_id))
+
+    async def add_book(self, request):
+        library_id = await self.library_of(request)
+        book = validate_book_payload(await request.json())
+
+        async with self.session_factory() as session:
+            await AsyncRepo(session, library_id).add_books([book])
+
+        return web.json_response({"added": 1}, status=201)
+
+    async def update_book(self, request):
+        library_id = await self.library_of(request)
+        id = int(request.match_info["id"])
+        payload = await request.json()
+        book = validate_book_payload(payload, partial=True)
+        version = payload.get("version")
+
+        if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+            raise web.HTTPBadRequest(text="version must be an integer")
+
+        async with self.session_factory() as session:
+            repo = AsyncRepo(session, library_id)
+
+            if await repo.get_book_by_id(id) is None:
+                raise BookDoesNotExistError
+
+            # With the version the client read, the change is made only if
+            # no one else changed the book since: 409 with its current
+            # values otherwise. Without it the change is applied as is.
+            if "is_read" in book or any(book.values()):
+                await repo.update_book(
+                    id,
+                    book.get("title"),
+                    book.get("author"),
+                    book.get("genre"),
+                    book.get("description"),
+                    book.get("year"),
+                    book.get("isbn"),
+                    book.get("is_read"),
+                    version,
+                )
+
+        async with self.session_factory() as session:
+            updated_book = await AsyncRepo(session, library_id).get_book_by_id(id)
+
+        return web.json_response(book_to_dict(updated_book))
+
+    async def delete_book(self, request):
+        library_id = await self.library_of(request)
+
+        async with self.session_factory() as session:
+            deleted = await AsyncRepo(session, library_id).delete_book_by_id(int(request.match_info["id"]))
+
+        if not deleted:
+            raise BookDoesNotExistError
+
+        return web.json_response({"deleted": deleted})
+
+    async def load_duplicate_index(self, library_id: int=None):
+        """
+            The duplicate index of a library, built off the event loop.
+        """
+        async with self.session_factory() as session:
+            rows = [tuple(row) async for row in AsyncRepo(session, library_id).stream_column_values(("id", "title", "author"))]
+
+        return await asyncio.get_running_loop().run_in_executor(None, DuplicateIndex.build, rows)
+
+    async def duplicates(self, request):
+        """
+            {"duplicates": [[book, ...], ...]}: every group of duplicate
+            books, biggest first.
+        """
+        library_id = await self.library_of(request)
+        index = await self.load_duplicate_index(library_id)
+        clusters = await asyncio.get_running_loop().run_in_executor(None, index.clusters)
+
+        books = {}
+        ids = [id for cluster in clusters for id in cluster]
+
+        async with self.session_factory() as session:
+            repo = AsyncRepo(session, library_id)
+
+            for start in range(0, len(ids), STREAM_CHUNK_SIZE):
+                books.update((book.id, book) for book in await repo.get_books_by_ids(ids[start:start + STREAM_CHUNK_SIZE]))
+
+        return web.json_response({
+            "duplicates": [[book_to_dict(books[id]) for id in cluster if id in books] for cluster in clusters]
+        })
+
+    async def bulk_add_books(self, request):
+        """
+            With "skip_duplicates": true, books duplicating one of the
+            library or an earlier one of the request are left out and their
+            positions returned as "skipped".
+        """
+        library_id = await self.library_of(request)
+        payload = await request.json()
+        books = [validate_book_payload(book) for book in list_field(payload, "books", dict, "books")]
+        skipped = set()
+
+        if payload.get("skip_duplicates"):
+            index = await self.load_duplicate_index(library_id)
+            in_library, in_import = await asyncio.get_running_loop().run_in_executor(None, check_import, index, books)
+
+            skipped = {position for position, _ in in_library} | {position for position, _ in in_import}
+            books = [book for position, book in enumerate(books) if position not in skipped]
+
+        async with self.session_factory() as session:
+            await AsyncRepo(session, library_id).add_books(books)
+
+        if payload.get("skip_duplicates"):
+            return web.json_response({"added": len(books), "skipped": sorted(skipped)}, status=201)
+
+        return web.json_response({"added": len(books)}, status=201)
+
+    async def bulk_update_read_status(self, request):
+        library_id = await self.library_of(request)
+        payload = await request.json()
+
+        async with self.session_factory() as session:
+            updated = await AsyncRepo(session, library_id).update_books_read_status(
+                list_field(payload, "ids", int, "integers"),
+                bool(payload.get("is_read", True)),
+            )
+
+        return web.json_response({"updated": updated})
+
+    async def bulk_delete_books(self, request):
+        library_id = await self.library_of(request)
+        payload = await request.json()
+
+        async with self.session_factory() as session:
+            deleted = await AsyncRepo(session, library_id).delete_books_by_ids(list_field(payload, "ids", int, "integers"))
+
+        return web.json_response({"deleted": deleted})
+
+
+def create_app(session_factory, engine=None):
+    """
+        Builds the aiohttp application. When an engine is given, its pool and
+        those of the session factory's replicas are disposed on shutdown.
+    """
+    routes = BookRoutes(session_factory)
+
+    app = web.Application(middlewares=[error_middleware])
+    app.add_routes([
+        web.get("/books", routes.list_books),
+        web.post("/books", routes.add_book),
+        web.get("/books/export", routes.export_books),
+        web.get("/books/search", routes.search_books),
+        web.get("/books/duplicates", routes.duplicates),
+        web.post("/books/lookup", routes.lookup_books),
+        web.post("/books/bulk", routes.bulk_add_books),
+        web.patch("/books/bulk/read-status", routes.bulk_update_read_status),
+        web.delete("/books/bulk", routes.bulk_delete_books),
+        web.get(r"/books/{id:\d+}", routes.get_book),
+        web.patch(r"/books/{id:\d+}", routes.update_book),
+        web.delete(r"/books/{id:\d+}", routes.delete_book),
+        web.get("/stats", routes.statistics),
+        web.get("/libraries", routes.list_libraries),
+        web.post("/libraries", routes.add_library),
+    ])
+
+    if engine is not None:
+        async def dispose_engine(app):
+            await engine.dispose()
+            await dispose_async_replicas(session_factory)
+
+        app.on_cleanup.append(dispose_engine)
+
+    return app
@@ -0,0 +1,50 @@
+"""
+    What the tests share: a new SQLite database for every test. Import it
+    before any module of db: db.models builds its engine from the
+    environment when it is imported.
+"""
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("BOOKWORM_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bookworm-tests.db')}")
+
+from sqlalchemy.orm import sessionmaker
+
+from db.engine import DatabaseConfig, create_engine_from_config, prepare_sqlite_schema
+from db.models import Base
+
+
+def sqlite_url(directory: str, name: str):
+    return f"sqlite:///{os.path.join(directory, name)}"
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """
+        Every test gets new SQLite files in a directory of its own: engine
+        and session_factory use books.db, new_engine() makes more.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engines = []
+
+        self.engine = self.new_engine("books.db")
+        self.session_factory = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.dispose()
+
+        self.directory.cleanup()
+
+    def new_engine(self, name: str, **config):
+        engine = create_engine_from_config(
+            DatabaseConfig(url=sqlite_url(self.directory.name, name), **config)
+        )
+
+        with engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+
+        self.engines.append(engine)
+
+        return engine
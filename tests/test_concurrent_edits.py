@@ -0,0 +1,85 @@
+"""
+    Two editors of the same book: the version makes the later edit fail
+    with StaleBookError instead of overwriting the first one.
+
+        python -m unittest tests.test_concurrent_edits
+"""
+import threading
+import unittest
+
+from tests.support import SQLiteTestCase
+
+from db.repo import Repo
+
+from exceptions import BookDoesNotExistError, StaleBookError
+
+
+class ConcurrentEditTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+
+        with self.session_factory() as session:
+            repo = Repo(session)
+            repo.add_book("Dune", "Frank Herbert", "Science Fiction", None, 1965)
+
+            book = repo.get_book_by_title("Dune")
+            self.id, self.version = book.id, book.version
+
+    def current(self):
+        with self.session_factory() as session:
+            return Repo(session).get_book_by_id(self.id)
+
+    def edit(self, session, title: str):
+        return Repo(session).update_book(self.id, title, None, None, None, None, None, version=self.version)
+
+    def test_second_edit_is_stale(self):
+        with self.session_factory() as first, self.session_factory() as second:
+            self.assertEqual(self.edit(first, "Dune (first edit)"), self.version + 1)
+
+            with self.assertRaises(StaleBookError) as raised:
+                self.edit(second, "Dune (second edit)")
+
+        self.assertEqual((raised.exception.book.title, raised.exception.book.version),
+                         ("Dune (first edit)", self.version + 1))
+
+        book = self.current()
+        self.assertEqual((book.title, book.version), ("Dune (first edit)", self.version + 1))
+
+    def test_simultaneous_edits(self):
+        barrier = threading.Barrier(2)
+        outcomes = {}
+
+        def edit(title: str):
+            with self.session_factory() as session:
+                barrier.wait()
+
+                try:
+                    outcomes[title] = self.edit(session, title)
+                except StaleBookError as error:
+                    outcomes[title] = error
+
+        threads = [threading.Thread(target=edit, args=(title,)) for title in ("first", "second")]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stale = [title for title, outcome in outcomes.items() if isinstance(outcome, StaleBookError)]
+        applied = [title for title, outcome in outcomes.items() if outcome == self.version + 1]
+
+        self.assertEqual((len(stale), len(applied)), (1, 1))
+
+        book = self.current()
+        self.assertEqual((book.title, book.version), (applied[0], self.version + 1))
+
+    def test_edit_of_a_deleted_book(self):
+        with self.session_factory() as session:
+            Repo(session).delete_book_by_id(self.id)
+
+        with self.session_factory() as session, self.assertRaises(BookDoesNotExistError):
+            self.edit(session, "Dune (edit)")
+
+
+if __name__ == "__main__":
+    unittest.main()
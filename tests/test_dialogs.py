@@ -0,0 +1,60 @@
+"""
+    The pooled Details, Edit and Add dialogs keep no memory, widget or Tcl
+    command per open (see benchmarks/dialog_benchmark.py). Skipped without
+    a display; on a headless machine run it under xvfb-run.
+
+        python -m unittest tests.test_dialogs
+"""
+import os
+import tempfile
+import tkinter
+import unittest
+
+# db.models builds its engine, the one of the app, from the environment when
+# it is imported.
+os.environ.setdefault("BOOKWORM_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bookworm-tests.db')}")
+
+from benchmarks.dialog_benchmark import retained_per_open
+from db.models import Session
+from db.repo import Repo
+
+
+OPENS = 100
+MAX_GROWTH = 256
+
+
+class DialogMemoryTest(unittest.TestCase):
+    def setUp(self):
+        from ui.app import BookWormApp
+
+        try:
+            self.app = BookWormApp()
+        except tkinter.TclError as error:
+            self.skipTest(f"needs a display: {error}")
+
+        self.app.withdraw()
+
+        books = [{"title": f"Book {i}", "author": "Author", "genre": "Genre", "year": 2000 + i} for i in range(10)]
+
+        with Session() as session:
+            repo = Repo(session)
+            repo.add_books(books)
+
+            self.books = [repo.get_book_by_title(book["title"]) for book in books]
+
+    def tearDown(self):
+        self.app.unsubscribe_from_changes()
+        self.app.destroy()
+
+        with Session() as session:
+            Repo(session).delete_books_by_ids([book.id for book in self.books])
+
+    def test_memory_does_not_grow(self):
+        growth, widgets, commands = retained_per_open(self.app, self.books, OPENS)
+
+        self.assertLessEqual(growth, MAX_GROWTH)
+        self.assertEqual((widgets, commands), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+    Two libraries in one SQLite file: every query of Repo sees the books of
+    its own library only.
+
+        python -m unittest tests.test_libraries
+"""
+import unittest
+
+from tests.support import SQLiteTestCase
+
+from sqlalchemy.exc import IntegrityError
+
+from db.engine import DEFAULT_LIBRARY_ID
+from db.repo import Repo
+
+from exceptions import BookDoesNotExistError
+
+
+ISBN = "9780306406157"
+
+
+class LibraryScopeTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+
+        with self.session_factory() as session:
+            self.other_id = Repo(session).add_library("Branch")
+
+        with self.session_factory() as session:
+            main = Repo(session, DEFAULT_LIBRARY_ID)
+            main.add_book("Dune", "Frank Herbert", "Science Fiction", "Spice", 1965, ISBN)
+            main.add_book("Emma", "Jane Austen", "Romance", None, 1815)
+
+            other = Repo(session, self.other_id)
+            other.add_book("Dune", "Frank Herbert", "Science Fiction", "Spice", 1965, ISBN)
+            other.add_book("Solaris", "Stanislaw Lem", "Science Fiction", None, 1961)
+            other.add_book("Ubik", "Philip K. Dick", "Science Fiction", None, 1969)
+
+            self.other_ids = [book.id for book in other.get_all_books()]
+
+    def titles(self, books):
+        return sorted(book.title for book in books)
+
+    def test_queries_see_their_library(self):
+        with self.session_factory() as session:
+            main = Repo(session, DEFAULT_LIBRARY_ID)
+
+            self.assertEqual(self.titles(main.get_all_books()), ["Dune", "Emma"])
+            self.assertEqual(self.titles(main.get_books_by_author_contain("lem")), [])
+            self.assertEqual(self.titles(main.full_text_search("solaris")), [])
+            self.assertIsNone(main.get_book_by_id(self.other_ids[1]))
+            self.assertEqual(main.get_books_by_isbns([ISBN])[ISBN].library_id, DEFAULT_LIBRARY_ID)
+
+            other = Repo(session, self.other_id)
+
+            self.assertEqual(self.titles(other.get_all_books()), ["Dune", "Solaris", "Ubik"])
+            self.assertEqual(self.titles(other.get_books_by_author_contain("austen")), [])
+
+    def test_counts_are_per_library(self):
+        with self.session_factory() as session:
+            main = Repo(session, DEFAULT_LIBRARY_ID)
+            other = Repo(session, self.other_id)
+
+            self.assertEqual((main.get_books_count(), other.get_books_count()), (2, 3))
+            self.assertEqual(sorted(main.get_all_genres()), ["Romance", "Science Fiction"])
+            self.assertEqual(other.get_all_genres(), ["Science Fiction"])
+            self.assertEqual(other.oldest_book(), "Solaris")
+            self.assertEqual(main.oldest_book(), "Emma")
+
+    def test_isbns_are_unique_per_library(self):
+        with self.session_factory() as session:
+            with self.assertRaises(IntegrityError):
+                Repo(session, self.other_id).add_book("Dune", "Frank Herbert", "Science Fiction", None, 1965, ISBN)
+
+    def test_writes_do_not_reach_another_library(self):
+        with self.session_factory() as session:
+            main = Repo(session, DEFAULT_LIBRARY_ID)
+
+            self.assertEqual(main.delete_book_by_id(self.other_ids[0]), 0)
+            self.assertEqual(main.delete_books_by_ids(self.other_ids), 0)
+            self.assertEqual(main.update_books_read_status(self.other_ids, True), 0)
+
+            with self.assertRaises(BookDoesNotExistError):
+                main.update_book(self.other_ids[0], "Dune (edited)", None, None, None, None, None)
+
+        with self.session_factory() as session:
+            other = Repo(session, self.other_id)
+
+            self.assertEqual(self.titles(other.get_all_books()), ["Dune", "Solaris", "Ubik"])
+            self.assertEqual(other.get_read_and_unread_count(), (0, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+    LocalReplica copying a SQLite primary: the snapshot, and the deltas of
+    changed books and of deletes.
+
+        python -m unittest tests.test_local_replica
+"""
+import os
+import unittest
+
+from tests.support import SQLiteTestCase
+
+from sqlalchemy import select, delete, insert
+
+from db.local_replica import LocalReplica
+from db.models import Book, Tombstone
+from db.repo import Repo
+
+
+class LocalReplicaTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+
+        with self.session_factory() as session:
+            repo = Repo(session)
+
+            for title in ("Dune", "Dune Messiah", "Children of Dune"):
+                repo.add_book(title, "Frank Herbert", "Science Fiction")
+
+        self.replica = LocalReplica(self.engine, os.path.join(self.directory.name, "replica.db"))
+        self.engines.append(self.replica.engine)
+
+        self.replica.sync()
+
+    def local_titles(self):
+        with self.replica.engine.connect() as connection:
+            return connection.scalars(select(Book.title).order_by(Book.id)).all()
+
+    def book_id(self, title: str):
+        with self.session_factory() as session:
+            return Repo(session).get_book_by_title(title).id
+
+    def test_snapshot(self):
+        self.assertEqual(self.local_titles(), ["Dune", "Dune Messiah", "Children of Dune"])
+
+    def test_deltas(self):
+        with self.session_factory() as session:
+            repo = Repo(session)
+            repo.add_book("God Emperor of Dune", "Frank Herbert", "Science Fiction")
+            repo.delete_book_by_id(self.book_id("Dune Messiah"))
+
+        self.replica.sync()
+
+        self.assertEqual(self.local_titles(), ["Dune", "Children of Dune", "God Emperor of Dune"])
+
+    def test_tombstone_committed_after_a_newer_one(self):
+        # The tombstone of a slow transaction gets its id first and commits
+        # after one with a larger id has been synced.
+        with self.engine.begin() as connection:
+            connection.execute(insert(Tombstone).values(id=10, library_id=1, book_id=1000))
+
+        self.replica.sync()
+
+        id = self.book_id("Dune Messiah")
+
+        with self.engine.begin() as connection:
+            connection.execute(delete(Book).where(Book.id == id))
+            connection.execute(insert(Tombstone).values(id=5, library_id=1, book_id=id))
+
+        self.replica.sync()
+
+        self.assertEqual(self.local_titles(), ["Dune", "Children of Dune"])
+        self.assertIsNone(self.replica.last_error)
+
+
+if __name__ == "__main__":
+    unittest.main()
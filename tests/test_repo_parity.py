@@ -0,0 +1,248 @@
+"""
+    Runs the same operations through Repo and AsyncRepo, each on a new SQLite
+    file of its own, and checks that they return the same results and leave
+    the same rows behind.
+
+        python -m unittest tests.test_repo_parity
+"""
+import datetime
+import os
+import tempfile
+import unittest
+
+# db.models builds its engine from the environment when it is imported.
+os.environ.setdefault("BOOKWORM_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bookworm-tests.db')}")
+
+from sqlalchemy import select, inspect
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from db.async_repo import AsyncRepo
+from db.engine import DatabaseConfig, create_engine_from_config, create_async_engine_from_config, prepare_sqlite_schema
+from db.models import Base, Book, Tombstone
+from db.repo import Repo, search_criterion, facet_criterion
+
+from exceptions import BookDoesNotExistError, StaleBookError
+
+
+BOOKS = [
+    {"title": "Dune", "author": "Frank Herbert", "genre": "Science Fiction", "year": 1965,
+     "description": "Spice and sandworms on Arrakis", "isbn": "9780306406157"},
+    {"title": "Dune Messiah", "author": "Frank Herbert", "genre": "Science Fiction", "year": 1969},
+    {"title": "Emma", "author": "Jane Austen", "genre": "Romance", "year": 1815, "isbn": "978-1-86197-876-9"},
+    {"title": "Persuasion", "author": "Jane Austen", "genre": "Romance", "year": 1817, "is_read": True},
+    {"title": "The Selfish Gene", "author": "Richard Dawkins", "genre": "Science", "year": 1976,
+     "isbn": "0-19-852663-6"},
+    {"title": "Untitled", "author": "Anonymous", "genre": None},
+]
+
+def normalized(value):
+    """
+        Books and libraries as dicts of their columns, rows as tuples, so
+        that results of two sessions compare equal. Deferred columns are
+        left out, and so are timestamps: they are set by the database and
+        differ between the two files.
+    """
+    if isinstance(value, Base):
+        unloaded = inspect(value).unloaded
+        values = {column.key: getattr(value, column.key) for column in value.__table__.columns
+                  if column.key not in unloaded}
+
+        return {key: item for key, item in values.items() if not isinstance(item, datetime.datetime)}
+    if isinstance(value, Row):
+        return tuple(normalized(item) for item in value if not isinstance(item, datetime.datetime))
+    if isinstance(value, dict):
+        return {key: normalized(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalized(item) for item in value]
+
+    return value
+
+
+def outcome(call):
+    """
+        What call returned, or the exception it raised.
+    """
+    try:
+        return "returned", normalized(call())
+    except StaleBookError as error:
+        return "raised", "StaleBookError", normalized(error.book)
+    except BookDoesNotExistError:
+        return "raised", "BookDoesNotExistError"
+
+
+async def async_outcome(call):
+    try:
+        return "returned", normalized(await call())
+    except StaleBookError as error:
+        return "raised", "StaleBookError", normalized(error.book)
+    except BookDoesNotExistError:
+        return "raised", "BookDoesNotExistError"
+
+
+class RepoParityTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        sync_config = DatabaseConfig(url=f"sqlite:///{os.path.join(self.directory.name, 'sync.db')}")
+        async_config = DatabaseConfig(url=f"sqlite:///{os.path.join(self.directory.name, 'async.db')}")
+
+        self.engine = create_engine_from_config(sync_config)
+        self.async_engine = create_async_engine_from_config(async_config)
+
+        with self.engine.begin() as connection:
+            prepare_sqlite_schema(connection, Base.metadata)
+
+        async with self.async_engine.begin() as connection:
+            await connection.run_sync(prepare_sqlite_schema, Base.metadata)
+
+        self.session_factory = sessionmaker(bind=self.engine)
+        self.async_session_factory = async_sessionmaker(bind=self.async_engine)
+
+    async def asyncTearDown(self):
+        await self.async_engine.dispose()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    async def both(self, method: str, *args, library_id: int=None, **kwargs):
+        """
+            Calls method on a Repo and on an AsyncRepo, checks that both
+            had the same outcome and returns it.
+        """
+        with self.session_factory() as session:
+            expected = outcome(lambda: getattr(Repo(session, library_id), method)(*args, **kwargs))
+
+        async with self.async_session_factory() as session:
+            actual = await async_outcome(lambda: getattr(AsyncRepo(session, library_id), method)(*args, **kwargs))
+
+        self.assertEqual(expected, actual, method)
+
+        return expected
+
+    async def both_streamed(self, method: str, *args, **kwargs):
+        with self.session_factory() as session:
+            expected = normalized(list(getattr(Repo(session), method)(*args, **kwargs)))
+
+        async with self.async_session_factory() as session:
+            actual = normalized([item async for item in getattr(AsyncRepo(session), method)(*args, **kwargs)])
+
+        self.assertEqual(expected, actual, method)
+
+        return expected
+
+    async def assert_same_rows(self):
+        with self.session_factory() as session:
+            books = normalized(session.scalars(select(Book).order_by(Book.id)).all())
+            tombstones = session.execute(select(Tombstone.library_id, Tombstone.book_id).order_by(Tombstone.book_id)).all()
+
+        async with self.async_session_factory() as session:
+            async_books = normalized((await session.scalars(select(Book).order_by(Book.id))).all())
+            async_tombstones = (await session.execute(
+                select(Tombstone.library_id, Tombstone.book_id).order_by(Tombstone.book_id)
+            )).all()
+
+        self.assertEqual(books, async_books)
+        self.assertEqual(tombstones, async_tombstones)
+
+    async def seed(self):
+        await self.both("add_book", "Solaris", "Stanislaw Lem", "Science Fiction", "A living ocean", 1961, "0-14-143951-3")
+        await self.both("add_books", BOOKS)
+
+    async def test_reads(self):
+        await self.seed()
+
+        self.assertEqual(len((await self.both("get_all_books"))[1]), len(BOOKS) + 1)
+
+        await self.both("get_libraries")
+        await self.both("get_value_counts", "genre")
+        await self.both("get_all_genres")
+        await self.both("filter_by_genre", "Romance")
+        await self.both("get_book_by_id", 2)
+        await self.both("get_book_by_id", 999)
+        await self.both("get_books_page", 1, 3, "-year")
+        await self.both("get_book_by_title", "Emma")
+        await self.both("get_books_by_title_contain", "dune")
+        await self.both("get_books_by_author_contain", "austen")
+        await self.both("get_title_rows_by_author_contain", "herbert")
+        await self.both("get_books_by_ids", [1, 3, 5])
+        await self.both("get_books_by_year", 1965)
+        await self.both("get_books_by_genre_contain", "fiction")
+        await self.both("get_books_by_description_contain", "ocean")
+        await self.both("get_books_by_isbn_contain", "978-0-306-40615-7")
+        await self.both("get_books_by_isbn_contain", "1861")
+        await self.both("get_books_by_isbns", ["9780306406157", "0-19-852663-6", "0000000000", "not an isbn"])
+        await self.both("get_deferred_values", [1, 2])
+        await self.both("full_text_search", "dune")
+        await self.both("oldest_book")
+        await self.both("newest_book")
+        await self.both("get_books_count")
+        await self.both("get_read_and_unread_count")
+        await self.both("get_books_count_added_in_the_past_month")
+        await self.both("get_most_common_genre")
+        await self.both("get_average_publication_year")
+        await self.both("get_planner_books_count")
+        await self.both("get_id_range")
+        await self.both("get_sample_rows_by_ids", [2, 4])
+        await self.both("get_facet_counts")
+        await self.both("get_facet_counts", [search_criterion("sqlite", "author", "austen")])
+
+        for name in ("year", "title", "author", "added_on"):
+            await self.both(f"order_by_{name}", True)
+            await self.both(f"order_by_{name}", False)
+
+        for order in (None, "title", "-year"):
+            first_page = await self.both("get_books_keyset", (), order, None, 3, ("description",))
+            self.assertEqual(len(first_page[1]), 3)
+
+            with self.session_factory() as session:
+                after = session.get(Book, first_page[1][-1]["id"])
+                session.expunge(after)
+
+            await self.both("get_books_keyset", (facet_criterion("is_read", False),), order, after, 3)
+
+        await self.both_streamed("stream_books", "-title", 2, (search_criterion("sqlite", "genre_is", "Romance"),))
+        await self.both_streamed("stream_books", None, 2, (), 4, ("description",))
+        await self.both_streamed("stream_column_values", ("genre", "year"), 2)
+
+    async def test_writes(self):
+        await self.seed()
+
+        self.assertEqual(await self.both("update_book", 1, "Solaris!", None, None, None, 1962, None), ("returned", 2))
+        self.assertEqual(
+            await self.both("update_book", 2, None, None, "Space Opera", None, None, None, True, version=1),
+            ("returned", 2)
+        )
+        self.assertEqual((await self.both("update_book", 2, "Stale", None, None, None, None, None, version=1))[1],
+                         "StaleBookError")
+        self.assertEqual((await self.both("update_book", 999, "Missing", None, None, None, None, None))[1],
+                         "BookDoesNotExistError")
+
+        with self.session_factory() as session:
+            book = session.get(Book, 3)
+            session.expunge(book)
+
+        await self.both("update_book_read_status", book)
+        self.assertEqual((await self.both("update_book_read_status", book))[1], "StaleBookError")
+        await self.assert_same_rows()
+
+        self.assertEqual(await self.both("update_books_read_status", [4, 5, 999], True), ("returned", 2))
+        self.assertEqual(await self.both("delete_book_by_id", 5), ("returned", 1))
+        await self.both("delete_book_by_title", "Untitled")
+        self.assertEqual(await self.both("delete_books_by_ids", [1, 2, 999]), ("returned", 2))
+        await self.assert_same_rows()
+
+    async def test_libraries(self):
+        await self.seed()
+
+        self.assertEqual(await self.both("add_library", "Second"), ("returned", 2))
+        await self.both("add_books", BOOKS[:2], library_id=2)
+
+        self.assertEqual(await self.both("get_books_count", library_id=2), ("returned", 2))
+        self.assertEqual(await self.both("get_books_count"), ("returned", len(BOOKS) + 1))
+        self.assertEqual(await self.both("delete_books_by_ids", [1, 2, 3], library_id=2), ("returned", 0))
+        await self.assert_same_rows()
+
+
+if __name__ == "__main__":
+    unittest.main()
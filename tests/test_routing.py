@@ -0,0 +1,98 @@
+"""
+    RoutingSession on two SQLite files, a primary and a replica that never
+    receives the primary's writes, so a count tells where a read went.
+
+        python -m unittest tests.test_routing
+"""
+import time
+import unittest
+
+from tests.support import SQLiteTestCase
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Book
+from db.repo import Repo
+from db.routing import ReplicaRouter, RoutingSession
+
+
+READ_YOUR_WRITES_SECONDS = 0.2
+
+
+class RoutingSessionTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.replica = self.new_engine("replica.db")
+        self.router = ReplicaRouter(self.engine, [self.replica], READ_YOUR_WRITES_SECONDS)
+        self.routed = sessionmaker(class_=RoutingSession, router=self.router)
+
+    def add_book(self, session, title: str="Dune"):
+        Repo(session).add_book(title, "Frank Herbert", "Science Fiction")
+
+    def count(self, session):
+        return Repo(session).get_books_count()
+
+    def wait_for_replicas(self):
+        time.sleep(READ_YOUR_WRITES_SECONDS * 1.5)
+
+    def test_reads_go_to_the_replica(self):
+        with self.session_factory() as session:
+            self.add_book(session)
+
+        with self.routed() as session:
+            self.assertEqual(self.count(session), 0)
+
+    def test_writes_go_to_the_primary(self):
+        with self.routed() as session:
+            self.add_book(session)
+
+        with self.session_factory() as session:
+            self.assertEqual(self.count(session), 1)
+
+        with self.replica.connect() as connection:
+            self.assertEqual(connection.scalar(select(func.count()).select_from(Book)), 0)
+
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        with self.routed() as session:
+            self.add_book(session)
+
+            # The session that wrote, for its whole life.
+            self.wait_for_replicas()
+            self.assertEqual(self.count(session), 1)
+
+        with self.routed() as session:
+            self.add_book(session, "Dune Messiah")
+
+        # Every session, for read_your_writes_seconds.
+        with self.routed() as session:
+            self.assertEqual(self.count(session), 2)
+
+        self.wait_for_replicas()
+
+        with self.routed() as session:
+            self.assertEqual(self.count(session), 0)
+
+    def test_reads_after_a_write_do_not_extend_the_window(self):
+        with self.routed() as writer:
+            self.add_book(writer)
+
+            for _ in range(3):
+                time.sleep(READ_YOUR_WRITES_SECONDS / 2)
+                self.assertEqual(self.count(writer), 1)
+
+            with self.routed() as reader:
+                self.assertEqual(self.count(reader), 0)
+
+    def test_explicit_bind(self):
+        with self.routed() as session:
+            self.add_book(session)
+
+            count = session.scalar(select(func.count()).select_from(Book), bind_arguments={"bind": self.replica})
+
+            self.assertEqual(count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
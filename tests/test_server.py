@@ -0,0 +1,108 @@
+"""
+    The HTTP API on a new SQLite file: malformed requests and search pages.
+
+        python -m unittest tests.test_server
+"""
+import tempfile
+import unittest
+
+from tests.support import sqlite_url
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from db.engine import DatabaseConfig, create_async_engine_from_config, prepare_sqlite_schema
+from db.models import Base
+from db.routing import create_async_session_factory
+from server.app import create_app
+
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        config = DatabaseConfig(url=sqlite_url(self.directory.name, "books.db"))
+        engine = create_async_engine_from_config(config)
+
+        async with engine.begin() as connection:
+            await connection.run_sync(prepare_sqlite_schema, Base.metadata)
+
+        # The app disposes the engine when the client closes.
+        self.client = TestClient(TestServer(create_app(create_async_session_factory(config, engine), engine)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.directory.cleanup()
+
+    async def add_books(self, count: int):
+        books = [{"title": f"Book {i:03}", "author": "Author", "genre": "Genre", "year": 2000 + i} for i in range(count)]
+        response = await self.client.post("/books/bulk", json={"books": books})
+
+        self.assertEqual(response.status, 201)
+
+    async def test_list_fields_must_be_lists(self):
+        requests = [
+            ("post", "/books/lookup", {"isbns": None}),
+            ("post", "/books/lookup", {"isbns": "9780306406157"}),
+            ("post", "/books/lookup", {"isbns": [["9780306406157"]]}),
+            ("post", "/books/lookup", ["9780306406157"]),
+            ("post", "/books/bulk", {"books": None}),
+            ("post", "/books/bulk", {"books": ["Dune"]}),
+            ("patch", "/books/bulk/read-status", {"ids": None, "is_read": True}),
+            ("patch", "/books/bulk/read-status", {"ids": [1, "two"]}),
+            ("delete", "/books/bulk", {"ids": 1}),
+            ("delete", "/books/bulk", {"ids": [True]}),
+        ]
+
+        for method, path, payload in requests:
+            response = await getattr(self.client, method)(path, json=payload)
+
+            self.assertEqual(response.status, 400, (method, path, payload))
+
+    async def test_list_fields(self):
+        await self.add_books(3)
+
+        response = await self.client.patch("/books/bulk/read-status", json={"ids": [1, 2], "is_read": True})
+        self.assertEqual(await response.json(), {"updated": 2})
+
+        response = await self.client.delete("/books/bulk", json={"ids": [2, 3]})
+        self.assertEqual(await response.json(), {"deleted": 2})
+
+        response = await self.client.post("/books/lookup", json={})
+        self.assertEqual(await response.json(), {"books": {}})
+
+    async def search_pages(self, **params):
+        titles = []
+        after = 0
+
+        while after is not None:
+            response = await self.client.get("/books/search", params=dict(params, limit=3, after=after))
+            page = await response.json()
+
+            self.assertLessEqual(len(page["books"]), 3)
+
+            titles.extend(book["title"] for book in page["books"])
+            after = page["next_after"]
+
+        return titles
+
+    async def test_search_is_paginated(self):
+        await self.add_books(7)
+
+        self.assertEqual(await self.search_pages(), [f"Book {i:03}" for i in range(7)])
+        self.assertEqual(await self.search_pages(field="title", value="book 00"), [f"Book {i:03}" for i in range(7)])
+        self.assertEqual(await self.search_pages(field="everything", value="book"), [f"Book {i:03}" for i in range(7)])
+        self.assertEqual(await self.search_pages(field="year", value="2004"), ["Book 004"])
+        self.assertEqual(await self.search_pages(field="author", value="nobody"), [])
+
+        response = await self.client.get("/books/search", params={"value": "book", "limit": 3})
+        page = await response.json()
+
+        self.assertEqual((len(page["books"]), page["next_after"]), (3, page["books"][-1]["id"]))
+
+        response = await self.client.get("/books/search", params={"limit": 1000})
+        self.assertEqual(response.status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
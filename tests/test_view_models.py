@@ -0,0 +1,73 @@
+"""
+    BookListViewModel.apply_change() with the refetch events of changes too
+    large for a notification.
+
+        python -m unittest tests.test_view_models
+"""
+import unittest
+
+from tests.support import SQLiteTestCase
+
+from db.changes import ChangeEvent
+from db.repo import Repo
+from ui.view_models import BookListViewModel, Query
+
+
+class RefetchChangeTest(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+
+        with self.session_factory() as session:
+            Repo(session).add_book("Dune", "Frank Herbert", "Science Fiction", None, 1965)
+
+        self.model = BookListViewModel(self.session_factory)
+        self.model.load(Query(), "title")
+
+    def refetch_event(self, id: int, op: str):
+        # As it arrives from a notification: no columns.
+        return ChangeEvent.from_dict({"id": id, "op": op, "refetch": True, "library_id": 1})
+
+    def test_insert(self):
+        with self.session_factory() as session:
+            repo = Repo(session)
+            repo.add_book("Anathem", "Neal Stephenson", "Science Fiction", "x" * 10000, 2008)
+            id = repo.get_book_by_title("Anathem").id
+
+        change = self.refetch_event(id, "insert")
+        op, book, position = self.model.apply_change(change)
+
+        self.assertEqual((op, book.id, book.title, position), ("add", id, "Anathem", 0))
+        self.assertEqual(book.description, "x" * 10000)
+        self.assertEqual([book.title for book in self.model.result_set.books], ["Anathem", "Dune"])
+
+        # The other listeners get the event as it came.
+        self.assertEqual((change.op, change.columns, change.refetch), ("insert", {}, True))
+
+    def test_update(self):
+        with self.session_factory() as session:
+            repo = Repo(session)
+            id = repo.get_book_by_title("Dune").id
+            repo.update_book(id, "Children of Dune", None, None, "y" * 10000, 1976, None)
+
+        change = self.refetch_event(id, "update")
+        op, book, position = self.model.apply_change(change)
+
+        self.assertEqual((op, book.id, book.title, book.year), ("update", id, "Children of Dune", 1976))
+        self.assertEqual((change.op, change.columns), ("update", {}))
+
+    def test_delete(self):
+        with self.session_factory() as session:
+            repo = Repo(session)
+            id = repo.get_book_by_title("Dune").id
+            repo.delete_book_by_id(id)
+
+        change = self.refetch_event(id, "update")
+        op, book, position = self.model.apply_change(change)
+
+        self.assertEqual((op, book.id), ("remove", id))
+        self.assertEqual(self.model.result_set.books, [])
+        self.assertEqual(change.op, "update")
+
+
+if __name__ == "__main__":
+    unittest.main()
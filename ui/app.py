@@ -1,15 +1,29 @@
+import queue
+
 import sqlalchemy.exc
 from sqlalchemy import func
-from sqlalchemy.orm import sessionmaker
 import customtkinter as ctk
 from tkinter import messagebox
 
-from db.models import engine, Book
+from db.models import Book, Session, engine, database_config
+from db.changes import ChangeEvent, change_bus, start_change_listener
+from db.local_replica import LocalReplica
+from db.maintenance import analyze_books, tidy_sqlite
 from db.repo import Repo
+from ui.book_table import BookTable
+from ui.dialogs import DialogPool, DetailsDialog, EditDialog, AddBookDialog
+from ui.maintenance import MaintenanceScheduler, MaintenanceJob, ANALYZE_AFTER_CHANGES, STATISTICS_INTERVAL_SECONDS, \
+    INDEXES_INTERVAL_SECONDS, TIDY_INTERVAL_SECONDS
+from ui.prefetch import Prefetcher
+from ui.progressive import ProgressiveLoader
+from ui.result_set import ResultSet, RESULT_SET_LIMIT, TABLE_RESULT_SET_LIMIT, ORDER_BY_OPTION
+from ui.view_models import BookListViewModel, SearchViewModel, StatisticsViewModel, FacetViewModel, SuggestionsViewModel, \
+    DuplicatesViewModel, SimilarBooksViewModel, Query, card_text
+from ui.widgets import add_header_label, make_empty_entries
 
-from exceptions import EmptyFieldError, NegativeYearError
+from exceptions import EmptyFieldError, NegativeYearError, InvalidISBNError, BookDoesNotExistError, StaleBookError
 
-Session = sessionmaker(bind=engine)
+local_replica = LocalReplica.from_config(database_config, engine)
 
 
 class BookWormApp(ctk.CTk):
@@ -35,13 +49,46 @@ class BookWormApp(ctk.CTk):
         self.bind_all("<Control-n>", self.open_add_book_window)
         self.bind_all("<Control-s>", self.open_statistics_window)
         self.bind_all("<Control-t>", self.toggle_theme)
+        self.bind_all("<Control-d>", self.open_duplicates_window)
+        self.bind_all("<Control-i>", self.open_diagnostics_window)
 
         self.columnconfigure((0, 1, 2), weight=1)
         self.order_option = ctk.StringVar(value="No order")
 
+        self.book_loader = ProgressiveLoader(self, Session)
+        self.prefetcher = Prefetcher(self, Session)
+        self.search_model = SearchViewModel(engine.dialect.name)
+        self.book_list_model = BookListViewModel(Session, self.prefetcher.next_page)
+        self.statistics_model = StatisticsViewModel(
+            Session,
+            database_config.column_store,
+            database_config.approximate_statistics
+        )
+        self.facet_model = FacetViewModel(Session)
+        self.suggestions_model = SuggestionsViewModel(Session)
+        self.duplicates_model = DuplicatesViewModel(Session)
+        self.similar_books_model = SimilarBooksViewModel(Session)
+        self.refinements = {}
+        self.facets_changed = False
+        self.viewport = None
+        self.dialogs = DialogPool({
+            "details": lambda: DetailsDialog(self, self.similar_books_model.similar, self.show_books_information),
+            "edit": lambda: EditDialog(self, self.update_book_from_dialog, self.suggestions_model.suggest),
+            "add": lambda: AddBookDialog(self, self.add_book_from_dialog, self.suggestions_model.suggest),
+        })
+        self.book_rows = {}
+        self.no_books_label = None
+        self.partial_result_label = None
+
+        # Changes made by any client arrive on a background thread and are
+        # applied on the Tk thread by process_book_changes.
+        self.book_changes = queue.Queue()
+        self.unsubscribe_from_changes = change_bus.subscribe(self.book_changes.put)
+        self.change_listener = start_change_listener(engine, database_config.library_id)
+
         # Label that will show up at the top
 
-        self.book_worm_label = self.add_header_label(
+        self.book_worm_label = add_header_label(
             self,
             0,
             "📚BookWorm - Your Personal Library",
@@ -92,7 +139,7 @@ class BookWormApp(ctk.CTk):
 
         self.search_option_menu = ctk.CTkOptionMenu(
             self,
-            values=["title", "author", "genre", "year", "description", "isbn"],
+            values=["title", "author", "genre", "year", "description", "isbn", "everything"],
             variable=self.search_choice,
         )
         self.search_option_menu.grid(
@@ -113,7 +160,24 @@ class BookWormApp(ctk.CTk):
             pady=(20, 10),
         )
 
-        self.label_for_booklist = self.add_header_label(
+        self.table_view = ctk.BooleanVar(value=False)
+        self.table_view_switch = ctk.CTkSwitch(
+            self,
+            text="Table view",
+            variable=self.table_view,
+            onvalue=True,
+            offvalue=False,
+            command=self.toggle_view
+        )
+        self.table_view_switch.grid(
+            row=3,
+            column=0,
+            padx=20,
+            pady=(20, 10),
+            sticky="w"
+        )
+
+        self.label_for_booklist = add_header_label(
             self,
             4,
             "Booklist:",
@@ -135,6 +199,26 @@ class BookWormApp(ctk.CTk):
             pady=(10, 5)
         )
 
+        self.book_table = BookTable(
+            self,
+            on_details=self.show_books_information,
+            on_edit=self.edit_book,
+            on_delete=self.delete_book,
+            on_toggle_read=self.toggle_book_read_status_in_table,
+            width=420,
+            height=200,
+            fg_color="transparent"
+        )
+        self.book_table.grid(
+            row=5,
+            column=0,
+            columnspan=3,
+            sticky="nsew",
+            padx=20,
+            pady=(10, 5)
+        )
+        self.book_table.grid_remove()
+
         self.prepare_books()
 
         self.statistics_button = ctk.CTkButton(
@@ -149,6 +233,19 @@ class BookWormApp(ctk.CTk):
             pady=10
         )
 
+        self.load_more_button = ctk.CTkButton(
+            self,
+            text="Load more",
+            command=self.load_more_books,
+            width=100
+        )
+        self.load_more_button.grid(
+            row=6,
+            column=0,
+            pady=10
+        )
+        self.load_more_button.grid_remove()
+
         self.order_label = ctk.CTkLabel(
             self,
             text="Order by:"
@@ -168,7 +265,7 @@ class BookWormApp(ctk.CTk):
                     "Added on(Latest)", "Added on(Earliest)"],
             variable=self.order_option,
             width=160,
-            command=self.prepare_books
+            command=self.change_order
         )
         self.combo_box_for_order.grid(
             row=7,
@@ -190,6 +287,20 @@ class BookWormApp(ctk.CTk):
             pady=10
         )
 
+        self.refine_var = ctk.StringVar(value="Refine")
+        self.refine_menu = ctk.CTkOptionMenu(
+            self,
+            values=[],
+            variable=self.refine_var,
+            width=140,
+            command=self.refine_result_set
+        )
+        self.refine_menu.grid(
+            row=8,
+            column=2,
+            pady=10
+        )
+
         self.toggle_theme_button = ctk.CTkButton(
             self,
             text="☀️",
@@ -202,6 +313,165 @@ class BookWormApp(ctk.CTk):
             pady=10
         )
 
+        if local_replica is not None:
+            self.replica_status_label = ctk.CTkLabel(
+                self,
+                text=local_replica.status(),
+                font=("Helvetica", 11)
+            )
+            self.replica_status_label.grid(
+                row=9,
+                column=0,
+                columnspan=2,
+                sticky="w",
+                padx=10
+            )
+
+            local_replica.on_ready = lambda: Session.kw["router"].add_replica(local_replica.engine)
+            local_replica.start()
+
+            self.update_replica_status()
+
+        self.maintenance = MaintenanceScheduler(self)
+        self.add_maintenance_jobs()
+
+        self.process_book_changes()
+        self.watch_viewport()
+
+    def add_maintenance_jobs(self):
+        """
+            Jobs run while the user leaves the app alone; any key, click or
+            scroll cancels the running one.
+        """
+        for sequence in ("<KeyPress>", "<ButtonPress>", "<MouseWheel>"):
+            self.bind_all(sequence, self.maintenance.activity, add="+")
+
+        self.maintenance.add(MaintenanceJob(
+            "analyze books",
+            lambda token: analyze_books(engine, token),
+            priority=1,
+            budget_seconds=60,
+            changes_threshold=ANALYZE_AFTER_CHANGES
+        ))
+        self.maintenance.add(MaintenanceJob(
+            "statistics",
+            self.statistics_model.maintain,
+            priority=2,
+            budget_seconds=60,
+            interval_seconds=STATISTICS_INTERVAL_SECONDS,
+            due=lambda: self.statistics_model.needs_maintenance
+        ))
+        self.maintenance.add(MaintenanceJob(
+            "indexes and caches",
+            self.maintain_indexes,
+            priority=3,
+            budget_seconds=5,
+            interval_seconds=INDEXES_INTERVAL_SECONDS,
+            main_thread=True
+        ))
+
+        if local_replica is not None:
+            self.maintenance.add(MaintenanceJob(
+                "tidy local copy",
+                local_replica.tidy,
+                priority=4,
+                budget_seconds=120,
+                interval_seconds=TIDY_INTERVAL_SECONDS
+            ))
+        elif engine.dialect.name == "sqlite":
+            self.maintenance.add(MaintenanceJob(
+                "tidy database file",
+                lambda token: tidy_sqlite(engine, token),
+                priority=4,
+                budget_seconds=120,
+                interval_seconds=TIDY_INTERVAL_SECONDS
+            ))
+
+        self.maintenance.start()
+
+    def maintain_indexes(self, token):
+        """
+            Compacts what the Tk thread changes on every change event, and
+            starts the rebuild of stale search indexes.
+        """
+        done = []
+
+        steps = (
+            ("column store", self.statistics_model.compact),
+            ("duplicates", self.duplicates_model.compact),
+            ("suggestions", self.suggestions_model.refresh),
+            ("similar books", self.similar_books_model.refresh),
+        )
+
+        for name, step in steps:
+            if token.cancelled:
+                break
+
+            if step():
+                done.append(name)
+
+        # Read-ahead pages of lists no longer shown.
+        self.prefetcher.cache.discard_where(lambda key: key[0] == "page" and key[1] is not self.result_set)
+
+        return ", ".join(done) or None
+
+    def update_replica_status(self):
+        self.replica_status_label.configure(text=local_replica.status())
+        self.after(1000, self.update_replica_status)
+
+    def process_book_changes(self):
+        # Re-armed even when a change fails to apply, so that one bad event
+        # does not stop the ones after it.
+        try:
+            while True:
+                try:
+                    change = self.book_changes.get_nowait()
+                except queue.Empty:
+                    break
+
+                self.apply_book_change(change)
+
+            if self.facets_changed:
+                self.facets_changed = False
+                self.show_facets()
+        finally:
+            self.after(200, self.process_book_changes)
+
+    def apply_book_change(self, change):
+        """
+            Patches the visible list and the statistics with one change
+            instead of reloading the books.
+        """
+        row_change = self.book_list_model.apply_change(change)
+
+        self.statistics_model.apply(change)
+        self.suggestions_model.apply(change)
+        self.duplicates_model.apply(change)
+        self.similar_books_model.apply(change)
+        self.maintenance.apply(change)
+        self.prefetcher.invalidate(change)
+
+        if self.facet_model.apply_change(change, self.result_set):
+            self.facets_changed = True
+
+        if row_change is None:
+            return
+
+        op, book, position = row_change
+
+        if op == "remove":
+            self.remove_book_row(book)
+        elif op == "update":
+            self.update_book_row(book, position)
+        elif self.table_view.get():
+            self.book_table.add_book(book, position)
+        else:
+            self.add_book_row(book, position)
+
+    @property
+    def result_set(self):
+        return self.book_list_model.result_set
+
     @property
     def genres(self):
         with Session() as session:
@@ -224,75 +494,7 @@ class BookWormApp(ctk.CTk):
 
             self.toggle_theme_button.configure(text="☀️")
 
-    @staticmethod
-    def make_empty_entries(window):
-        for widget in window.winfo_children():
-            if isinstance(widget, ctk.CTkEntry):
-                widget.delete(0, len(widget.get()))
-
-    @staticmethod
-    def get_all_entries(window: ctk.CTkToplevel):
-        entries = []
-
-        for widget in window.winfo_children():
-            if isinstance(widget, ctk.CTkEntry):
-                entries.append(widget)
-
-        return entries
-
-    @staticmethod
-    def add_header_label(master, row, text_of_label, font_size, columnspan, upper_pady, lower_pady):
-        label = ctk.CTkLabel(
-            master,
-            text=text_of_label,
-            font=("Segoe UI", font_size, "bold")
-        )
-        label.grid(
-            row=row,
-            column=0,
-            columnspan=columnspan,
-            sticky="n",
-            pady=(upper_pady, lower_pady))
-
-        return label
-
-    @staticmethod
-    def add_entry_and_entry(master, row, text_of_label, width, placeholder=None):
-        label = ctk.CTkLabel(
-            master,
-            text=text_of_label
-        )
-        label.grid(
-            column=0,
-            row=row,
-            pady=10,
-            padx=10,
-            sticky="e"
-        )
-
-        entry = ctk.CTkEntry(
-            master,
-            width=width,
-            placeholder_text=placeholder or "",
-            justify="center"
-        )
-        entry.grid(
-            row=row,
-            column=1,
-            sticky="w"
-        )
-
-        return entry
-
-
-    def bind_arrow_keys_to_entry(self, window: ctk.CTkToplevel):
-        entries = self.get_all_entries(window)
-
-        for i, entry in enumerate(entries):
-            if i > 0:
-                entry.bind("<Up>", self.move_on_previous_entry)
-            if i < len(entries) - 1:
-                entry.bind("<Down>", self.move_on_next_entry)
+        self.book_table.apply_theme()
 
     @staticmethod
     def check_if_book_exists_by_title(title: str):
@@ -312,553 +514,537 @@ class BookWormApp(ctk.CTk):
         for book in self.scrollable_frame_books.winfo_children():
             book.destroy()
 
+        self.book_rows = {}
+        self.no_books_label = None
+        self.partial_result_label = None
+
     def search_book(self):
         try:
+            query = self.search_model.search(self.search_choice.get(), self.search_entry.get())
+        except (ValueError, NegativeYearError):
+            messagebox.showerror("Invalid year!", "Year must be a postivie integer number!")
+            return
+
+        self.load_result_set(query)
+
+    def delete_book(self, book):
+        # By id: other books may have the same title.
+        user_answer = messagebox.askyesno("Are you sure?", f'Are you sure you want to delete "{book.title}"?')
+
+        if user_answer:
             with Session() as session:
                 repo = Repo(session)
 
-                mapper_for_searching_options = {
-                    "title": repo.get_books_by_title_contain,
-                    "author": repo.get_books_by_author_contain,
-                    "genre": repo.get_books_by_genre_contain,
-                    "year": repo.get_books_by_year,
-                    "description": repo.get_books_by_description_contain,
-                    "isbn": repo.get_books_by_isbn_contain
-                }
+                repo.delete_book_by_id(book.id)
 
-                search_entry_value = self.search_entry.get().strip()
+                messagebox.showinfo("Successful deletion!", f'"{book.title}" was deleted successfully!')
 
-                if not search_entry_value:
-                    books = repo.get_all_books()
-                else:
-                    search_value_option = self.search_choice.get()
+    def edit_book(self, book):
+        self.suggestions_model.prepare()
+        self.dialogs.open("edit", book)
 
-                    if search_entry_value == "year":
-                        search_entry_value = int(search_entry_value)
+    def update_book_from_dialog(self, dialog: EditDialog):
+        book = dialog.book
 
-                        if 0 > search_entry_value:
-                            raise NegativeYearError
+        new_title = dialog.title_entry.get().strip()
+        new_author = dialog.author_entry.get().strip()
+        new_genre = dialog.genre_entry.get().strip()
+        new_description = dialog.description_entry.get().strip()
+        new_year = dialog.year_entry.get().strip()
+        new_isbn = dialog.isbn_entry.get().strip()
 
-                    books = mapper_for_searching_options[search_value_option](search_entry_value)
+        try:
+            if new_year:
+                new_year = int(new_year)
 
-                self.add_books_to_scrollable_frame(books)
-        except (ValueError, NegativeYearError):
-            messagebox.showerror("Invalid year!", "Year must be a postivie integer number!")
+                if new_year < 0:
+                    raise NegativeYearError
 
-    def delete_book(self, title: str):
-        user_answer = messagebox.askyesno("Are you sure?", f'Are you sure you want to delete "{title}"?')
+            with Session() as session:
+                repo = Repo(session)
 
-        if user_answer:
+                book.version = repo.update_book(
+                    book.id,
+                    new_title,
+                    new_author,
+                    new_genre,
+                    new_description,
+                    new_year,
+                    new_isbn,
+                    version=book.version)
+
+                messagebox.showinfo("Successful update!", "The book was successfully updated!")
+
+                make_empty_entries(dialog)
+        except StaleBookError as error:
+            self.refresh_stale_book(book, error.book)
+
+            # The entries are kept: the user checks the current values and
+            # presses Edit again to apply the changes on top of them.
+            messagebox.showwarning(
+                "Book changed meanwhile",
+                f'Someone else changed "{book.title}" after you opened it. The list now shows its current values: '
+                f'check them and press Edit again to apply your changes.'
+            )
+        except BookDoesNotExistError:
+            messagebox.showerror("Book deleted", f'"{book.title}" was deleted meanwhile!')
+        except InvalidISBNError:
+            messagebox.showerror("Invalid ISBN!", f"{new_isbn} is not a valid ISBN-10 or ISBN-13!")
+        except (ValueError, NegativeYearError):
+            messagebox.showerror("Invalid year!", "Year must be a positive integer number!")
+        except sqlalchemy.exc.IntegrityError:
+            messagebox.showerror("ISBN already used", f"{new_isbn} is already used!")
+
+    def change_book_read_status(self, book):
+        try:
             with Session() as session:
                 repo = Repo(session)
+                book.version = repo.update_book_read_status(book)
 
-                repo.delete_book_by_title(title)
+                book.is_read = not book.is_read
+        except StaleBookError as error:
+            self.refresh_stale_book(book, error.book)
 
-                self.prepare_books()
+            messagebox.showwarning(
+                "Book changed meanwhile",
+                f'Someone else changed "{book.title}" since it was shown. Its current values are shown now.'
+            )
+        except BookDoesNotExistError:
+            messagebox.showerror("Book deleted", f'"{book.title}" was deleted meanwhile!')
+
+    def refresh_stale_book(self, book, current_book):
+        """
+            Someone else changed book since it was read: it, and the list,
+            take the current values, as they would from the change event
+            still on its way, so that the next change is made on top of
+            them.
+        """
+        columns = {
+            name: getattr(current_book, name)
+            for name in Book.__table__.columns.keys() if name not in ("id", "library_id")
+        }
+
+        for name, value in columns.items():
+            setattr(book, name, value)
+
+        self.apply_book_change(ChangeEvent(book.id, "update", columns, library_id=current_book.library_id))
 
-                messagebox.showinfo("Successful deletion!", f'"{title}" was deleted successfully!')
+    def filter_by_genre(self, event=None):
+        genre_option = self.genre_chosen_var.get()
 
-    def edit_book(self, book):
-        def update_book(event=None):
-            new_title = title_entry.get().strip()
-            new_author = author_entry.get().strip()
-            new_genre = genre_entry.get().strip()
-            new_description = description_entry.get().strip()
-            new_year = year_entry.get().strip()
-            new_isbn = isbn_entry.get().strip()
+        if genre_option == "No genre":
+            self.prepare_books()
+            return
+        elif genre_option not in self.genres:
+            messagebox.showerror("Invalid Genre!", "Invalid genre option!")
+            return
 
-            try:
-                if new_year:
-                    new_year = int(new_year)
+        self.load_result_set(self.search_model.genre(genre_option))
 
-                    if new_year < 0:
-                        raise NegativeYearError
+    def show_facets(self):
+        """
+            Offers the genres, decades and read statuses of the results, with
+            their counts, as refinements.
+        """
+        self.refinements = self.facet_model.refinements(self.result_set)
 
-                with Session() as session:
-                    repo = Repo(session)
+        self.refine_menu.configure(
+            values=list(self.refinements),
+            state="normal" if self.refinements else "disabled"
+        )
+        self.refine_var.set("Refine")
 
-                    repo.update_book(
-                        book.id,
-                        new_title,
-                        new_author,
-                        new_genre,
-                        new_description,
-                        new_year,
-                        new_isbn)
+    def refine_result_set(self, label: str):
+        self.refine_var.set("Refine")
 
-                    self.prepare_books()
-                    messagebox.showinfo("Successful update!", "The book was successfully updated!")
+        if label not in self.refinements:
+            return
 
-                    self.make_empty_entries(edit_window)
-            except ValueError or NegativeYearError:
-                messagebox.showerror("Invalid year!", "Year must be a positive integer number!")
-            except sqlalchemy.exc.IntegrityError:
-                messagebox.showerror("ISBN already used", f"{new_isbn} is already used!")
+        facet, value = self.refinements[label]
 
+        self.load_result_set(self.facet_model.refine(self.result_set, facet, value))
 
-        title_of_book = book.title
+    def prepare_books(self, event=None):
+        self.load_result_set(self.search_model.every_book())
 
-        edit_window = ctk.CTkToplevel()
+    @property
+    def result_set_limit(self):
+        return TABLE_RESULT_SET_LIMIT if self.table_view.get() else RESULT_SET_LIMIT
+
+    def load_result_set(self, query: Query):
+        """
+            Streams the first result_set_limit books of a query, in the
+            chosen order, into the list a slice at a time. A load still in
+            progress is cancelled. The deferred columns are left out and
+            read ahead by the Prefetcher for the books in view.
+        """
+        self.book_loader.cancel()
+        self.prefetcher.forget_pages()
+        self.clear_book_list()
+
+        self.book_list_model.begin(query, ORDER_BY_OPTION.get(self.order_option.get()), self.result_set_limit)
+
+        def render_book(book):
+            if self.book_list_model.accept(book):
+                self.show_book_row(book)
+
+        def finish_loading():
+            self.book_list_model.finish()
+            self.show_book_list_footer()
+            self.show_facets()
+
+        self.book_loader.start(self.book_list_model.stream, render_book, finish_loading)
+
+    def reload_result_set(self):
+        result_set = self.result_set
+
+        self.load_result_set(Query(result_set.criteria, result_set.matches, result_set.deferred, result_set.key))
+
+    def toggle_view(self):
+        """
+            Switches between the list of cards and the table. The table can
+            hold more books, so an incomplete result is loaded again.
+        """
+        if self.table_view.get():
+            self.remove_book_from_scrollable_frame()
+            self.scrollable_frame_books.grid_remove()
+            self.book_table.grid()
+        else:
+            self.book_table.clear()
+            self.book_table.grid_remove()
+            self.scrollable_frame_books.grid()
 
-        width = 400
-        height = 410
+        if self.book_list_model.fits(self.result_set_limit):
+            self.add_books_to_scrollable_frame(self.result_set)
+        else:
+            self.reload_result_set()
 
-        edit_window.title(f'Edit "{title_of_book}"')
-        edit_window.geometry(f"{width}x{height}")
-        edit_window.bind("<Return>", update_book)
+    def toggle_book_read_status_in_table(self, book):
+        self.change_book_read_status(book)
+        self.book_table.update_book(book)
 
-        edit_window.columnconfigure((0, 1), weight=1)
+    def change_order(self, event=None):
+        """
+            Re-sorts the listed books in memory when they are the whole
+            result, and asks the database for the new first page otherwise.
+        """
+        order_option = self.order_option.get()
 
-        placeholder_text = "leave blank if no edit is needed"
-        width_of_entries = 220
+        if order_option not in ORDER_BY_OPTION:
+            messagebox.showerror("Invalid option!", "Invalid order option!")
+            return
 
-        edit_label = self.add_header_label(
-            edit_window,
-            0,
-            f'Edit - "{title_of_book}"',
-            20,
-            2,
-            20,
-            10
-        )
+        if not self.book_list_model.sort(ORDER_BY_OPTION[order_option]):
+            self.reload_result_set()
+            return
 
-        title_entry = self.add_entry_and_entry(
-            edit_window,
-            1,
-            "Title:",
-            width_of_entries,
-            placeholder_text)
-        title_entry.focus_set()
+        self.repack_book_rows()
 
+    def show_books_information(self, book):
+        self.prefetcher.load_deferred_values(book)
+        self.similar_books_model.prepare()
 
-        author_entry = self.add_entry_and_entry(
-            edit_window,
-            2,
-            "Author:",
-            width_of_entries,
-            placeholder_text
-        )
+        self.dialogs.open("details", book)
 
-        genre_entry = self.add_entry_and_entry(
-            edit_window,
-            3,
-            "Genre:",
-            width_of_entries,
-            placeholder_text
-        )
+    def add_books_to_scrollable_frame(self, result_set: ResultSet):
+        self.book_loader.cancel()
+        self.book_list_model.show(result_set)
 
-        description_entry = self.add_entry_and_entry(
-            edit_window,
-            4,
-            "Description:",
-            width_of_entries,
-            placeholder_text
-        )
+        if self.table_view.get():
+            self.book_table.show_books(result_set.books, self.book_list_model.partial_result_text())
+            return
 
-        year_entry = self.add_entry_and_entry(
-            edit_window,
-            5,
-            "Year:",
-            width_of_entries,
-            placeholder_text
-        )
+        self.remove_book_from_scrollable_frame()
 
-        isbn_entry = self.add_entry_and_entry(
-            edit_window,
-            6,
-            "ISBN:",
-            width_of_entries,
-            placeholder_text
-        )
+        for book in self.result_set.books:
+            self.add_book_row(book)
 
-        edit_button = ctk.CTkButton(
-            edit_window,
-            command=update_book,
-            text="Edit"
-        )
-        edit_button.grid(
-            row=7,
-            column=0,
-            columnspan=2,
-            pady=20,
-            sticky="s"
-        )
+        self.show_book_list_footer()
 
-        self.bind_arrow_keys_to_entry(edit_window)
+    def clear_book_list(self):
+        if self.table_view.get():
+            self.book_table.clear()
+        else:
+            self.remove_book_from_scrollable_frame()
 
-    def change_book_read_status(self, book):
-        with Session() as session:
-            repo = Repo(session)
-            repo.update_book_read_status(book)
+    def show_book_row(self, book):
+        if self.table_view.get():
+            self.book_table.add_book(book)
+        else:
+            self.add_book_row(book)
+
+    def show_book_list_footer(self):
+        """
+            "No Books found!" or the note about a partial result, once the
+            list is complete.
+        """
+        if self.result_set.complete:
+            self.load_more_button.grid_remove()
+        else:
+            self.load_more_button.grid()
 
-            self.prepare_books()
+        self.schedule_prefetch()
 
-    def filter_by_genre(self, event=None):
-        genre_option = self.genre_chosen_var.get()
+        if self.table_view.get():
+            self.book_table.set_note(self.book_list_model.footer_text())
+            return
 
-        if genre_option == "No genre":
-            self.prepare_books()
-        elif genre_option not in self.genres:
-            messagebox.showerror("Invalid Genre!", "Invalid genre option!")
+        if not self.result_set.books:
+            self.show_no_books_label()
+
+        self.show_partial_result_label()
+
+    def load_more_books(self):
+        """
+            Appends the next page of an incomplete result, usually already
+            read ahead by the Prefetcher.
+        """
+        if self.book_loader.loading:
             return
 
-        with Session() as session:
-            repo = Repo(session)
+        self.book_list_model.limit = self.result_set_limit
 
-            books = repo.filter_by_genre(genre_option)
+        for book in self.book_list_model.load_more():
+            self.show_book_row(book)
 
-            self.add_books_to_scrollable_frame(books)
+        if self.partial_result_label is not None:
+            self.partial_result_label.destroy()
+            self.partial_result_label = None
 
+        self.show_book_list_footer()
 
+    def books_in_view(self):
+        """
+            The listed books on screen, plus DETAILS_MARGIN on each side.
+        """
+        if self.table_view.get():
+            return self.book_list_model.books_in_view(*self.book_table.tree.yview())
 
-    def prepare_books(self, event=None):
-        with Session() as session:
-            repo = Repo(session)
-            order_option = self.order_option.get()
-
-            if "No order" in order_option:
-                books = repo.get_all_books()
-            elif "Title" in order_option:
-                books = repo.order_by_title(True if "A-Z" in order_option else False)
-            elif "Author" in order_option:
-                books = repo.order_by_author(True if "A-Z" in order_option else False)
-            elif "Year" in order_option:
-                books = repo.order_by_year(True if "Earliest" in order_option else False)
-            elif "Added on" in order_option:
-                books = repo.order_by_added_on(True if "Earliest" in order_option else False)
-            else:
-                messagebox.showerror("Invalid option!", "Invalid order option!")
-                return
+        return self.book_list_model.books_in_view(*self.scrollable_frame_books._parent_canvas.yview())
 
-            self.add_books_to_scrollable_frame(books)
+    def schedule_prefetch(self):
+        self.prefetcher.schedule(self.result_set, self.result_set_limit + 1, self.books_in_view())
 
-    @staticmethod
-    def show_books_information(book):
-        title_of_book = book.title
-        author_of_book = book.author
-        genre_of_book = book.genre
-        year_of_book = book.year
-        description_of_book = book.description
-        isbn_of_book = book.isbn
-        is_read = book.is_read
-        added_on = book.added_on
+    def watch_viewport(self):
+        """
+            Reads ahead around the visible books whenever the list has been
+            scrolled.
+        """
+        if self.table_view.get():
+            viewport = self.book_table.tree.yview()
+        else:
+            viewport = self.scrollable_frame_books._parent_canvas.yview()
 
-        width = 400
-        height = 500
+        if viewport != self.viewport and not self.book_loader.loading:
+            self.viewport = viewport
+            self.schedule_prefetch()
 
-        padding = 10
+        self.after(250, self.watch_viewport)
 
-        book_detail_window = ctk.CTkToplevel()
-        book_detail_window.title(title_of_book)
-        book_detail_window.geometry(f"{width}x{height}")
+    def show_partial_result_label(self):
+        if self.result_set.complete:
+            return
 
-        book_title_label = ctk.CTkLabel(
-            book_detail_window,
-            text=title_of_book,
-            font=("Segoe UI", 20, "bold")
-        )
-        book_title_label.pack(
-            pady=(20, 10)
+        self.partial_result_label = ctk.CTkLabel(
+            self.scrollable_frame_books,
+            text=self.book_list_model.partial_result_text(),
+            font=("Segoe UI", 13)
         )
+        self.partial_result_label.pack(pady=15)
 
-        book_author_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Author:\n{author_of_book}"
-        )
-        book_author_label.pack(
-            pady=padding
-        )
+    def repack_book_rows(self):
+        """
+            Puts the existing rows in the order of the result set, without
+            building them again.
+        """
+        if self.table_view.get():
+            self.book_table.reorder(self.result_set.books)
+            return
 
-        book_genre_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Genre:\n{genre_of_book}"
-        )
-        book_genre_label.pack(
-            pady=padding
-        )
+        for book in self.result_set.books:
+            self.book_rows[book.id][1].pack_forget()
 
-        book_year_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Year:\n{year_of_book if year_of_book else "No year"}"
-        )
-        book_year_label.pack(
-            pady=padding
-        )
+        for book in self.result_set.books:
+            self.book_rows[book.id][1].pack()
 
-        book_description_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Description:\n{description_of_book if description_of_book else "No description"}",
-            wraplength=400
-        )
-        book_description_label.pack(
-            pady=padding
-        )
+        if self.partial_result_label is not None:
+            self.partial_result_label.pack_forget()
+            self.partial_result_label.pack(pady=15)
 
-        book_isbn_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"ISBN:\n{isbn_of_book if isbn_of_book else "No ISBN"}",
-            wraplength=400
-        )
-        book_isbn_label.pack(
-            pady=padding
+    def show_no_books_label(self):
+        self.no_books_label = ctk.CTkLabel(
+            self.scrollable_frame_books,
+            text="No Books found!",
+            pady=80,
+            font=("Segoe UI", 20)
         )
+        self.no_books_label.pack()
 
-        book_is_read_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Is read:\n{"Yes" if is_read else "No"}",
-            wraplength=400
-        )
-        book_is_read_label.pack(
-            pady=padding
-        )
+    def add_book_row(self, book, position: int=None):
+        """
+            Adds the row of a book at the end of the list, or before the row
+            currently at position.
+        """
+        if self.no_books_label is not None:
+            self.no_books_label.destroy()
+            self.no_books_label = None
 
-        book_added_on_label = ctk.CTkLabel(
-            book_detail_window,
-            text=f"Added on:\n{added_on.strftime("%d %B, %Y at %H:%M")}",
-            wraplength=400
+        book_row = ctk.CTkFrame(
+            self.scrollable_frame_books,
+            fg_color="transparent"
         )
-        book_added_on_label.pack(
-            pady=padding
+
+        next_books = self.result_set.books[position + 1:position + 2] if position is not None else []
+
+        if next_books and next_books[0].id in self.book_rows:
+            book_row.pack(before=self.book_rows[next_books[0].id][1])
+        elif self.partial_result_label is not None:
+            book_row.pack(before=self.partial_result_label)
+        else:
+            book_row.pack()
+
+        book_for_frame = ctk.CTkLabel(
+            book_row,
+            text=card_text(book),
+            font=("Helvetica", 15)
         )
+        book_for_frame.pack(pady=(20, 9))
 
-    def add_books_to_scrollable_frame(self, books: Book):
-        self.remove_book_from_scrollable_frame()
+        width_for_buttons = 60
 
-        if not books:
-            ctk.CTkLabel(
-                self.scrollable_frame_books,
-                text="No Books found!",
-                pady=80,
-                font=("Segoe UI", 20)
-            ).pack()
-
-        for book in books:
-            book_for_frame = ctk.CTkLabel(
-                self.scrollable_frame_books,
-                text=f"Title: {book.title}\n"
-                     f"Author: {book.author}\n"
-                     f"Genre: {book.genre}\n"
-                     f"ISBN: {book.isbn if book.isbn else "No ISBN"}",
-                font=("Helvetica", 15)
-            )
-            book_for_frame.pack(pady=(20, 9))
-
-            width_for_buttons = 60
-
-            is_read_value = ctk.BooleanVar(value=book.is_read)
-            is_read_checkbox = ctk.CTkCheckBox(
-                self.scrollable_frame_books,
-                text="Read",
-                command=lambda b=book: self.change_book_read_status(b),
-                variable=is_read_value,
-                onvalue=True,
-                offvalue=False,
-            )
-            is_read_checkbox.pack(pady=10)
-
-            more_details_button = ctk.CTkButton(
-                self.scrollable_frame_books,
-                command=lambda b=book: self.show_books_information(b),
-                text="Details",
-                width=width_for_buttons,
-                fg_color="green",
-            )
-            more_details_button.pack(pady=5)
+        is_read_value = ctk.BooleanVar(value=book.is_read)
+        is_read_checkbox = ctk.CTkCheckBox(
+            book_row,
+            text="Read",
+            command=lambda b=book: self.change_book_read_status(b),
+            variable=is_read_value,
+            onvalue=True,
+            offvalue=False,
+        )
+        is_read_checkbox.pack(pady=10)
 
-            edit_button = ctk.CTkButton(
-                self.scrollable_frame_books,
-                command=lambda b=book: self.edit_book(b),
-                text="Edit",
-                width=width_for_buttons,
-            )
-            edit_button.pack(pady=5)
-
-            delete_button = ctk.CTkButton(
-                self.scrollable_frame_books,
-                command=lambda b=book: self.delete_book(b.title),
-                text="Delete",
-                width=width_for_buttons,
-                fg_color="red"
-            )
-            delete_button.pack(pady=(5, 15))
+        more_details_button = ctk.CTkButton(
+            book_row,
+            command=lambda b=book: self.show_books_information(b),
+            text="Details",
+            width=width_for_buttons,
+            fg_color="green",
+        )
+        more_details_button.pack(pady=5)
 
-    def open_add_book_window(self, event=None):
-        def mark_all_required_empty_fields():
-            count = 1
-            for widget in add_book_window.winfo_children():
-                if isinstance(widget, ctk.CTkEntry) and not widget.get():
-                    widget.configure(border_color="red")
-                    count += 1
-
-                if count == 3:
-                    break
+        edit_button = ctk.CTkButton(
+            book_row,
+            command=lambda b=book: self.edit_book(b),
+            text="Edit",
+            width=width_for_buttons,
+        )
+        edit_button.pack(pady=5)
+
+        delete_button = ctk.CTkButton(
+            book_row,
+            command=lambda b=book: self.delete_book(b),
+            text="Delete",
+            width=width_for_buttons,
+            fg_color="red"
+        )
+        delete_button.pack(pady=(5, 15))
+
+        self.book_rows[book.id] = (book, book_row, book_for_frame, is_read_value)
+
+    def update_book_row(self, book, new_position: int=None):
+        """
+            Shows the new values of a book; new_position is its place in the
+            result set when the change moved it.
+        """
+        if self.table_view.get():
+            self.book_table.update_book(book, new_position)
+            return
 
-        def mark_single_entry(entry):
-            entry.configure(border_color="red")
-
-        def add_book(event=None):
-            title = entry_for_title.get().strip()
-            author = entry_for_author.get().strip()
-            genre = entry_for_genre.get().strip()
-            year = entry_for_year.get().strip()
-            description = entry_for_description.get().strip()
-            isbn = entry_for_isbn.get().strip()
-
-            try:
-                if not title or not author or not genre:
-                    raise EmptyFieldError
-
-                if year:
-                    year = int(year) # If it is not a number, it will throw a ValueError that will be caught
-
-                    if year < 0:
-                        raise NegativeYearError # The app does not support BC yet
-
-                with Session() as session:
-                    repo = Repo(session)
-
-                    repo.add_book(
-                        title,
-                        author,
-                        genre,
-                        description if description else None,
-                        year if year else None,
-                        isbn if isbn else None
-                    )
-
-                    self.prepare_books()
-                    messagebox.showinfo("Successfully added", f'"{title}" added successfully to library!')
-                    self.make_empty_entries(add_book_window)
-            except EmptyFieldError:
-                mark_all_required_empty_fields()
-            except (ValueError, NegativeYearError):
-                mark_single_entry(entry_for_year)
-            except sqlalchemy.exc.IntegrityError:
-                mark_single_entry(entry_for_isbn)
-
-        add_book_window = ctk.CTkToplevel()
-        add_book_window.title("Add book to library")
-        add_book_window.bind("<Return>", add_book)
-
-        width = 440
-        height = 495
-
-        x = 25
-        y = (self.winfo_screenheight() // 2) - (height // 2)
+        _, _, book_for_frame, is_read_value = self.book_rows[book.id]
 
-        add_book_window.geometry(f"{width}x{height}+{x}+{y}")
+        book_for_frame.configure(text=card_text(book))
+        is_read_value.set(book.is_read)
 
-        add_book_window.columnconfigure((0, 1), weight=1)
+        if new_position is not None:
+            self.repack_book_rows()
 
-        width_of_entries = 220
+    def remove_book_row(self, book):
+        if self.table_view.get():
+            self.book_table.remove_book(book)
+            return
 
-        add_book_label = self.add_header_label(
-            add_book_window,
-            0,
-            "Add New Book:",
-            20,
-            2,
-            20,
-            10
-        )
+        _, book_row, _, _ = self.book_rows.pop(book.id)
+        book_row.destroy()
 
-        required_field_label = ctk.CTkLabel(
-            add_book_window,
-            text="--- Required fields ---",
-            font=("Helvetica", 13)
-        )
-        required_field_label.grid(
-            row=1,
-            column=0,
-            columnspan=2,
-            sticky="s",
-            pady=(0, 10)
-        )
+        if not self.result_set.books:
+            self.show_no_books_label()
 
-        entry_for_title = self.add_entry_and_entry(
-            add_book_window,
-            2,
-            "Title:",
-            width_of_entries
-        )
-        entry_for_title.focus_set()
+    def open_add_book_window(self, event=None):
+        self.suggestions_model.prepare()
+        self.duplicates_model.prepare()
+        self.dialogs.open("add")
+
+    def add_book_from_dialog(self, dialog: AddBookDialog):
+        title = dialog.title_entry.get().strip()
+        author = dialog.author_entry.get().strip()
+        genre = dialog.genre_entry.get().strip()
+        year = dialog.year_entry.get().strip()
+        description = dialog.description_entry.get().strip()
+        isbn = dialog.isbn_entry.get().strip()
 
-        entry_for_author = self.add_entry_and_entry(
-            add_book_window,
-            3,
-            "Author:",
-            width_of_entries
-        )
+        try:
+            if not title or not author or not genre:
+                raise EmptyFieldError
 
-        entry_for_genre = self.add_entry_and_entry(
-            add_book_window,
-            4,
-            "Genre:",
-            width_of_entries
-        )
+            if year:
+                year = int(year) # If it is not a number, it will throw a ValueError that will be caught
 
-        optional_field_label = ctk.CTkLabel(
-            add_book_window,
-            text="--- Optional fields ---",
-            font=("Helvetica", 13)
-        )
-        optional_field_label.grid(
-            row=5,
-            column=0,
-            columnspan=2,
-            sticky="s",
-            pady=(10, 10)
-        )
+                if year < 0:
+                    raise NegativeYearError # The app does not support BC yet
 
-        entry_for_description = self.add_entry_and_entry(
-            add_book_window,
-            6,
-            "Description:",
-            width_of_entries
-        )
+            duplicates = self.duplicates_model.check(title, author)
 
-        entry_for_year = self.add_entry_and_entry(
-            add_book_window,
-            7,
-            "Year:",
-            width_of_entries,
-            "e.g. 2025"
-        )
+            if duplicates:
+                listed = "\n".join(f'"{book.title}" by {book.author}' for book in duplicates[:3])
+                answer = messagebox.askyesno(
+                    "Possible duplicate",
+                    f"The library already has:\n\n{listed}\n\nAdd \"{title}\" anyway?"
+                )
 
-        entry_for_isbn = self.add_entry_and_entry(
-            add_book_window,
-            8,
-            "ISBN:",
-            width_of_entries
-        )
+                if not answer:
+                    return
 
-        add_book_button = ctk.CTkButton(
-            add_book_window,
-            text="Add book",
-            command=add_book
-        )
-        add_book_button.grid(
-            row=9,
-            column=0,
-            columnspan=2,
-            pady=20,
-            sticky="s"
-        )
+            with Session() as session:
+                repo = Repo(session)
 
-        self.bind_arrow_keys_to_entry(add_book_window)
+                repo.add_book(
+                    title,
+                    author,
+                    genre,
+                    description if description else None,
+                    year if year else None,
+                    isbn if isbn else None
+                )
+
+                # The change event of the insert adds the row, to the
+                # current search if it matches: no reload.
+                messagebox.showinfo("Successfully added", f'"{title}" added successfully to library!')
+                dialog.reset_entries(dialog)
+        except EmptyFieldError:
+            dialog.mark_all_required_empty_fields()
+        except InvalidISBNError:
+            dialog.mark_single_entry(dialog.isbn_entry)
+        except (ValueError, NegativeYearError):
+            dialog.mark_single_entry(dialog.year_entry)
+        except sqlalchemy.exc.IntegrityError:
+            dialog.mark_single_entry(dialog.isbn_entry)
 
-    @staticmethod
-    def open_statistics_window(event=None):
+    def open_statistics_window(self, event=None):
         statistics_window = ctk.CTkToplevel()
 
         statistics_window.title("Statistics")
 
         width = 400
-        height = 445
-
-        padding_y = 10
-
-        statistics_window.geometry(f"{width}x{height}")
 
         statistics_window.columnconfigure((0, 1), weight=1)
 
@@ -871,109 +1057,210 @@ class BookWormApp(ctk.CTk):
             pady=(20, 10),
         )
 
+        mode = ctk.StringVar(value="Approximate" if self.statistics_model.approximate else "Exact")
 
-        with Session() as session:
-            repo = Repo(session)
+        def show_figures(value=None):
+            self.statistics_model.approximate = mode.get() == "Approximate"
 
-            total_books_count = repo.get_books_count()
-            read_count, unread_count = repo.get_read_and_unread_count()
+            # Approximate mode has more figures.
+            height = 620 if self.statistics_model.approximate else 485
+            statistics_window.geometry(f"{width}x{height}")
 
-            read_percentage = (read_count / total_books_count) * 100 if total_books_count else 0
-            unread_percentage = (unread_count / total_books_count) * 100 if total_books_count else 0
+            self.show_statistics(figures_frame)
 
-            most_common_genre = repo.get_most_common_genre()
+            if self.statistics_model.approximate and not self.statistics_model.sketches_ready:
+                statistics_window.after(500, wait_for_sketches)
 
-            most_recent_book = repo.oldest_book()
-            latest_book = repo.newest_book()
-
-            average_publication_year = repo.get_average_publication_year()
+        def wait_for_sketches():
+            """
+                Shows the sketch based figures once they are built.
+            """
+            if not statistics_window.winfo_exists() or not self.statistics_model.approximate:
+                return
 
-            books_added_in_the_past_month = repo.get_books_count_added_in_the_past_month()
+            if self.statistics_model.sketches_pending:
+                statistics_window.after(500, wait_for_sketches)
+            elif self.statistics_model.sketches_ready:
+                show_figures()
 
-        total_books_label = ctk.CTkLabel(
+        mode_button = ctk.CTkSegmentedButton(
             statistics_window,
-            text=f"📘Total number of books:\n{total_books_count}"
+            values=["Exact", "Approximate"],
+            variable=mode,
+            command=show_figures
         )
-        total_books_label.pack(
-            pady=padding_y,
-        )
-
+        mode_button.pack()
 
-        count_of_read_unread_books_label = ctk.CTkLabel(
+        figures_frame = ctk.CTkFrame(
             statistics_window,
-            text=f"📈Count of read/unread books:\n"
-                 f"{read_count} ({read_percentage:.0f}%) / {unread_count} ({unread_percentage:.0f}%)"
+            fg_color="transparent"
         )
-        count_of_read_unread_books_label.pack(
-            pady=padding_y,
+        figures_frame.pack(
+            fill="both",
+            expand=True
         )
 
-        read_unread_progress_bar = ctk.CTkProgressBar(
-            statistics_window,
-            orientation="horizontal",
-            fg_color="gray",
-            progress_color="green",
+        show_figures()
+
+    def show_statistics(self, frame):
+        padding_y = 10
+
+        for widget in frame.winfo_children():
+            widget.destroy()
+
+        lines, read_fraction = self.statistics_model.summary()
+
+        for i, line in enumerate(lines):
+            label = ctk.CTkLabel(
+                frame,
+                text=line
+            )
+            label.pack(
+                pady=padding_y
+            )
+
+            if i == 1:
+                read_unread_progress_bar = ctk.CTkProgressBar(
+                    frame,
+                    orientation="horizontal",
+                    fg_color="gray",
+                    progress_color="green",
+                )
+                read_unread_progress_bar.pack(
+                    pady=5
+                )
+                read_unread_progress_bar.set(read_fraction)
+
+    def open_duplicates_window(self, event=None):
+        duplicates_window = ctk.CTkToplevel()
+
+        duplicates_window.title("Duplicates")
+        duplicates_window.geometry("500x500")
+
+        duplicates_label = ctk.CTkLabel(
+            duplicates_window,
+            text="Possible duplicates:",
+            font=("Segoe UI", 20, "bold")
         )
-        read_unread_progress_bar.pack(
-            pady=5
+        duplicates_label.pack(
+            pady=(20, 10),
         )
-        read_unread_progress_bar.set(read_percentage/100)
 
-        most_common_genre_label = ctk.CTkLabel(
-            statistics_window,
-            text=f"📚Most common genre:\n{most_common_genre}"
+        groups = self.duplicates_model.report()
+
+        duplicates_textbox = ctk.CTkTextbox(
+            duplicates_window,
+            wrap="word"
         )
-        most_common_genre_label.pack(
-            pady=padding_y
+        duplicates_textbox.pack(
+            fill="both",
+            expand=True,
+            padx=20,
+            pady=(0, 20)
         )
 
-        most_recent_book_label = ctk.CTkLabel(
-            statistics_window,
-            text=f"📕Oldest book:\n{most_recent_book}"
+        if not groups:
+            duplicates_textbox.insert("end", "No duplicates found.")
+
+        for books in groups:
+            for book in books:
+                duplicates_textbox.insert("end", f'"{book.title}" by {book.author} (#{book.id})\n')
+
+            duplicates_textbox.insert("end", "\n")
+
+        duplicates_textbox.configure(state="disabled")
+
+    def open_diagnostics_window(self, event=None):
+        diagnostics_window = ctk.CTkToplevel()
+
+        diagnostics_window.title("Diagnostics")
+        diagnostics_window.geometry("600x550")
+
+        diagnostics_label = ctk.CTkLabel(
+            diagnostics_window,
+            text="Diagnostics:",
+            font=("Segoe UI", 20, "bold")
         )
-        most_recent_book_label.pack(
-            pady=padding_y
+        diagnostics_label.pack(
+            pady=(20, 10),
         )
 
-        latest_book_label = ctk.CTkLabel(
-            statistics_window,
-            text=f"📖Newest book:\n{latest_book}"
+        diagnostics_textbox = ctk.CTkTextbox(
+            diagnostics_window,
+            wrap="none",
+            font=("Courier", 12)
         )
-        latest_book_label.pack(
-            pady=padding_y
+        diagnostics_textbox.pack(
+            fill="both",
+            expand=True,
+            padx=20
         )
 
-        average_publication_year_label = ctk.CTkLabel(
-            statistics_window,
-            text=f"📅Average publication year:\n{average_publication_year:.0f}"
+        def show_diagnostics():
+            diagnostics_textbox.configure(state="normal")
+            diagnostics_textbox.delete("1.0", "end")
+            diagnostics_textbox.insert("end", self.diagnostics_text())
+            diagnostics_textbox.configure(state="disabled")
+
+        refresh_button = ctk.CTkButton(
+            diagnostics_window,
+            text="Refresh",
+            command=show_diagnostics
         )
-        average_publication_year_label.pack(
-            pady=padding_y
+        refresh_button.pack(
+            pady=10
         )
 
-        books_added_in_the_past_month_label = ctk.CTkLabel(
-            statistics_window,
-            text=f"🧮Books added in the past month:\n{books_added_in_the_past_month}"
-        )
-        books_added_in_the_past_month_label.pack(
-            pady=padding_y
+        show_diagnostics()
+
+    def diagnostics_text(self):
+        lines = ["Read-ahead cache"]
+        metrics = self.prefetcher.cache.metrics()
+        hit_rate = f"{metrics["hit_rate"]:.0%}" if metrics["hit_rate"] is not None else "n/a"
+
+        lines.append(
+            f"  {metrics["size"]}/{metrics["capacity"]} entries, {metrics["hits"]} hits, {metrics["misses"]} misses "
+            f"({hit_rate}), {metrics["evictions"]} evictions"
         )
 
-    def on_search_enter(self, event=None):
-        self.search_book()
+        lines += ["", "Windows (open time)"]
+        for name, timing in self.dialogs.timings().items():
+            lines.append(
+                f"  {name:<10} {timing["opens"]:>4} opens  first {timing["first_ms"]:7.1f} ms  "
+                f"median {timing["median_ms"]:6.1f} ms  max {timing["max_ms"]:7.1f} ms"
+            )
 
-    @staticmethod
-    def move_on_next_entry(event):
-        event.widget.tk_focusNext().focus()
-        return "break"
+        runs, jobs = self.maintenance.report()
 
-    @staticmethod
-    def move_on_previous_entry(event=None):
-        event.widget.tk_focusPrev().focus()
-        return "break"
+        lines += ["", "Maintenance jobs (last run)"]
+        for name, seconds_ago in jobs.items():
+            lines.append(f"  {name:<20} {"never" if seconds_ago is None else f"{seconds_ago:.0f} s ago"}")
+
+        lines += ["", "Maintenance runs"]
+        for run in runs:
+            detail = f" - {run["detail"]}" if run["detail"] else ""
+            lines.append(
+                f"  {run["started"]:%H:%M:%S}  {run["job"]:<20} {run["seconds"] * 1000:8.0f} ms  {run["outcome"]}{detail}"
+            )
+
+        if not runs:
+            lines.append("  none yet")
+
+        return "\n".join(lines)
+
+    def on_search_enter(self, event=None):
+        self.search_book()
 
     def close_window(self, event=None):
         answer = messagebox.askyesno("Are you sure?", "Are you sure you want ot quit BookWorm?")
 
         if answer:
+            self.book_loader.cancel()
+            self.prefetcher.shutdown()
+            self.statistics_model.shutdown()
+            self.suggestions_model.shutdown()
+            self.duplicates_model.shutdown()
+            self.similar_books_model.shutdown()
+            self.maintenance.shutdown()
+            self.unsubscribe_from_changes()
             self.destroy()
@@ -0,0 +1,92 @@
+import tkinter as tk
+
+import customtkinter as ctk
+
+
+SUGGESTIONS_SHOWN = 6
+
+# Keys that do not change the text of the entry.
+NAVIGATION_KEYS = {
+    "Up", "Down", "Left", "Right", "Home", "End", "Tab", "Return", "Escape",
+    "Shift_L", "Shift_R", "Control_L", "Control_R", "Alt_L", "Alt_R",
+}
+
+# Lets a click on a suggestion land before the focus leaving the entry
+# hides the list.
+HIDE_DELAY_MILLISECONDS = 150
+
+
+class SuggestionList:
+    """
+        A list under an entry, filled on every keystroke with
+        suggest(text). Clicking a suggestion puts it in the entry.
+    """
+    def __init__(self, entry: ctk.CTkEntry, suggest, size: int=SUGGESTIONS_SHOWN):
+        self.entry = entry
+        self.suggest = suggest
+        self.size = size
+
+        self.listbox = tk.Listbox(
+            entry.master,
+            height=size,
+            activestyle="none",
+            exportselection=False,
+            borderwidth=0,
+            highlightthickness=1,
+            takefocus=0
+        )
+        self.listbox.bind("<ButtonRelease-1>", self.choose)
+
+        entry.bind("<KeyRelease>", self.update)
+        entry.bind("<FocusOut>", lambda event: entry.after(HIDE_DELAY_MILLISECONDS, self.hide))
+
+    def apply_theme(self):
+        """
+            tk widgets do not follow customtkinter's appearance mode, so the
+            list is given the colors of the current one.
+        """
+        mode = 1 if ctk.get_appearance_mode() == "Dark" else 0
+        theme = ctk.ThemeManager.theme
+
+        self.listbox.configure(
+            background=theme["CTkFrame"]["fg_color"][mode],
+            foreground=theme["CTkLabel"]["text_color"][mode],
+            selectbackground=theme["CTkButton"]["fg_color"][mode],
+            highlightbackground=theme["CTkEntry"]["border_color"][mode]
+        )
+
+    def update(self, event=None):
+        if event is not None and event.keysym in NAVIGATION_KEYS:
+            return
+
+        text = self.entry.get()
+        suggestions = [value for value in self.suggest(text, self.size) if value != text] if text.strip() else []
+
+        if not suggestions:
+            self.hide()
+            return
+
+        self.listbox.delete(0, "end")
+        self.listbox.insert("end", *suggestions)
+        self.listbox.configure(height=len(suggestions))
+        self.apply_theme()
+
+        self.listbox.place(in_=self.entry, x=0, rely=1.0, relwidth=1.0)
+        self.listbox.lift()
+
+    def choose(self, event=None):
+        selection = self.listbox.curselection()
+
+        if not selection:
+            return
+
+        value = self.listbox.get(selection[0])
+
+        self.entry.delete(0, "end")
+        self.entry.insert(0, value)
+        self.entry.focus_set()
+        self.hide()
+
+    def hide(self, event=None):
+        self.listbox.place_forget()
+        self.listbox.selection_clear(0, "end")
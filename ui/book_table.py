@@ -0,0 +1,199 @@
+import tkinter as tk
+from tkinter import ttk
+
+import customtkinter as ctk
+
+from ui.view_models import table_row_values
+
+
+COLUMNS = (
+    # (column, heading, width)
+    ("title", "Title", 150),
+    ("author", "Author", 100),
+    ("genre", "Genre", 70),
+    ("isbn", "ISBN", 95),
+    ("is_read", "Read", 40),
+)
+
+
+class BookTable(ctk.CTkFrame):
+    """
+        The book list as a single ttk.Treeview: a book is one item of the
+        tree instead of a frame with a label, a checkbox and three buttons.
+
+        Row actions go through a handful of bindings on the tree (double
+        click and Return for details, space to toggle read, Delete, and a
+        right-click menu) that look the book up from the item under the
+        cursor, so no callback is created per row.
+    """
+    def __init__(self, master, on_details, on_edit, on_delete, on_toggle_read, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.on_details = on_details
+        self.on_edit = on_edit
+        self.on_delete = on_delete
+        self.on_toggle_read = on_toggle_read
+
+        self.books_by_id = {}
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(
+            self,
+            columns=[column for column, _, _ in COLUMNS],
+            show="headings",
+            selectmode="browse",
+            style="BookTable.Treeview",
+            height=14
+        )
+        for column, heading, width in COLUMNS:
+            self.tree.heading(column, text=heading)
+            self.tree.column(
+                column,
+                width=width,
+                anchor="center" if column == "is_read" else "w",
+                stretch=column != "is_read"
+            )
+        self.tree.grid(
+            row=0,
+            column=0,
+            sticky="nsew"
+        )
+
+        scrollbar = ctk.CTkScrollbar(
+            self,
+            command=self.tree.yview
+        )
+        scrollbar.grid(
+            row=0,
+            column=1,
+            sticky="ns"
+        )
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+        self.note_label = ctk.CTkLabel(
+            self,
+            text="",
+            font=("Segoe UI", 13)
+        )
+
+        self.menu = tk.Menu(self, tearoff=False)
+        self.menu.add_command(label="Details", command=lambda: self.run_on_selection(self.on_details))
+        self.menu.add_command(label="Edit", command=lambda: self.run_on_selection(self.on_edit))
+        self.menu.add_command(label="Toggle read", command=lambda: self.run_on_selection(self.on_toggle_read))
+        self.menu.add_separator()
+        self.menu.add_command(label="Delete", command=lambda: self.run_on_selection(self.on_delete))
+
+        self.tree.bind("<Double-1>", self.on_double_click)
+        self.tree.bind("<Return>", lambda event: self.run_on_selection(self.on_details))
+        self.tree.bind("<space>", lambda event: self.run_on_selection(self.on_toggle_read))
+        self.tree.bind("<Delete>", lambda event: self.run_on_selection(self.on_delete))
+        self.tree.bind("<Button-3>", self.open_menu)
+        self.tree.bind("<Button-2>", self.open_menu)
+
+        self.apply_theme()
+
+    def apply_theme(self):
+        """
+            ttk widgets do not follow customtkinter's appearance mode, so the
+            tree is given the colors of the current one.
+        """
+        mode = 1 if ctk.get_appearance_mode() == "Dark" else 0
+        theme = ctk.ThemeManager.theme
+
+        background = theme["CTkFrame"]["fg_color"][mode]
+        foreground = theme["CTkLabel"]["text_color"][mode]
+        selected = theme["CTkButton"]["fg_color"][mode]
+        heading = theme["CTkFrame"]["top_fg_color"][mode]
+
+        style = ttk.Style(self)
+        style.theme_use("default")
+        style.configure(
+            "BookTable.Treeview",
+            background=background,
+            fieldbackground=background,
+            foreground=foreground,
+            rowheight=26,
+            borderwidth=0
+        )
+        style.map("BookTable.Treeview", background=[("selected", selected)])
+        style.configure(
+            "BookTable.Treeview.Heading",
+            background=heading,
+            foreground=foreground,
+            relief="flat"
+        )
+
+    def show_books(self, books, note: str=None):
+        self.tree.delete(*self.tree.get_children())
+        self.books_by_id = {}
+
+        for book in books:
+            self.books_by_id[book.id] = book
+            self.tree.insert("", "end", iid=str(book.id), values=table_row_values(book))
+
+        self.set_note(note)
+
+    def set_note(self, note: str=None):
+        if note:
+            self.note_label.configure(text=note)
+            self.note_label.grid(
+                row=1,
+                column=0,
+                columnspan=2,
+                pady=5
+            )
+        else:
+            self.note_label.grid_remove()
+
+    def add_book(self, book, position: int=None):
+        self.books_by_id[book.id] = book
+        self.tree.insert("", "end" if position is None else position, iid=str(book.id), values=table_row_values(book))
+
+    def update_book(self, book, position: int=None):
+        self.tree.item(str(book.id), values=table_row_values(book))
+
+        if position is not None:
+            self.tree.move(str(book.id), "", position)
+
+    def remove_book(self, book):
+        self.books_by_id.pop(book.id, None)
+        self.tree.delete(str(book.id))
+
+    def reorder(self, books):
+        for position, book in enumerate(books):
+            self.tree.move(str(book.id), "", position)
+
+    def clear(self):
+        self.show_books([])
+
+    def selected_book(self):
+        selection = self.tree.selection()
+
+        return self.books_by_id.get(int(selection[0])) if selection else None
+
+    def run_on_selection(self, action):
+        book = self.selected_book()
+
+        if book is not None:
+            action(book)
+
+        return "break"
+
+    def select_row_at(self, event):
+        item = self.tree.identify_row(event.y)
+
+        if item:
+            self.tree.selection_set(item)
+            self.tree.focus(item)
+
+        return item
+
+    def on_double_click(self, event):
+        if self.select_row_at(event):
+            self.run_on_selection(self.on_details)
+
+    def open_menu(self, event):
+        if self.select_row_at(event):
+            self.menu.tk_popup(event.x_root, event.y_root)
@@ -0,0 +1,431 @@
+import collections
+import statistics
+import time
+
+import customtkinter as ctk
+
+from ui.autocomplete import SuggestionList
+from ui.widgets import add_header_label, add_entry_and_entry, make_empty_entries, bind_arrow_keys_to_entry
+
+
+# How many open() durations are kept per dialog.
+OPEN_TIMINGS_KEPT = 200
+
+SIMILAR_BOOKS_SHOWN = 5
+
+# How often the Details window asks again for similar books while they are
+# being indexed.
+SIMILAR_BOOKS_RETRY_MILLISECONDS = 500
+
+
+class PooledDialog(ctk.CTkToplevel):
+    """
+        A window built once and reused. Closing it only hides it, and open()
+        fills the same widgets with the data of the next book, so opening
+        it again costs a few configure() calls instead of a new Toplevel
+        with a dozen widgets.
+    """
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.protocol("WM_DELETE_WINDOW", self.hide)
+        self.bind("<Escape>", self.hide)
+
+        self.build()
+        self.withdraw()
+
+    def build(self):
+        raise NotImplementedError
+
+    def fill(self, *args):
+        raise NotImplementedError
+
+    def open(self, *args):
+        self.fill(*args)
+
+        self.deiconify()
+        self.lift()
+        self.focus()
+
+    def hide(self, event=None):
+        self.withdraw()
+
+    def add_suggestions(self, suggest):
+        """
+            Typeahead on the author and genre entries; suggest is called as
+            suggest(field, text, limit).
+        """
+        self.suggestion_lists = []
+
+        if suggest is None:
+            return
+
+        for field, entry in (("author", self.author_entry), ("genre", self.genre_entry)):
+            self.suggestion_lists.append(
+                SuggestionList(entry, lambda text, limit, field=field: suggest(field, text, limit))
+            )
+
+    def hide_suggestions(self):
+        for suggestion_list in self.suggestion_lists:
+            suggestion_list.hide()
+
+    @staticmethod
+    def reset_entries(window):
+        """
+            Empties the entries and clears the red border of failed
+            validation.
+        """
+        make_empty_entries(window)
+
+        for widget in window.winfo_children():
+            if isinstance(widget, ctk.CTkEntry):
+                widget.configure(border_color=ctk.ThemeManager.theme["CTkEntry"]["border_color"])
+
+
+class DetailsDialog(PooledDialog):
+    """
+        similar, when given, is called with the book shown and returns the
+        books to list under "Similar books" (None while they are not known
+        yet); clicking one calls on_details with it.
+    """
+    def __init__(self, master, similar=None, on_details=None, **kwargs):
+        self.similar = similar
+        self.on_details = on_details
+        self.book = None
+
+        super().__init__(master, **kwargs)
+
+    def build(self):
+        width = 400
+        height = 700 if self.similar is not None else 500
+
+        self.padding = 10
+
+        self.geometry(f"{width}x{height}")
+
+        self.title_label = ctk.CTkLabel(
+            self,
+            text="",
+            font=("Segoe UI", 20, "bold")
+        )
+        self.title_label.pack(
+            pady=(20, 10)
+        )
+
+        self.field_labels = {}
+
+        for field in ("author", "genre", "year", "description", "isbn", "is_read", "added_on"):
+            label = ctk.CTkLabel(
+                self,
+                text="",
+                wraplength=400
+            )
+            label.pack(
+                pady=self.padding
+            )
+
+            self.field_labels[field] = label
+
+        self.similar_label = ctk.CTkLabel(
+            self,
+            text="",
+            font=("Segoe UI", 14, "bold")
+        )
+        self.similar_buttons = [
+            ctk.CTkButton(
+                self,
+                text="",
+                fg_color="transparent",
+                border_width=1,
+                text_color=("gray10", "gray90"),
+                width=360
+            )
+            for _ in range(SIMILAR_BOOKS_SHOWN)
+        ]
+
+        if self.similar is not None:
+            self.similar_label.pack(
+                pady=(self.padding, 5)
+            )
+
+    def fill(self, book):
+        self.book = book
+        self.title(book.title)
+        self.title_label.configure(text=book.title)
+
+        texts = {
+            "author": f"Author:\n{book.author}",
+            "genre": f"Genre:\n{book.genre}",
+            "year": f"Year:\n{book.year if book.year else "No year"}",
+            "description": f"Description:\n{book.description if book.description else "No description"}",
+            "isbn": f"ISBN:\n{book.isbn if book.isbn else "No ISBN"}",
+            "is_read": f"Is read:\n{"Yes" if book.is_read else "No"}",
+            "added_on": f"Added on:\n{book.added_on.strftime("%d %B, %Y at %H:%M")}",
+        }
+
+        for field, text in texts.items():
+            self.field_labels[field].configure(text=text)
+
+        if self.similar is not None:
+            self.show_similar(book)
+
+    def show_similar(self, book):
+        if book is not self.book:
+            return
+
+        books = self.similar(book)
+
+        if books is None:
+            self.similar_label.configure(text="Similar books:\nLooking for them...")
+            self.after(
+                SIMILAR_BOOKS_RETRY_MILLISECONDS,
+                lambda: self.state() != "withdrawn" and self.show_similar(book)
+            )
+        else:
+            self.similar_label.configure(text="Similar books:" if books else "Similar books:\nNone found")
+
+        for button in self.similar_buttons:
+            button.pack_forget()
+
+        for button, similar_book in zip(self.similar_buttons, books or []):
+            button.configure(
+                text=f"{similar_book.title} by {similar_book.author}",
+                command=lambda similar_book=similar_book: self.on_details(similar_book)
+            )
+            button.pack(
+                pady=2
+            )
+
+    def hide(self, event=None):
+        # Do not keep the last shown book, nor its similar books through the
+        # button commands, alive while hidden.
+        self.book = None
+
+        for button in self.similar_buttons:
+            button.configure(command=None)
+
+        super().hide()
+
+
+class EditDialog(PooledDialog):
+    """
+        on_submit is called with the dialog when "Edit" or Return is
+        pressed; the book being edited is dialog.book. suggest, when given,
+        offers authors and genres as they are typed (see add_suggestions).
+    """
+    def __init__(self, master, on_submit, suggest=None, **kwargs):
+        self.on_submit = on_submit
+        self.suggest = suggest
+        self.book = None
+
+        super().__init__(master, **kwargs)
+
+    def build(self):
+        width = 400
+        height = 410
+
+        self.geometry(f"{width}x{height}")
+        self.bind("<Return>", lambda event: self.on_submit(self))
+
+        self.columnconfigure((0, 1), weight=1)
+
+        placeholder_text = "leave blank if no edit is needed"
+        width_of_entries = 220
+
+        self.edit_label = add_header_label(
+            self,
+            0,
+            "",
+            20,
+            2,
+            20,
+            10
+        )
+
+        self.title_entry = add_entry_and_entry(self, 1, "Title:", width_of_entries, placeholder_text)
+        self.author_entry = add_entry_and_entry(self, 2, "Author:", width_of_entries, placeholder_text)
+        self.genre_entry = add_entry_and_entry(self, 3, "Genre:", width_of_entries, placeholder_text)
+        self.description_entry = add_entry_and_entry(self, 4, "Description:", width_of_entries, placeholder_text)
+        self.year_entry = add_entry_and_entry(self, 5, "Year:", width_of_entries, placeholder_text)
+        self.isbn_entry = add_entry_and_entry(self, 6, "ISBN:", width_of_entries, placeholder_text)
+
+        edit_button = ctk.CTkButton(
+            self,
+            command=lambda: self.on_submit(self),
+            text="Edit"
+        )
+        edit_button.grid(
+            row=7,
+            column=0,
+            columnspan=2,
+            pady=20,
+            sticky="s"
+        )
+
+        bind_arrow_keys_to_entry(self)
+        self.add_suggestions(self.suggest)
+
+    def fill(self, book):
+        self.book = book
+
+        self.title(f'Edit "{book.title}"')
+        self.edit_label.configure(text=f'Edit - "{book.title}"')
+
+        self.reset_entries(self)
+        self.title_entry.focus_set()
+
+    def hide(self, event=None):
+        # Do not keep the last edited book alive while hidden.
+        self.book = None
+
+        self.hide_suggestions()
+        super().hide()
+
+
+class AddBookDialog(PooledDialog):
+    """
+        on_submit is called with the dialog when "Add book" or Return is
+        pressed. suggest, when given, offers authors and genres as they are
+        typed (see add_suggestions).
+    """
+    def __init__(self, master, on_submit, suggest=None, **kwargs):
+        self.on_submit = on_submit
+        self.suggest = suggest
+
+        super().__init__(master, **kwargs)
+
+    def build(self):
+        self.title("Add book to library")
+        self.bind("<Return>", lambda event: self.on_submit(self))
+
+        width = 440
+        height = 495
+
+        x = 25
+        y = (self.winfo_screenheight() // 2) - (height // 2)
+
+        self.geometry(f"{width}x{height}+{x}+{y}")
+
+        self.columnconfigure((0, 1), weight=1)
+
+        width_of_entries = 220
+
+        add_header_label(
+            self,
+            0,
+            "Add New Book:",
+            20,
+            2,
+            20,
+            10
+        )
+
+        required_field_label = ctk.CTkLabel(
+            self,
+            text="--- Required fields ---",
+            font=("Helvetica", 13)
+        )
+        required_field_label.grid(
+            row=1,
+            column=0,
+            columnspan=2,
+            sticky="s",
+            pady=(0, 10)
+        )
+
+        self.title_entry = add_entry_and_entry(self, 2, "Title:", width_of_entries)
+        self.author_entry = add_entry_and_entry(self, 3, "Author:", width_of_entries)
+        self.genre_entry = add_entry_and_entry(self, 4, "Genre:", width_of_entries)
+
+        optional_field_label = ctk.CTkLabel(
+            self,
+            text="--- Optional fields ---",
+            font=("Helvetica", 13)
+        )
+        optional_field_label.grid(
+            row=5,
+            column=0,
+            columnspan=2,
+            sticky="s",
+            pady=(10, 10)
+        )
+
+        self.description_entry = add_entry_and_entry(self, 6, "Description:", width_of_entries)
+        self.year_entry = add_entry_and_entry(self, 7, "Year:", width_of_entries, "e.g. 2025")
+        self.isbn_entry = add_entry_and_entry(self, 8, "ISBN:", width_of_entries)
+
+        add_book_button = ctk.CTkButton(
+            self,
+            text="Add book",
+            command=lambda: self.on_submit(self)
+        )
+        add_book_button.grid(
+            row=9,
+            column=0,
+            columnspan=2,
+            pady=20,
+            sticky="s"
+        )
+
+        bind_arrow_keys_to_entry(self)
+        self.add_suggestions(self.suggest)
+
+    def fill(self):
+        self.reset_entries(self)
+        self.title_entry.focus_set()
+
+    def hide(self, event=None):
+        self.hide_suggestions()
+        super().hide()
+
+    def mark_all_required_empty_fields(self):
+        for entry in (self.title_entry, self.author_entry, self.genre_entry):
+            if not entry.get():
+                entry.configure(border_color="red")
+
+    @staticmethod
+    def mark_single_entry(entry):
+        entry.configure(border_color="red")
+
+
+class DialogPool:
+    """
+        Builds each dialog on first use from its factory and hands out the
+        same window afterwards (again if it has been destroyed). Records how
+        long every open() takes, the first one including the build.
+    """
+    def __init__(self, factories: dict):
+        self.factories = factories
+        self.dialogs = {}
+        self.open_timings = collections.defaultdict(lambda: collections.deque(maxlen=OPEN_TIMINGS_KEPT))
+
+    def open(self, name: str, *args):
+        start = time.perf_counter()
+
+        dialog = self.dialogs.get(name)
+
+        if dialog is None or not dialog.winfo_exists():
+            dialog = self.dialogs[name] = self.factories[name]()
+
+        dialog.open(*args)
+        dialog.update_idletasks()
+
+        self.open_timings[name].append(time.perf_counter() - start)
+
+        return dialog
+
+    def timings(self):
+        """
+            {name: {"opens", "first_ms", "median_ms", "max_ms"}} of the
+            recorded open() durations.
+        """
+        return {
+            name: {
+                "opens": len(durations),
+                "first_ms": durations[0] * 1000,
+                "median_ms": statistics.median(durations) * 1000,
+                "max_ms": max(durations) * 1000,
+            }
+            for name, durations in self.open_timings.items()
+            if durations
+        }
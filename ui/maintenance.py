@@ -0,0 +1,182 @@
+import collections
+import concurrent.futures
+import datetime
+import threading
+import time
+
+from db.maintenance import CancelToken
+
+
+# How long the user has to leave the app alone (no key, click or scroll)
+# before maintenance starts.
+IDLE_MILLISECONDS = 5000
+
+CHECK_MILLISECONDS = 1000
+
+RUNS_KEPT = 100
+
+# When the jobs of the app are due: planner statistics after this many
+# changed books, the rest on a timer.
+ANALYZE_AFTER_CHANGES = 1000
+STATISTICS_INTERVAL_SECONDS = 60
+INDEXES_INTERVAL_SECONDS = 300
+TIDY_INTERVAL_SECONDS = 3600
+
+
+class MaintenanceJob:
+    """
+        run(token) does the work and may return a short description of
+        what it did. It runs on the scheduler's thread, or on the Tk thread
+        with main_thread=True when it changes structures the Tk thread also
+        changes; such a job cannot be interrupted, only stop between steps.
+
+        The job is due when changes_threshold change events have been
+        applied since its last run, or interval_seconds have passed, and
+        due() (when given) agrees. Lower priorities run first. The token is
+        cancelled after budget_seconds and when the user is back.
+    """
+    def __init__(self, name: str, run, priority: int=10, budget_seconds: float=30, interval_seconds: float=None,
+                 changes_threshold: int=None, due=None, main_thread: bool=False):
+        self.name = name
+        self.run = run
+        self.priority = priority
+        self.budget_seconds = budget_seconds
+        self.interval_seconds = interval_seconds
+        self.changes_threshold = changes_threshold
+        self.due = due
+        self.main_thread = main_thread
+
+        self.changes = 0
+        self.last_run = None
+
+    def is_due(self, now: float):
+        if self.due is not None and not self.due():
+            return False
+
+        if self.changes_threshold is not None and self.changes >= self.changes_threshold:
+            return True
+
+        return self.interval_seconds is not None and (self.last_run is None or now - self.last_run >= self.interval_seconds)
+
+
+class MaintenanceScheduler:
+    """
+        Runs MaintenanceJobs one at a time while the app is idle, the due
+        job of the lowest priority first. activity() is bound to the
+        user's input: it resets the idle time and cancels the running job,
+        which is due again at the next idle time. Every run is kept in
+        runs for the Diagnostics window.
+    """
+    def __init__(self, widget, idle_milliseconds: int=IDLE_MILLISECONDS):
+        self.widget = widget
+        self.idle_seconds = idle_milliseconds / 1000
+
+        self.jobs = []
+        self.runs = collections.deque(maxlen=RUNS_KEPT)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="maintenance")
+
+        self.last_activity = time.monotonic()
+        self.running = None
+        self.after_id = None
+
+    def add(self, job: MaintenanceJob):
+        self.jobs.append(job)
+        self.jobs.sort(key=lambda job: job.priority)
+
+    def start(self):
+        self.after_id = self.widget.after(CHECK_MILLISECONDS, self.tick)
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.last_activity >= self.idle_seconds
+
+    def activity(self, event=None):
+        self.last_activity = time.monotonic()
+
+        if self.running is not None:
+            self.running[1].cancel("user activity")
+
+    def apply(self, change):
+        for job in self.jobs:
+            job.changes += 1
+
+    def tick(self):
+        self.after_id = self.widget.after(CHECK_MILLISECONDS, self.tick)
+
+        if self.running is not None and self.running[2].done():
+            self.running = None
+
+        if self.running is not None or not self.idle:
+            return
+
+        now = time.monotonic()
+        job = next((job for job in self.jobs if job.is_due(now)), None)
+
+        if job is None:
+            return
+
+        token = CancelToken()
+
+        if job.main_thread:
+            self.run_job(job, token)
+        else:
+            self.running = job, token, self.executor.submit(self.run_job, job, token)
+
+    def run_job(self, job: MaintenanceJob, token: CancelToken):
+        changes, last_run = job.changes, job.last_run
+        job.changes, job.last_run = 0, time.monotonic()
+
+        budget = threading.Timer(job.budget_seconds, token.cancel, ("over budget",))
+        budget.daemon = True
+        budget.start()
+
+        started = datetime.datetime.now()
+        start = time.perf_counter()
+        detail = None
+
+        try:
+            detail = job.run(token)
+            outcome = "done"
+        except Exception as error:
+            outcome = f"failed: {error}"
+        finally:
+            budget.cancel()
+
+        if token.cancelled:
+            outcome = token.reason
+
+            # Interrupted before it could finish: due again once the user
+            # leaves the app alone. A job over budget waits for its next
+            # turn instead of starting over right away.
+            if token.reason == "user activity":
+                job.changes += changes
+                job.last_run = last_run
+
+        self.runs.append({
+            "job": job.name,
+            "started": started,
+            "seconds": time.perf_counter() - start,
+            "outcome": outcome,
+            "detail": detail,
+        })
+
+    def report(self):
+        """
+            The runs, newest first, and when each job last ran.
+        """
+        now = time.monotonic()
+        jobs = {
+            job.name: None if job.last_run is None else now - job.last_run
+            for job in self.jobs
+        }
+
+        return list(reversed(self.runs)), jobs
+
+    def shutdown(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+
+        if self.running is not None:
+            self.running[1].cancel("shutdown")
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,248 @@
+import collections
+import concurrent.futures
+import threading
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db.repo import Repo, DEFERRED_COLUMNS
+
+
+# How long the user has to be idle (no scrolling, no new list) before
+# reading ahead starts.
+IDLE_MILLISECONDS = 300
+
+# Books above and below the visible ones whose details are read ahead.
+DETAILS_MARGIN = 30
+
+CACHE_CAPACITY = 5000
+
+
+class LRUCache:
+    """
+        Bounded mapping that drops the least recently used entry when full,
+        and counts hits and misses. Safe to share between threads.
+    """
+    def __init__(self, capacity: int=CACHE_CAPACITY):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+
+                return self.entries[key]
+
+            self.misses += 1
+
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def values(self):
+        with self._lock:
+            return list(self.entries.values())
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else None
+
+    def metrics(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "evictions": self.evictions,
+        }
+
+
+def has_deferred_values(book):
+    return all(name in book.__dict__ for name in DEFERRED_COLUMNS)
+
+
+class Prefetcher:
+    """
+        Reads ahead what the user is likely to need next, while they are
+        idle: the next page of an incomplete result set and the deferred
+        columns (the description) of the books around the visible ones.
+
+        schedule() is called whenever the list or the viewport changes; the
+        work starts once no call came for idle_milliseconds, runs on one
+        background thread with its own sessions and lands in a bounded
+        LRUCache. next_page() and load_deferred_values() answer from the
+        cache and only query the database on a miss.
+    """
+    def __init__(self, widget, session_factory, idle_milliseconds: int=IDLE_MILLISECONDS, capacity: int=CACHE_CAPACITY):
+        self.widget = widget
+        self.session_factory = session_factory
+        self.idle_milliseconds = idle_milliseconds
+
+        self.cache = LRUCache(capacity)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.last_error = None
+
+        self.after_id = None
+        self.pending_page = None
+        self.pending_ids = []
+        self.in_flight = set()
+
+    @staticmethod
+    def page_key(result_set, after):
+        return "page", result_set, after.id
+
+    def schedule(self, result_set, page_size: int, books_in_view=()):
+        if not result_set.complete and result_set.books:
+            self.pending_page = (result_set, result_set.books[-1], page_size)
+
+        self.pending_ids = [book.id for book in books_in_view if not has_deferred_values(book)]
+
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+
+        self.after_id = self.widget.after(self.idle_milliseconds, self.run)
+
+    def run(self):
+        self.after_id = None
+
+        if self.pending_page is not None:
+            result_set, after, page_size = self.pending_page
+            key = self.page_key(result_set, after)
+
+            if key not in self.cache and key not in self.in_flight:
+                self.in_flight.add(key)
+                self.executor.submit(self.prefetch_page, key, result_set, after, page_size)
+
+            self.pending_page = None
+
+        ids = [
+            id for id in self.pending_ids
+            if ("details", id) not in self.cache and ("details", id) not in self.in_flight
+        ]
+        self.pending_ids = []
+
+        if ids:
+            self.in_flight.update(("details", id) for id in ids)
+            self.executor.submit(self.prefetch_deferred_values, ids)
+
+    def fetch_page(self, result_set, after, page_size: int):
+        with self.session_factory() as session:
+            return Repo(session).get_books_keyset(
+                result_set.criteria,
+                result_set.order,
+                after,
+                page_size,
+                result_set.deferred
+            )
+
+    def prefetch_page(self, key, result_set, after, page_size: int):
+        try:
+            books = self.fetch_page(result_set, after, page_size)
+
+            # Dropped by forget_pages() meanwhile: caching it would keep the
+            # old result set alive.
+            if key in self.in_flight:
+                self.cache.put(key, books)
+        except Exception as error:
+            self.last_error = error
+        finally:
+            self.in_flight.discard(key)
+
+    def prefetch_deferred_values(self, ids):
+        try:
+            with self.session_factory() as session:
+                values = Repo(session).get_deferred_values(ids)
+
+            # Books invalidate()d meanwhile may have been read before the
+            # change: their values would be stale.
+            for id in ids:
+                if ("details", id) in self.in_flight:
+                    self.cache.put(("details", id), values.get(id, {}))
+        except Exception as error:
+            self.last_error = error
+        finally:
+            self.in_flight.difference_update(("details", id) for id in ids)
+
+    def next_page(self, result_set, after, page_size: int):
+        """
+            The page_size books after the given one, from the cache when they
+            were read ahead.
+        """
+        books = self.cache.get(self.page_key(result_set, after))
+
+        if books is None:
+            books = self.fetch_page(result_set, after, page_size)
+
+        return books
+
+    def load_deferred_values(self, book):
+        """
+            Fills in the deferred columns of a book listed without them.
+        """
+        if has_deferred_values(book):
+            return
+
+        values = self.cache.get(("details", book.id))
+
+        if values is None:
+            with self.session_factory() as session:
+                values = Repo(session).get_deferred_values([book.id]).get(book.id, {})
+
+        for name in DEFERRED_COLUMNS:
+            set_committed_value(book, name, values.get(name))
+
+    def forget_pages(self):
+        self.in_flight.difference_update([key for key in list(self.in_flight) if key[0] == "page"])
+        self.cache.discard_where(lambda key: key[0] == "page")
+
+    def invalidate(self, change):
+        """
+            Forgets what a change event may have made stale.
+        """
+        self.in_flight.discard(("details", change.id))
+        self.cache.discard(("details", change.id))
+        self.forget_pages()
+
+    def shutdown(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+            self.after_id = None
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
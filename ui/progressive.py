@@ -0,0 +1,97 @@
+import time
+
+
+# Time a slice may spend rendering before Tk gets the event loop back;
+# below one 60 Hz frame so scrolling and typing stay smooth.
+FRAME_BUDGET_SECONDS = 0.012
+
+STREAM_CHUNK_SIZE = 200
+
+
+class ProgressiveLoader:
+    """
+        Renders a stream of books a slice at a time on the Tk thread.
+
+        The books come from a server-side cursor (Repo.stream_books), so the
+        first rows show up as soon as the first chunk has arrived and only
+        one chunk is held at a time. Each slice renders books until
+        frame_budget_seconds are spent, then schedules the next one with
+        after_idle, leaving Tk free to redraw and handle input in between.
+
+        start() cancels the stream in progress, so a newer query always
+        supersedes an older one.
+    """
+    def __init__(self, widget, session_factory, frame_budget_seconds: float=FRAME_BUDGET_SECONDS):
+        self.widget = widget
+        self.session_factory = session_factory
+        self.frame_budget_seconds = frame_budget_seconds
+
+        self.session = None
+        self.books = None
+        self.render_book = None
+        self.on_done = None
+        self.after_id = None
+
+    @property
+    def loading(self):
+        return self.books is not None
+
+    def start(self, stream, render_book, on_done=None):
+        """
+            stream is called with a new session and returns an iterator of
+            books; render_book is called with each of them and on_done once
+            the stream is exhausted (not when it is cancelled).
+        """
+        self.cancel()
+
+        self.session = self.session_factory()
+        self.books = iter(stream(self.session))
+        self.render_book = render_book
+        self.on_done = on_done
+
+        self.run_slice()
+
+    def run_slice(self):
+        self.after_id = None
+        deadline = time.perf_counter() + self.frame_budget_seconds
+
+        try:
+            while time.perf_counter() < deadline:
+                book = next(self.books, None)
+
+                if book is None:
+                    self.finish()
+                    return
+
+                self.render_book(book)
+        except Exception:
+            self.cancel()
+            raise
+
+        self.after_id = self.widget.after_idle(self.run_slice)
+
+    def finish(self):
+        on_done = self.on_done
+        self.close()
+
+        if on_done is not None:
+            on_done()
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+
+        self.close()
+
+    def close(self):
+        if self.books is not None and hasattr(self.books, "close"):
+            self.books.close()
+
+        if self.session is not None:
+            self.session.close()
+
+        self.after_id = None
+        self.session = None
+        self.books = None
+        self.render_book = None
+        self.on_done = None
@@ -0,0 +1,142 @@
+import locale
+
+
+# The list loads at most this many books (more in the table view, whose
+# rows are cheap); a bigger result is marked incomplete and is re-ordered by
+# the database instead of in memory.
+RESULT_SET_LIMIT = 2000
+TABLE_RESULT_SET_LIMIT = 50000
+
+SORT_KEYS = ("title", "author", "year", "added_on")
+
+ORDER_BY_OPTION = {
+    "No order": None,
+    "Title(A-Z)": "title",
+    "Title(Z-A)": "-title",
+    "Author(A-Z)": "author",
+    "Author(Z-A)": "-author",
+    "Year(Latest)": "-year",
+    "Year(Earliest)": "year",
+    "Added on(Latest)": "-added_on",
+    "Added on(Earliest)": "added_on",
+}
+
+
+def collation_key(value: str):
+    """
+        Sort key of a string under the user's locale, ignoring case
+        (main.py sets LC_COLLATE from the environment).
+    """
+    return locale.strxfrm(value.casefold()) if value is not None else None
+
+
+class ResultSet:
+    """
+        The books currently listed, with what produced them: criteria are the
+        WHERE clauses of the query, matches its Python version for books
+        that change later.
+
+        deferred names the columns the books were loaded without (see
+        Repo.DEFERRED_COLUMNS), key identifies the query (see Query.key) and
+        facets holds its FacetCounts once they are shown.
+
+        The sort keys of every book are computed once when it enters the set,
+        so a new order is an in-memory sort. When the query had more than
+        RESULT_SET_LIMIT books (complete is False) the loaded books are not
+        the whole result and a new order has to be fetched again.
+    """
+    def __init__(self, books, matches, criteria=(), order: str=None, complete: bool=True, deferred=(), key=()):
+        self.books = list(books)
+        self.matches = matches
+        self.criteria = criteria
+        self.order = order
+        self.complete = complete
+        self.deferred = deferred
+        self.key = key
+        self.facets = None
+
+        self.books_by_id = {book.id: book for book in self.books}
+        self.sort_keys = {}
+        for book in self.books:
+            self.compute_sort_keys(book)
+
+    def compute_sort_keys(self, book):
+        self.sort_keys[book.id] = (
+            collation_key(book.title),
+            collation_key(book.author),
+            book.year,
+            book.added_on,
+        )
+
+    def __len__(self):
+        return len(self.books)
+
+    def __contains__(self, book):
+        return book.id in self.sort_keys
+
+    def get(self, id: int):
+        return self.books_by_id.get(id)
+
+    def sort(self, order: str=None):
+        """
+            Same order as Repo's order_clause: the chosen key, books without
+            a value last, then the id.
+        """
+        self.order = order
+        descending = bool(order) and order.startswith("-")
+
+        if not order:
+            self.books.sort(key=lambda book: book.id)
+            return
+
+        index = SORT_KEYS.index(order.lstrip("-"))
+
+        present = [book for book in self.books if self.sort_keys[book.id][index] is not None]
+        missing = [book for book in self.books if self.sort_keys[book.id][index] is None]
+
+        present.sort(key=lambda book: (self.sort_keys[book.id][index], book.id), reverse=descending)
+        missing.sort(key=lambda book: book.id, reverse=descending)
+
+        self.books = present + missing
+
+    def append(self, book):
+        """
+            Adds a book that comes after every other one in the current
+            order, as books do when they are streamed in that order. Returns
+            False when the book is already there (e.g. a change event added
+            it first).
+        """
+        if book.id in self.books_by_id:
+            return False
+
+        self.books.append(book)
+        self.books_by_id[book.id] = book
+        self.compute_sort_keys(book)
+
+        return True
+
+    def add(self, book):
+        """
+            Adds a book at its place in the current order and returns that
+            place.
+        """
+        self.books.append(book)
+        self.books_by_id[book.id] = book
+        self.compute_sort_keys(book)
+        self.sort(self.order)
+
+        return self.books.index(book)
+
+    def update(self, book):
+        """
+            Recomputes the keys of a changed book and returns its new place.
+        """
+        self.compute_sort_keys(book)
+        self.sort(self.order)
+
+        return self.books.index(book)
+
+    def remove(self, book):
+        self.books.remove(book)
+        del self.books_by_id[book.id]
+        del self.sort_keys[book.id]
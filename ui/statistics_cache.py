@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+
+# Which statistics a change of each column can invalidate.
+STALE_BY_COLUMN = {
+    "title": {"oldest_book", "newest_book"},
+    "genre": {"most_common_genre"},
+    "year": {"oldest_book", "newest_book", "average_publication_year"},
+    "is_read": {"read_and_unread_count"},
+    "added_on": {"books_added_in_the_past_month"},
+}
+
+
+class StatisticsCache:
+    """
+        The figures of the Statistics window, kept between openings.
+
+        Change events patch the counts in place when the event carries
+        enough to do so (inserts and deletes carry the whole row) and
+        otherwise mark only the affected figures stale; refresh() then
+        re-runs just those queries.
+    """
+    def __init__(self):
+        self.values = None
+        self.stale = set()
+
+    def refresh(self, repo):
+        if self.values is None:
+            self.values = {}
+            self.stale = {
+                "books_count",
+                "read_and_unread_count",
+                "most_common_genre",
+                "oldest_book",
+                "newest_book",
+                "average_publication_year",
+                "books_added_in_the_past_month",
+            }
+
+        # Taken at once: the maintenance thread refreshes while change
+        # events may mark more figures stale.
+        stale, self.stale = self.stale, set()
+
+        if "books_count" in stale:
+            self.values["total_books_count"] = repo.get_books_count()
+        if "read_and_unread_count" in stale:
+            self.values["read_count"], self.values["unread_count"] = repo.get_read_and_unread_count()
+        if "most_common_genre" in stale:
+            self.values["most_common_genre"] = repo.get_most_common_genre()
+        if "oldest_book" in stale:
+            self.values["oldest_book"] = repo.oldest_book()
+        if "newest_book" in stale:
+            self.values["newest_book"] = repo.newest_book()
+        if "average_publication_year" in stale:
+            self.values["average_publication_year"] = repo.get_average_publication_year()
+        if "books_added_in_the_past_month" in stale:
+            self.values["books_added_in_the_past_month"] = repo.get_books_count_added_in_the_past_month()
+
+        return self.values
+
+    def apply(self, change):
+        if self.values is None:
+            return
+
+        if change.refetch:
+            self.values = None
+            return
+
+        if change.op in ("insert", "delete"):
+            sign = 1 if change.op == "insert" else -1
+            columns = change.columns
+
+            self.values["total_books_count"] += sign
+
+            if columns.get("is_read"):
+                self.values["read_count"] += sign
+            else:
+                self.values["unread_count"] += sign
+
+            added_on = columns.get("added_on")
+            if added_on is not None and added_on >= datetime.now() - timedelta(days=30):
+                self.values["books_added_in_the_past_month"] += sign
+
+            for column in ("title", "genre", "year"):
+                self.stale |= STALE_BY_COLUMN[column]
+        else:
+            for column in change.columns:
+                self.stale |= STALE_BY_COLUMN.get(column, set())
@@ -0,0 +1,990 @@
+"""
+    What the main window shows, without the widgets: which query a search
+    runs, the listed result set and its pages, how change events move rows,
+    the statistics and the text of every row.
+
+    Nothing here imports Tk, so the whole search -> rows pipeline can be
+    driven and timed headless (see benchmarks/view_model_benchmark.py);
+    BookWormApp binds these objects to its widgets.
+"""
+import concurrent.futures
+
+from db.approximate_statistics import approximate_statistics, LibrarySketches, SAMPLE_SIZE
+from db.changes import ChangeEvent
+from db.column_store import ColumnStore
+from db.duplicates import DuplicateIndex, normalize_author
+from db.isbn import try_isbn_key, SEPARATORS
+from db.models import Book
+from db.prefix_index import PrefixIndex, SUGGESTION_LIMIT
+from db.repo import Repo, search_criterion, facet_criterion, decade_of, DEFERRED_COLUMNS, FACETS
+from db.similarity import SimilarityIndex
+from ui.prefetch import LRUCache, DETAILS_MARGIN
+from ui.progressive import STREAM_CHUNK_SIZE
+from ui.result_set import ResultSet, RESULT_SET_LIMIT
+from ui.statistics_cache import StatisticsCache
+
+from exceptions import NegativeYearError
+
+
+def match_every_book(book):
+    return True
+
+
+def card_text(book):
+    return (f"Title: {book.title}\n"
+            f"Author: {book.author}\n"
+            f"Genre: {book.genre}\n"
+            f"ISBN: {book.isbn if book.isbn else 'No ISBN'}")
+
+
+def table_row_values(book):
+    return (
+        book.title,
+        book.author,
+        book.genre or "",
+        book.isbn if book.isbn else "No ISBN",
+        "✓" if book.is_read else "",
+    )
+
+
+class Query:
+    """
+        A query of the book list: the WHERE clauses sent to the database,
+        their Python version for books that change later, and the columns
+        left out of the listed books. key tells queries apart in caches:
+        the (option, value) pairs of the search and its refinements.
+    """
+    def __init__(self, criteria=(), matches=match_every_book, deferred=DEFERRED_COLUMNS, key=()):
+        self.criteria = criteria
+        self.matches = matches
+        self.deferred = deferred
+        self.key = key
+
+
+class SearchViewModel:
+    """
+        Turns what was typed or chosen into a Query.
+    """
+    def __init__(self, dialect_name: str):
+        self.dialect_name = dialect_name
+
+    @staticmethod
+    def every_book():
+        return Query()
+
+    def search(self, option: str, text: str):
+        """
+            Raises ValueError or NegativeYearError for a year that is not a
+            positive integer.
+        """
+        value = text.strip()
+
+        if not value:
+            return self.every_book()
+
+        if option == "year":
+            value = int(value)
+
+            if 0 > value:
+                raise NegativeYearError
+
+        # The matcher of these options reads the description.
+        deferred = () if option in ("description", "everything") else DEFERRED_COLUMNS
+
+        return Query(
+            (search_criterion(self.dialect_name, option, value),),
+            self.matcher(option, value),
+            deferred,
+            ((option, value),)
+        )
+
+    def genre(self, genre: str):
+        return Query(
+            (search_criterion(self.dialect_name, "genre_is", genre),),
+            lambda book: book.genre == genre,
+            key=(("genre_is", genre),)
+        )
+
+    @staticmethod
+    def matcher(option: str, value):
+        """
+            Python version of a search, used to decide whether books that
+            other clients add or change belong in the current results.
+        """
+        if option == "year":
+            return lambda book: book.year == value
+
+        if option == "isbn":
+            # Stored ISBNs are 13 digits, whatever was typed.
+            key = try_isbn_key(value)
+            digits = value.translate(SEPARATORS).casefold()
+
+            if key is not None:
+                return lambda book: book.isbn13 == key
+
+            return lambda book: digits in (book.isbn or "").casefold()
+
+        fields = ["title", "author", "genre", "description", "isbn"] \
+            if option == "everything" else [option]
+        words = value.casefold().split() \
+            if option == "everything" else [value.casefold()]
+
+        def matches(book):
+            text = " ".join(str(getattr(book, field) or "") for field in fields).casefold()
+
+            return all(word in text for word in words)
+
+        return matches
+
+
+class BookListViewModel:
+    """
+        The listed books: loads the first limit books of a Query in the
+        chosen order, the pages after them, re-sorts them in memory when
+        they are the whole result, and works out which row a change event
+        adds, updates or removes.
+
+        A load is either streamed, for the UI to render a slice at a time
+        (begin(), then stream() feeding accept(), then finish()), or done at
+        once with load(). next_page is called as next_page(result_set,
+        after, page_size); the app passes Prefetcher.next_page so pages read
+        ahead are used.
+    """
+    def __init__(self, session_factory, next_page=None, chunk_size: int=STREAM_CHUNK_SIZE):
+        self.session_factory = session_factory
+        self.next_page = next_page or self.fetch_page
+        self.chunk_size = chunk_size
+
+        self.result_set = ResultSet([], match_every_book)
+        self.limit = RESULT_SET_LIMIT
+        self.streamed_count = 0
+
+    def begin(self, query: Query, order: str=None, limit: int=RESULT_SET_LIMIT):
+        """
+            Starts a new result set, incomplete until finish() so that a new
+            order meanwhile starts a new load instead of sorting half of the
+            books.
+        """
+        self.limit = limit
+        self.streamed_count = 0
+        self.result_set = ResultSet(
+            [],
+            query.matches,
+            query.criteria,
+            order,
+            complete=False,
+            deferred=query.deferred,
+            key=query.key
+        )
+
+        return self.result_set
+
+    def stream(self, session):
+        result_set = self.result_set
+
+        return Repo(session).stream_books(
+            result_set.order,
+            self.chunk_size,
+            result_set.criteria,
+            self.limit + 1,
+            result_set.deferred
+        )
+
+    def accept(self, book):
+        """
+            Takes a streamed book and tells whether it has to be shown.
+        """
+        self.streamed_count += 1
+
+        return self.streamed_count <= self.limit and self.result_set.append(book)
+
+    def finish(self):
+        self.result_set.complete = self.streamed_count <= self.limit
+
+    def load(self, query: Query, order: str=None, limit: int=RESULT_SET_LIMIT):
+        self.begin(query, order, limit)
+
+        with self.session_factory() as session:
+            for book in self.stream(session):
+                self.accept(book)
+
+        self.finish()
+
+        return self.result_set
+
+    def show(self, result_set: ResultSet):
+        self.result_set = result_set
+
+    def fits(self, limit: int):
+        """
+            Whether the result set is complete and can be listed with limit
+            books at most, without loading it again.
+        """
+        return self.result_set.complete and len(self.result_set) <= limit
+
+    def sort(self, order: str=None):
+        """
+            Re-sorts the books in memory when they are the whole result.
+            Returns False when they are not and the order has to be loaded
+            from the database.
+        """
+        if not self.result_set.complete:
+            return False
+
+        self.result_set.sort(order)
+
+        return True
+
+    def fetch_page(self, result_set, after, page_size: int):
+        with self.session_factory() as session:
+            return Repo(session).get_books_keyset(
+                result_set.criteria,
+                result_set.order,
+                after,
+                page_size,
+                result_set.deferred
+            )
+
+    def load_more(self):
+        """
+            Appends the next page of an incomplete result and returns the
+            books it added.
+        """
+        result_set = self.result_set
+
+        if result_set.complete or not result_set.books:
+            return []
+
+        books = self.next_page(result_set, result_set.books[-1], self.limit + 1)
+        added = [book for book in books[:self.limit] if result_set.append(book)]
+
+        result_set.complete = len(books) <= self.limit
+
+        return added
+
+    def partial_result_text(self):
+        if self.result_set.complete:
+            return None
+
+        return f"Showing the first {len(self.result_set)} books.\nSearch to narrow the list down or load more."
+
+    def footer_text(self):
+        """
+            The note under the list once it is loaded: "No Books found!" or
+            the partial result text.
+        """
+        return self.partial_result_text() or ("No Books found!" if not self.result_set.books else None)
+
+    def books_in_view(self, first: float, last: float):
+        """
+            The books between the fractions first and last of the list (as
+            given by a yview), plus DETAILS_MARGIN on each side.
+        """
+        books = self.result_set.books
+
+        start = max(int(first * len(books)) - DETAILS_MARGIN, 0)
+        end = int(last * len(books)) + 1 + DETAILS_MARGIN
+
+        return books[start:end]
+
+    def apply_change(self, change):
+        """
+            Patches the result set with one change event and returns the row
+            to change as (op, book, position): ("remove", book, None),
+            ("update", book, new position or None if it did not move) or
+            ("add", book, position). Returns None when no listed row
+            changes.
+
+            A refetch event is resolved first by reading the book by id, into
+            an event of its own: the other listeners get the one passed in.
+        """
+        result_set = self.result_set
+
+        if change.refetch:
+            with self.session_factory() as session:
+                fresh_book = Repo(session).get_book_by_id(change.id)
+
+            if fresh_book is None:
+                change = ChangeEvent(change.id, "delete", library_id=change.library_id)
+            else:
+                columns = {
+                    name: getattr(fresh_book, name)
+                    for name in Book.__table__.columns.keys()
+                    if name not in ("id", "library_id")
+                }
+                op = "update" if result_set.get(change.id) is not None else "insert"
+                change = ChangeEvent(change.id, op, columns, library_id=change.library_id)
+
+        visible_book = result_set.get(change.id)
+
+        if change.op == "delete":
+            if visible_book is not None:
+                result_set.remove(visible_book)
+
+                return "remove", visible_book, None
+        elif change.op == "update":
+            if visible_book is None:
+                return None
+
+            for column, value in change.columns.items():
+                setattr(visible_book, column, value)
+
+            if not result_set.matches(visible_book):
+                result_set.remove(visible_book)
+
+                return "remove", visible_book, None
+
+            position = result_set.books.index(visible_book)
+            new_position = result_set.update(visible_book)
+
+            return "update", visible_book, new_position if new_position != position else None
+        elif change.op == "insert" and visible_book is None:
+            new_book = Book(id=change.id, **change.columns)
+
+            if result_set.matches(new_book):
+                return "add", new_book, result_set.add(new_book)
+
+        return None
+
+
+# Facet counts of this many recent queries are kept, so going back to a
+# search (or a refinement of it) shows them without a query.
+FACET_CACHE_CAPACITY = 50
+
+# Values of a facet offered as refinements.
+FACET_MENU_SIZE = 8
+
+
+def facet_value(book, facet: str):
+    if facet == "genre":
+        return book.genre
+    if facet == "decade":
+        return decade_of(book.year)
+
+    return bool(book.is_read)
+
+
+def facet_label(facet: str, value, count: int):
+    if facet == "genre":
+        name = value if value is not None else "Without genre"
+    elif facet == "decade":
+        name = f"{value}s" if value is not None else "Unknown year"
+    else:
+        name = "Read" if value else "Unread"
+
+    return f"{name} ({count:,})"
+
+
+class FacetCounts:
+    """
+        How the books of one query break down by genre, decade and read
+        status, kept up to date by the inserts and deletes of books the
+        query matches.
+    """
+    def __init__(self, counts, matches):
+        self.counts = counts
+        self.matches = matches
+
+    def add(self, book, sign: int=1):
+        """
+            Counts a book in (sign 1) or out (sign -1) when the query matches
+            it; returns whether it did.
+        """
+        if not self.matches(book):
+            return False
+
+        for facet in FACETS:
+            values = self.counts[facet]
+            value = facet_value(book, facet)
+            values[value] = values.get(value, 0) + sign
+
+            if values[value] <= 0:
+                del values[value]
+
+        return True
+
+    def ranked(self, facet: str):
+        """
+            [(value, count), ...]: genres by count, decades and read statuses
+            by value, unknown values last.
+        """
+        pairs = list(self.counts[facet].items())
+
+        if facet == "genre":
+            pairs.sort(key=lambda pair: (-pair[1], pair[0] is None, pair[0] or ""))
+        else:
+            pairs.sort(key=lambda pair: (pair[0] is None, pair[0] or 0))
+
+        return pairs
+
+
+class FacetViewModel:
+    """
+        Facet counts of the listed result set, read in one query per search
+        (Repo.get_facet_counts) and cached by Query.key, and the refinements
+        they offer.
+
+        Inserts and deletes patch the cached counts; an update carries only
+        the new values of the columns, so it drops them instead.
+    """
+    def __init__(self, session_factory, capacity: int=FACET_CACHE_CAPACITY):
+        self.session_factory = session_factory
+        self.cache = LRUCache(capacity)
+
+    def counts(self, result_set):
+        if result_set.facets is None:
+            facets = self.cache.get(result_set.key)
+
+            if facets is None:
+                with self.session_factory() as session:
+                    counts = Repo(session).get_facet_counts(result_set.criteria)
+
+                facets = FacetCounts(counts, result_set.matches)
+                self.cache.put(result_set.key, facets)
+
+            result_set.facets = facets
+
+        return result_set.facets
+
+    def refinements(self, result_set, size: int=FACET_MENU_SIZE):
+        """
+            {label: (facet, value)} of the values that narrow the result
+            down, the most common genres first.
+        """
+        facets = self.counts(result_set)
+        refined = {facet for facet, _ in result_set.key}
+
+        refinements = {}
+        for facet in FACETS:
+            ranked = facets.ranked(facet)
+
+            # A facet with one value left would not narrow anything.
+            if facet in refined or len(ranked) < 2:
+                continue
+
+            for value, count in ranked[:size]:
+                refinements[facet_label(facet, value, count)] = (facet, value)
+
+        return refinements
+
+    @staticmethod
+    def refine(result_set, facet: str, value):
+        """
+            The Query of the listed books that also have value for facet.
+        """
+        matches = result_set.matches
+
+        return Query(
+            result_set.criteria + (facet_criterion(facet, value),),
+            lambda book: matches(book) and facet_value(book, facet) == value,
+            result_set.deferred,
+            result_set.key + ((facet, value),)
+        )
+
+    def apply_change(self, change, result_set):
+        """
+            Patches the cached counts with one change event; returns whether
+            the counts of result_set changed.
+        """
+        if change.refetch or change.op == "update":
+            if not self.cache.values() and result_set.facets is None:
+                return False
+
+            self.cache.clear()
+            result_set.facets = None
+
+            return True
+
+        book = Book(id=change.id, **change.columns)
+        sign = 1 if change.op == "insert" else -1
+
+        for facets in self.cache.values():
+            if facets is not result_set.facets:
+                facets.add(book, sign)
+
+        return result_set.facets is not None and result_set.facets.add(book, sign)
+
+
+class SuggestionsViewModel:
+    """
+        Typeahead for the author and genre entries of the Add and Edit
+        windows, so existing spellings are picked instead of new near
+        duplicates. A PrefixIndex per column is built on a background
+        thread the first time a window opens, kept up to date by change
+        events, and built again once too many updates have piled up; until
+        it is ready there are no suggestions.
+    """
+    FIELDS = ("author", "genre")
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.indexes = None
+        self.builder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggestions")
+        self.building = None
+        self.last_error = None
+
+    @property
+    def pending(self):
+        return self.building is not None and not self.building.done()
+
+    def prepare(self):
+        if self.pending:
+            return
+
+        if self.indexes is None or any(index.stale for index in self.indexes.values()):
+            self.building = self.builder.submit(self.run_build)
+
+    def run_build(self):
+        try:
+            indexes = {}
+
+            with self.session_factory() as session:
+                repo = Repo(session)
+
+                for field in self.FIELDS:
+                    indexes[field] = PrefixIndex.from_counts(repo.get_value_counts(field))
+
+            for index in indexes.values():
+                index.warm()
+
+            self.indexes = indexes
+        except Exception as error:
+            self.last_error = error
+
+    def refresh(self):
+        """
+            Builds the indexes again when they are stale, but not before
+            they are first needed.
+        """
+        if self.indexes is None or not any(index.stale for index in self.indexes.values()):
+            return False
+
+        self.prepare()
+
+        return True
+
+    def suggest(self, field: str, text: str, limit: int=SUGGESTION_LIMIT):
+        if self.indexes is None:
+            return []
+
+        return self.indexes[field].suggest(text, limit)
+
+    def apply(self, change):
+        if self.indexes is None:
+            return
+
+        for field, index in self.indexes.items():
+            if change.refetch:
+                # Nothing to go by: rebuild on the next prepare().
+                index.changes_since_build = index.values_counted + 1
+            elif change.op == "insert":
+                index.add(change.columns.get(field))
+            elif change.op == "delete":
+                index.remove(change.columns.get(field))
+            elif field in change.columns:
+                index.add(change.columns[field])
+                index.changes_since_build += 1
+
+    def shutdown(self):
+        self.builder.shutdown(wait=False, cancel_futures=True)
+
+
+# Books of the duplicates report read per query.
+REPORT_CHUNK_SIZE = 500
+
+
+class DuplicatesViewModel:
+    """
+        The DuplicateIndex of the library, for the check run before a book
+        is added and for the report of every group of duplicates. Built on a
+        background thread when the Add window first opens and kept up to
+        date by change events; until it is ready check() asks the database
+        for the books of the same author instead.
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.index = None
+        self.builder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="duplicates")
+        self.building = None
+        self.last_error = None
+
+    @property
+    def pending(self):
+        return self.building is not None and not self.building.done()
+
+    def prepare(self):
+        if self.index is None and not self.pending:
+            self.building = self.builder.submit(self.run_build)
+
+    def run_build(self):
+        try:
+            with self.session_factory() as session:
+                self.index = DuplicateIndex.from_session(session)
+        except Exception as error:
+            self.last_error = error
+
+    def check(self, title: str, author: str, exclude_id: int=None):
+        """
+            The books that title and author would duplicate, most similar
+            first.
+        """
+        with self.session_factory() as session:
+            repo = Repo(session)
+
+            if self.index is not None:
+                ids = [id for id, _ in self.index.matches(title, author, exclude_id)]
+            else:
+                names = normalize_author(author)
+                rows = repo.get_title_rows_by_author_contain(max(names, key=len)) if names else []
+                same_author = DuplicateIndex.build(rows)
+                ids = [id for id, _ in same_author.matches(title, author, exclude_id)]
+
+            return [book for book in (repo.get_book_by_id(id) for id in ids) if book is not None]
+
+    def report(self):
+        """
+            [[book, ...], ...]: every group of duplicates, biggest first.
+        """
+        if self.pending:
+            self.building.result()
+
+        if self.index is None:
+            self.run_build()
+
+        if self.index is None:
+            raise self.last_error
+
+        clusters = self.index.clusters()
+        ids = [id for cluster in clusters for id in cluster]
+
+        books = {}
+        with self.session_factory() as session:
+            repo = Repo(session)
+
+            for start in range(0, len(ids), REPORT_CHUNK_SIZE):
+                books.update((book.id, book) for book in repo.get_books_by_ids(ids[start:start + REPORT_CHUNK_SIZE]))
+
+        return [[books[id] for id in ids if id in books] for ids in clusters]
+
+    def apply(self, change):
+        if self.index is None:
+            return
+
+        columns = change.columns
+
+        if change.op == "delete":
+            self.index.remove(change.id)
+            return
+
+        if change.refetch:
+            # Nothing to go by: built again on the next prepare().
+            self.index = None
+            return
+
+        if change.op == "update" and "title" not in columns and "author" not in columns:
+            return
+
+        row = self.index.row_by_id.get(change.id)
+        title = columns["title"] if "title" in columns else self.index.titles[row] if row is not None else None
+        author = columns["author"] if "author" in columns else " ".join(self.index.authors[row]) if row is not None else None
+
+        if title is None or author is None:
+            # Not enough to go by: built again on the next prepare().
+            self.index = None
+            return
+
+        self.index.add(change.id, title, author)
+
+    def compact(self):
+        """
+            Folds the books added since the build into the sorted tables.
+        """
+        if self.index is None or not self.index.delta_hashes:
+            return False
+
+        self.index.compact()
+
+        return True
+
+    def shutdown(self):
+        self.builder.shutdown(wait=False, cancel_futures=True)
+
+
+def format_estimate(estimate, decimals: int=0, grouping: bool=True):
+    """
+        "1,234", "≈ 1,234 ± 56" or "unknown", followed by the note of the
+        estimate if it has one.
+    """
+    if estimate is None or estimate.value is None:
+        return "unknown"
+
+    number = f"{"," if grouping else ""}.{decimals}f"
+
+    if isinstance(estimate.value, str):
+        text = estimate.value
+    elif estimate.margin == 0:
+        text = f"{estimate.value:{number}}"
+    elif estimate.margin is None:
+        text = f"≈ {estimate.value:{number}}"
+    else:
+        text = f"≈ {estimate.value:{number}} ± {estimate.margin:{number}}"
+
+    return f"{text} ({estimate.note})" if estimate.note else text
+
+
+class SimilarBooksViewModel:
+    """
+        The "Similar books" of the Details window from a SimilarityIndex,
+        built on a background thread when details are first shown and built
+        again once too many books changed. Change events that do not carry
+        every compared column only note the book; it is read again with the
+        next lookup.
+    """
+    COMPARED_COLUMNS = ("title", "author", "genre", "description")
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.index = None
+        self.changed_ids = set()
+        self.builder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="similar-books")
+        self.building = None
+        self.last_error = None
+
+    @property
+    def pending(self):
+        return self.building is not None and not self.building.done()
+
+    def prepare(self):
+        if self.pending:
+            return
+
+        if self.index is None or self.index.stale:
+            self.building = self.builder.submit(self.run_build)
+
+    def run_build(self):
+        try:
+            with self.session_factory() as session:
+                self.index = SimilarityIndex.from_session(session)
+        except Exception as error:
+            self.last_error = error
+
+    def refresh(self):
+        """
+            Builds the index again when it is stale, but not before it is
+            first needed.
+        """
+        if self.index is None or not self.index.stale:
+            return False
+
+        self.prepare()
+
+        return True
+
+    def similar(self, book):
+        """
+            The books most similar to book, most similar first, or None
+            while the index is being built.
+        """
+        if self.index is None:
+            return None
+
+        with self.session_factory() as session:
+            repo = Repo(session)
+
+            if self.changed_ids:
+                for changed in repo.get_books_by_ids(list(self.changed_ids)):
+                    self.index.add(changed.id, changed.title, changed.author, changed.genre, changed.description)
+
+                self.changed_ids.clear()
+
+            ids = [id for id, _ in self.index.similar(book.id)]
+            books = {found.id: found for found in repo.get_books_by_ids(ids)} if ids else {}
+
+        return [books[id] for id in ids if id in books]
+
+    def apply(self, change):
+        if self.index is None:
+            return
+
+        columns = change.columns
+
+        if change.op == "delete":
+            self.index.remove(change.id)
+            self.changed_ids.discard(change.id)
+        elif change.op == "insert" and not change.refetch:
+            self.index.add(change.id, *(columns.get(name) for name in self.COMPARED_COLUMNS))
+        elif change.refetch or any(name in columns for name in self.COMPARED_COLUMNS):
+            self.changed_ids.add(change.id)
+
+    def shutdown(self):
+        self.builder.shutdown(wait=False, cancel_futures=True)
+
+
+class StatisticsViewModel:
+    """
+        The figures of the Statistics window, from the column store when it
+        is enabled and from the StatisticsCache otherwise, both kept up to
+        date by change events.
+
+        In approximate mode they are estimated from a sample of the books
+        and from sketches of the authors and genres instead
+        (db/approximate_statistics.py). The sketches are built on a
+        background thread the first time they are needed and again once
+        too many changes have piled up; until then the figures based on
+        them read "estimating…".
+    """
+    def __init__(self, session_factory, column_store: bool=False, approximate: bool=False, sample_size: int=SAMPLE_SIZE):
+        self.session_factory = session_factory
+        self.cache = StatisticsCache()
+        self.column_store = None
+
+        self.approximate = approximate
+        self.sample_size = sample_size
+        self.sketches = None
+        self.sketch_builder = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sketches")
+        self.sketches_building = None
+        self.last_error = None
+
+        if column_store:
+            with self.session_factory() as session:
+                self.column_store = ColumnStore.load(session)
+
+    def apply(self, change):
+        self.cache.apply(change)
+
+        if self.sketches is not None:
+            self.sketches.apply(change)
+
+        if self.column_store is None:
+            return
+
+        if not self.column_store.apply(change):
+            with self.session_factory() as session:
+                self.column_store = ColumnStore.load(session)
+        elif self.column_store.dead_rows > self.column_store.size // 4:
+            self.column_store.compact()
+
+    @property
+    def sketches_ready(self):
+        return self.sketches is not None
+
+    @property
+    def sketches_pending(self):
+        return self.sketches_building is not None and not self.sketches_building.done()
+
+    def build_sketches(self):
+        if self.sketches_pending:
+            return
+
+        if self.sketches is None or self.sketches.stale:
+            self.sketches_building = self.sketch_builder.submit(self.run_sketch_build)
+
+    def run_sketch_build(self):
+        try:
+            with self.session_factory() as session:
+                self.sketches = LibrarySketches.build(session)
+        except Exception as error:
+            self.last_error = error
+
+    @property
+    def needs_maintenance(self):
+        return bool(self.cache.values is not None and self.cache.stale) or (self.sketches is not None and self.sketches.stale)
+
+    def maintain(self, token):
+        """
+            Re-runs the queries of the stale figures and rebuilds stale
+            sketches, so the next opening of the window has nothing to wait
+            for. Runs on the maintenance thread.
+        """
+        done = []
+
+        if self.cache.values is not None and self.cache.stale:
+            with self.session_factory() as session:
+                self.cache.refresh(Repo(session))
+
+            done.append("figures")
+
+        if not token.cancelled and self.sketches is not None and self.sketches.stale and not self.sketches_pending:
+            self.run_sketch_build()
+            done.append("sketches")
+
+        return ", ".join(done) or None
+
+    def compact(self):
+        """
+            Drops the dead rows of the column store; on the Tk thread, which
+            applies change events to it.
+        """
+        if self.column_store is None or not self.column_store.dead_rows:
+            return False
+
+        self.column_store.compact()
+
+        return True
+
+    def statistics(self):
+        if self.column_store is not None:
+            return self.column_store.statistics()
+
+        with self.session_factory() as session:
+            return self.cache.refresh(Repo(session))
+
+    def summary(self):
+        """
+            The lines of the Statistics window and the read fraction shown by
+            its progress bar (after the second line).
+        """
+        if self.approximate:
+            return self.approximate_summary()
+
+        statistics = self.statistics()
+        total_books_count = statistics["total_books_count"]
+        read_count, unread_count = statistics["read_count"], statistics["unread_count"]
+
+        read_percentage = (read_count / total_books_count) * 100 if total_books_count else 0
+        unread_percentage = (unread_count / total_books_count) * 100 if total_books_count else 0
+
+        lines = [
+            f"📘Total number of books:\n{total_books_count}",
+            f"📈Count of read/unread books:\n"
+            f"{read_count} ({read_percentage:.0f}%) / {unread_count} ({unread_percentage:.0f}%)",
+            f"📚Most common genre:\n{statistics["most_common_genre"]}",
+            f"📕Oldest book:\n{statistics["oldest_book"]}",
+            f"📖Newest book:\n{statistics["newest_book"]}",
+            f"📅Average publication year:\n{statistics["average_publication_year"]:.0f}",
+            f"🧮Books added in the past month:\n{statistics["books_added_in_the_past_month"]}",
+        ]
+
+        return lines, read_percentage / 100
+
+    def approximate_summary(self):
+        self.build_sketches()
+
+        with self.session_factory() as session:
+            estimates = approximate_statistics(Repo(session), self.sketches, self.sample_size)
+
+        total = estimates["total_books_count"]
+        read, unread = estimates["read_count"], estimates["unread_count"]
+        read_fraction = read.value / total.value if total.value else 0
+
+        def from_sketches(name):
+            return format_estimate(estimates[name]) if self.sketches is not None else "estimating…"
+
+        lines = [
+            f"📘Total number of books:\n{format_estimate(total)}",
+            f"📈Count of read/unread books:\n"
+            f"{format_estimate(read)} ({read_fraction * 100:.0f}%) / {format_estimate(unread)} ({(1 - read_fraction) * 100:.0f}%)"
+            if total.value else "📈Count of read/unread books:\n0 / 0",
+            f"📚Most common genre:\n{from_sketches("most_common_genre")}",
+            f"✍️Most common author:\n{from_sketches("most_common_author")}",
+            f"🔢Distinct authors / genres:\n{from_sketches("distinct_authors")} / {from_sketches("distinct_genres")}",
+            f"📕Oldest book:\n{format_estimate(estimates["oldest_book"])}",
+            f"📖Newest book:\n{format_estimate(estimates["newest_book"])}",
+            f"📅Average publication year:\n{format_estimate(estimates["average_publication_year"], 1, grouping=False)}",
+            f"🧮Books added in the past month:\n{format_estimate(estimates["books_added_in_the_past_month"])}",
+        ]
+
+        return lines, read_fraction
+
+    def shutdown(self):
+        self.sketch_builder.shutdown(wait=False, cancel_futures=True)
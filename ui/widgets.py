@@ -0,0 +1,81 @@
+import customtkinter as ctk
+
+
+def make_empty_entries(window):
+    for widget in window.winfo_children():
+        if isinstance(widget, ctk.CTkEntry):
+            widget.delete(0, len(widget.get()))
+
+
+def get_all_entries(window: ctk.CTkToplevel):
+    entries = []
+
+    for widget in window.winfo_children():
+        if isinstance(widget, ctk.CTkEntry):
+            entries.append(widget)
+
+    return entries
+
+
+def add_header_label(master, row, text_of_label, font_size, columnspan, upper_pady, lower_pady):
+    label = ctk.CTkLabel(
+        master,
+        text=text_of_label,
+        font=("Segoe UI", font_size, "bold")
+    )
+    label.grid(
+        row=row,
+        column=0,
+        columnspan=columnspan,
+        sticky="n",
+        pady=(upper_pady, lower_pady))
+
+    return label
+
+
+def add_entry_and_entry(master, row, text_of_label, width, placeholder=None):
+    label = ctk.CTkLabel(
+        master,
+        text=text_of_label
+    )
+    label.grid(
+        column=0,
+        row=row,
+        pady=10,
+        padx=10,
+        sticky="e"
+    )
+
+    entry = ctk.CTkEntry(
+        master,
+        width=width,
+        placeholder_text=placeholder or "",
+        justify="center"
+    )
+    entry.grid(
+        row=row,
+        column=1,
+        sticky="w"
+    )
+
+    return entry
+
+
+def bind_arrow_keys_to_entry(window: ctk.CTkToplevel):
+    entries = get_all_entries(window)
+
+    for i, entry in enumerate(entries):
+        if i > 0:
+            entry.bind("<Up>", move_on_previous_entry)
+        if i < len(entries) - 1:
+            entry.bind("<Down>", move_on_next_entry)
+
+
+def move_on_next_entry(event):
+    event.widget.tk_focusNext().focus()
+    return "break"
+
+
+def move_on_previous_entry(event=None):
+    event.widget.tk_focusPrev().focus()
+    return "break"